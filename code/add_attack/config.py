@@ -18,10 +18,37 @@ TRAIN_FILE_PATH = "../../dataset/{}_all/{}_all.txt"
 VALID_FILE_PATH = "../../dataset/{}_all/valid_all.txt"
 TEST_FILE_PATH = "../../dataset/{}_all/test_all.txt"
 ORIGINAL_TRAIN_PATH = '../../dataset/{}/train.txt'
+ENTITIES_DICT_PATH = '../../dataset/{}/entities.dict'
+RELATIONS_DICT_PATH = '../../dataset/{}/relations.dict'
 
 # Paths for output files
 OUTPUT_TP_FILE_PATH = "../../data_processed/{}_add_10/{}_negative_tp_not_in_dataset.txt"
 OUTPUT_SEL_TP_FILE_PATH = '../../data_processed/{}_add_10/{}_negative_tp_not_in_dataset_sel_10.txt'
 OUTPUT_TRAIN_FILE_PATH = '../../data_processed/{}_add_10/train.txt'
 
+# Outputs of --budgets, per budget in percent of the training triples
+BUDGET_SEL_TP_FILE_PATH = '../../data_processed/{}_add_{}/{}_negative_tp_not_in_dataset_sel_{}.txt'
+BUDGET_TRAIN_FILE_PATH = '../../data_processed/{}_add_{}/train.txt'
+
+# Snapshot of the parsed triple store, rebuilt when the input files change
+STORE_CACHE_PATH = '../../data_processed/{}_add_10/{}_store_cache'
+
+# Per-rule groundings kept by --incremental, keyed by rule hash and relation digests
+GROUNDING_CACHE_PATH = '../../data_processed/{}_add_10/{}_groundings'
+
+# Rules mined by `python -m attack mine`, in the layout of the rule files above
+MINED_HIGH_CONF_RULES_PATH = '../../data_processed/{}_mined/{}_high_conf_rules.json'
+MINED_LOW_CONF_RULES_PATH = '../../data_processed/{}_mined/{}_low_conf_rules.json'
+MINED_REPORT_PATH = '../../data_processed/{}_mined/{}_mine_report.json'
+
+# Splits evaluated by `python -m attack evaluate`, and filtered with the training set
+EVAL_VALID_PATH = '../../dataset/{}/valid.txt'
+EVAL_TEST_PATH = '../../dataset/{}/test.txt'
+
+# Timings, counters and peak memory of each script run
+RUN_REPORT_PATH = '../../data_processed/{}_add_10/{}_{}_report.json'
+
+# Stages run by `python -m attack run`, used to skip the unchanged ones
+PIPELINE_MANIFEST_PATH = '../../data_processed/{}_add_10/{}_pipeline_manifest.json'
+
 SORT_LIMIT = 27212  # Number of top triples to sort and exclude (10% deletions)     wn18rr:8684 / fb15k237:27212
\ No newline at end of file
@@ -1,18 +1,23 @@
 import json
-import copy
-import csv
+import os
+import sys
 import argparse
+import time
+import numpy as np
 from config import (  # Import all the paths from config.py
     RELATION_MATRIX_PATH,
     RELATION_TO_NUMBER_PATH,
-    TOP1_RELATIONS_DICT_PATH,
     LOW_CONF_RULES_PATH,
     INDICES_PATH,
     HIGH_CONF_RULES_PATH,
     OUTPUT_TOP1_RELATIONS_DICT_PATH,
     OUTPUT_NEGATIVE_RULES_PATH,
+    RUN_REPORT_PATH,
 )
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from attack.instrument import count, stage, write_report
+
 
 def load_relation_matrix(file_path):
     """
@@ -22,17 +27,12 @@ def load_relation_matrix(file_path):
         file_path (str): Path to the relation matrix file.
 
     Returns:
-        list: The processed relation matrix.
+        np.ndarray: The processed relation matrix.
     """
-    relation_matrix = []
-    with open(file_path, "r") as csv_file:
-        csv_reader = csv.reader(csv_file)
-        for row in csv_reader:
-            relation_matrix.append([float(x) for x in row])
+    relation_matrix = np.loadtxt(file_path, delimiter=",", dtype=np.float64, ndmin=2)
 
     # Remove diagonal elements
-    for i in range(len(relation_matrix)):
-        relation_matrix[i][i] = 0.0  # Set diagonal elements to 0
+    np.fill_diagonal(relation_matrix, 0.0)  # Set diagonal elements to 0
 
     return relation_matrix
 
@@ -54,12 +54,49 @@ def load_relation_mappings(file_path):
     return relation_to_number, number_to_relation
 
 
+def top_n_indices(relation_matrix, top_n, block_size=1024):
+    """
+    Find the column indices of the N highest scores in every row.
+
+    Rows are processed in blocks with a batched partial selection. Ties are
+    broken by column, lower indices first, as a stable descending sort would.
+
+    Args:
+        relation_matrix (np.ndarray): The relation matrix.
+        top_n (int): The number of top columns to select per row.
+        block_size (int): Number of rows processed at once.
+
+    Returns:
+        np.ndarray: (rows, top_n) array of column indices, highest score first.
+    """
+    num_rows, num_cols = relation_matrix.shape
+    top_n = min(top_n, num_cols)
+    top_indices = np.empty((num_rows, top_n), dtype=np.int64)
+    if top_n == 0:
+        return top_indices
+
+    for start in range(0, num_rows, block_size):
+        block = -relation_matrix[start:start + block_size]
+        # N-th smallest negated score per row: everything below it is selected,
+        # and ties at it are filled in column order
+        threshold = np.partition(block, top_n - 1, axis=1)[:, top_n - 1:top_n]
+        below = block < threshold
+        needed = top_n - below.sum(axis=1, keepdims=True)
+        tied = block == threshold
+        selected = below | (tied & (np.cumsum(tied, axis=1) <= needed))
+
+        columns = np.nonzero(selected)[1].reshape(len(block), top_n)
+        order = np.argsort(np.take_along_axis(block, columns, axis=1), axis=1, kind="stable")
+        top_indices[start:start + len(block)] = np.take_along_axis(columns, order, axis=1)
+    return top_indices
+
+
 def generate_top_relations(relation_matrix, number_to_relation, top_n=1):
     """
     Generate the top N related relations for each relation.
 
     Args:
-        relation_matrix (list): The relation matrix.
+        relation_matrix (np.ndarray): The relation matrix.
         number_to_relation (dict): Mapping from relation IDs to names.
         top_n (int): The number of top relations to select.
 
@@ -67,9 +104,8 @@ def generate_top_relations(relation_matrix, number_to_relation, top_n=1):
         dict: A dictionary of top N related relations for each relation.
     """
     top_relations_dict = {}
-    for i, row in enumerate(relation_matrix):
-        top_indices = sorted(range(len(row)), key=lambda x: -row[x])[:top_n]
-        top_relations = [number_to_relation[idx + 1] for idx in top_indices]
+    for i, top_indices in enumerate(top_n_indices(relation_matrix, top_n)):
+        top_relations = [number_to_relation[idx + 1] for idx in top_indices.tolist()]
         top_relations_dict[number_to_relation[i + 1]] = top_relations
     return top_relations_dict
 
@@ -109,10 +145,27 @@ def load_txt(file_path):
             output.append(line.strip())
         return output
 
+def rule_key(rule):
+    """
+    Build a hashable key of a rule that is equal for two rules exactly when the rules are.
+
+    Args:
+        rule (dict): A rule with "Rule Head" and "Rule Body" lists, a "conf" value and
+            any other fields.
+
+    Returns:
+        frozenset: The rule's (field, value) items, lists turned into tuples.
+    """
+    return frozenset((field, tuple(value) if isinstance(value, list) else value) for field, value in rule.items())
+
+
 def generate_new_rules(json_data, indices, top_relations_dict):
     """
     Generate new rules by replacing relations using top N related relations.
 
+    New rules are shallow copies with a fresh "Rule Body" list; their other
+    values are shared with the original rule and must not be modified in place.
+
     Args:
         json_data (list): The original rules data.
         indices (list): The list of indices to replace.
@@ -133,8 +186,8 @@ def generate_new_rules(json_data, indices, top_relations_dict):
         if selected_relation in top_relations_dict:
             top_replacements = top_relations_dict[selected_relation]
             for replacement in top_replacements:
-                new_rule = copy.deepcopy(rule)
-                new_rule["Rule Body"][index] = replacement
+                new_rule = dict(rule)
+                new_rule["Rule Body"] = rule_body[:index] + [replacement] + rule_body[index + 1:]
                 new_rules.append(new_rule)
 
     return new_rules
@@ -144,6 +197,9 @@ def filter_existing_rules(new_rules, existing_data):
     """
     Filter out rules that already exist in the existing dataset.
 
+    Rules are compared with set lookups on all of their fields, so a rule is only
+    dropped if an existing rule is equal to it, as with a list lookup.
+
     Args:
         new_rules (list): The list of newly generated rules.
         existing_data (list): The list of existing rules.
@@ -151,39 +207,54 @@ def filter_existing_rules(new_rules, existing_data):
     Returns:
         list: A list of filtered rules that are not in the existing dataset.
     """
-    return [rule for rule in new_rules if rule not in existing_data]
+    existing_keys = {rule_key(rule) for rule in existing_data}
+    return [rule for rule in new_rules if rule_key(rule) not in existing_keys]
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR','FB15k237'])
+    parser.add_argument("--top-n", type=int, default=1, help="Number of most similar relations each relation is replaced with.")
 
     args = parser.parse_args()
+    start_time = time.perf_counter()
     # Load the relation matrix
-    relation_matrix = load_relation_matrix(RELATION_MATRIX_PATH.format(args.dataset, args.dataset))
+    with stage("parse"):
+        relation_matrix = load_relation_matrix(RELATION_MATRIX_PATH.format(args.dataset, args.dataset))
 
-    # Load the relation mappings
-    relation_to_number, number_to_relation = load_relation_mappings(RELATION_TO_NUMBER_PATH.format(args.dataset, args.dataset))
+        # Load the relation mappings
+        relation_to_number, number_to_relation = load_relation_mappings(RELATION_TO_NUMBER_PATH.format(args.dataset, args.dataset))
 
     # Generate the top1 related relations dictionary
-    top_relations_dict = generate_top_relations(relation_matrix, number_to_relation, top_n=1)
-    save_json(top_relations_dict, OUTPUT_TOP1_RELATIONS_DICT_PATH.format(args.dataset, args.dataset))
+    with stage("top relations"):
+        top_relations_dict = generate_top_relations(relation_matrix, number_to_relation, top_n=args.top_n)
+    with stage("write"):
+        save_json(top_relations_dict, OUTPUT_TOP1_RELATIONS_DICT_PATH.format(args.dataset, args.dataset))
 
     # Load data
-    top_relations_dict = load_json(TOP1_RELATIONS_DICT_PATH.format(args.dataset, args.dataset))
-    json_data = load_json(LOW_CONF_RULES_PATH.format(args.dataset, args.dataset))
-    indices = load_txt(INDICES_PATH.format(args.dataset, args.dataset))
+    with stage("parse"):
+        json_data = load_json(LOW_CONF_RULES_PATH.format(args.dataset, args.dataset))
+        indices = load_txt(INDICES_PATH.format(args.dataset, args.dataset))
+    count("low confidence rules", len(json_data))
 
     # Generate new rules
-    new_rules = generate_new_rules(json_data, indices, top_relations_dict)
+    with stage("generate"):
+        new_rules = generate_new_rules(json_data, indices, top_relations_dict)
+    count("generated rules", len(new_rules))
 
     # Load existing rules
-    existing_data = load_json(HIGH_CONF_RULES_PATH.format(args.dataset, args.dataset))
+    with stage("parse"):
+        existing_data = load_json(HIGH_CONF_RULES_PATH.format(args.dataset, args.dataset))
 
     # Filter out existing rules
-    filtered_rules = filter_existing_rules(new_rules, existing_data)
+    with stage("filter"):
+        filtered_rules = filter_existing_rules(new_rules, existing_data)
+    count("negative rules", len(filtered_rules))
     # Save the final rules
-    save_json(filtered_rules, OUTPUT_NEGATIVE_RULES_PATH.format(args.dataset, args.dataset))
+    with stage("write"):
+        save_json(filtered_rules, OUTPUT_NEGATIVE_RULES_PATH.format(args.dataset, args.dataset))
+
+    write_report(RUN_REPORT_PATH.format(args.dataset, args.dataset, "generate_neg_rules"), "generate_neg_rules", args, start_time)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 import json
-import random
+import os
+import sys
 import argparse
+import time
+from functools import partial
+import numpy as np
 from config import (
+    ENTITIES_DICT_PATH,
+    RELATIONS_DICT_PATH,
     TRAIN_FILE_PATH,
     VALID_FILE_PATH,
     TEST_FILE_PATH,
@@ -10,198 +16,357 @@ from config import (
     SORT_LIMIT,
     OUTPUT_SEL_TP_FILE_PATH,
     ORIGINAL_TRAIN_PATH,
-    OUTPUT_TRAIN_FILE_PATH
+    OUTPUT_TRAIN_FILE_PATH,
+    STORE_CACHE_PATH,
+    GROUNDING_CACHE_PATH,
+    RUN_REPORT_PATH,
+    BUDGET_SEL_TP_FILE_PATH,
+    BUDGET_TRAIN_FILE_PATH
 )
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from attack.budget import budget_label, budget_size, count_lines
+from attack.cache import load_cached_store
+from attack.columnar import CANDIDATE_COLUMNS, ColumnarWriter, columnar_path, write_triple_lines
+from attack.incremental import GroundingCache, grounding_params, rule_key
+from attack.instrument import Progress, RuleLog, call_timed, count, counter, merge, stage, staged, write_report
+from attack.parallel import map_rules
+from attack.plan import FanoutCap, JoinPlan, SubpathCache
+from attack.stream import KeySet, Reservoir, deduplicate
+from attack.triple_store import canonical_relations
 
-def generate_predicate_dict(file_path):
+
+def load_triple_store(dataset, use_cache=True):
     """
-    Generate a dictionary for predicates with their head and tail entities.
+    Load the training, validation and test triples into an integer-encoded store.
 
     Args:
-        file_path (str): Path to the triples file.
+        dataset (str): Name of the dataset.
+        use_cache (bool): Whether to load from and refresh the on-disk store snapshot.
 
     Returns:
-        dict: A dictionary where keys are predicates and values are lists of [head, tail] pairs.
+        TripleStore: Store with "train", "valid" and "test" splits.
     """
-    predicate_dict = {}
-    with open(file_path, 'r') as file:
-        triples = file.readlines()
-
-    for triple in triples:
-        subject, predicate, obj = triple.strip().split('\t')
-
-        if predicate in predicate_dict:
-            predicate_dict[predicate].append([subject, obj])
-        else:
-            predicate_dict[predicate] = [[subject, obj]]
+    split_paths = {
+        "train": TRAIN_FILE_PATH.format(dataset, dataset),
+        "valid": VALID_FILE_PATH.format(dataset),
+        "test": TEST_FILE_PATH.format(dataset),
+    }
+    cache_dir = STORE_CACHE_PATH.format(dataset, dataset) if use_cache else None
+    return load_cached_store(cache_dir, split_paths, ENTITIES_DICT_PATH.format(dataset),
+                             RELATIONS_DICT_PATH.format(dataset))
 
-    return predicate_dict
 
-
-def generate_head_tail_dicts(predicate_dict):
+def ground_rule(example, store, max_groundings=None, subpath_cache=None, fanout_cap=None):
     """
-    Generate dictionaries storing head and tail entities for each predicate.
+    Generate the candidate triples of a single rule.
 
     Args:
-        predicate_dict (dict): A dictionary where keys are predicates and values are lists of [head, tail] pairs.
+        example (dict): Rule loaded from the JSON file.
+        store (TripleStore): Store with the training split the rule is grounded in,
+            and the splits candidates are filtered against.
+        max_groundings (int, optional): Stop grounding the rule body after this many groundings.
+        subpath_cache (SubpathCache, optional): Cache of sub-path groundings shared across rules.
+        fanout_cap (FanoutCap, optional): Limit on the groundings through one join entity.
 
     Returns:
-        tuple: Two dictionaries - one for head entities and one for tail entities.
+        np.ndarray: (n, 3) array of encoded candidate triples, "inv_r" heads written as
+            forward "r" triples with head and tail swapped.
     """
-    head_dict = {}
-    tail_dict = {}
-
-    for predicate, entities in predicate_dict.items():
-        head_entities = []
-        tail_entities = []
-        for entity_pair in entities:
-            if len(entity_pair) == 2:
-                head_entities.append(entity_pair[0])
-                tail_entities.append(entity_pair[1])
-
-        head_dict[predicate] = head_entities
-        tail_dict[predicate] = tail_entities
-
-    return head_dict, tail_dict
-
-
-def generate_triples(rules, predicate_dict, head_dict, tail_dict, predicate_dict_val, predicate_dict_test):
+    rule_body = example.get("Rule Body", [])
+    rule_head, inverse = store.resolve(example.get("Rule Head", [])[0])
+
+    # Case where the rule body has only one predicate
+    if len(rule_body) == 1:
+        with stage("ground"):
+            head_entities, tail1 = store.pairs("train", rule_body[0])
+            blocks = [np.stack([tail1, head_entities], axis=1)[:max_groundings]]
+
+    # Case where the rule body is a path of two or more predicates, streamed one block at a time
+    else:
+        plan = JoinPlan(store, rule_body, mode="endpoints", cache=subpath_cache, fanout_cap=fanout_cap)
+        blocks = plan.execute(max_groundings=max_groundings)
+
+    candidates = [np.empty((0, 3), dtype=np.int32)]
+    for pairs in staged("ground", blocks):
+        with stage("filter"):
+            if inverse:
+                pairs = pairs[:, ::-1]
+            # Keep candidates that are in none of the train, valid and test splits
+            keep = ~store.contains(pairs[:, 0], rule_head, pairs[:, 1])
+            block = np.empty((int(keep.sum()), 3), dtype=np.int32)
+            block[:, 0] = pairs[keep, 0]
+            block[:, 1] = rule_head
+            block[:, 2] = pairs[keep, 1]
+            candidates.append(block)
+            count("groundings", len(pairs))
+    candidates = np.concatenate(candidates)
+    count("candidates", len(candidates))
+    return candidates
+
+
+def generate_triples(rules, store, workers=1, max_groundings=None, subpath_cache=None, rule_log=None,
+                      fanout_cap=None, grounding_cache=None):
     """
-    Generate triples based on the rules and predicate dictionaries.
+    Generate triples based on the rules and the triple store.
 
     Args:
         rules (list): List of rules loaded from the JSON file.
-        predicate_dict (dict): Predicate dictionary for training data.
-        head_dict (dict): Dictionary of head entities for each predicate.
-        tail_dict (dict): Dictionary of tail entities for each predicate.
-        predicate_dict_val (dict): Predicate dictionary for validation data.
-        predicate_dict_test (dict): Predicate dictionary for test data.
-
-    Returns:
-        list: List of generated triples.
+        store (TripleStore): Store with the training split the rules are grounded in,
+            and the splits candidates are filtered against.
+        workers (int): Number of worker processes the rules are spread across.
+        max_groundings (int, optional): Cap on the groundings of each rule body.
+        subpath_cache (SubpathCache, optional): Cache of sub-path groundings; every worker
+            process keeps its own copy.
+        rule_log (RuleLog, optional): Log the grounding time and candidates of every rule is written to.
+        fanout_cap (FanoutCap, optional): Limit on the groundings through one join entity.
+        grounding_cache (GroundingCache, optional): Candidates of previous runs; only rules
+            missing from it, or reading changed relations, are grounded again.
+
+    Yields:
+        np.ndarray: (n, 3) array of encoded candidate triples for each rule, in rule order.
     """
-    tp = []
-    rule_counter = 0
-
+    # Register rule heads and their forward relations up front, so that workers
+    # share the same relation IDs and packed keys stay valid
     for example in rules:
-        rule_counter += 1
-        print("Processing rule:", rule_counter, "/", len(rules))
-        rule_body = example.get("Rule Body", [])
-        rule_head = example.get("Rule Head", [])[0]
-
-        # Case where the rule body has only one predicate
-        if len(rule_body) == 1:
-            for j in range(len(head_dict[rule_body[0]])):
-                head_entity = head_dict[rule_body[0]][j]
-                tail1 = tail_dict[rule_body[0]][j]
-                head_triple = f"{tail1}\t{rule_head}\t{head_entity}"
-
-                if [tail1, head_entity] not in predicate_dict.get(rule_head, []):
-                    if (rule_head not in predicate_dict_val or [tail1, head_entity] not in predicate_dict_val.get(rule_head, [])):
-                        if (rule_head not in predicate_dict_test or [tail1, head_entity] not in predicate_dict_test.get(rule_head, [])):
-                            tp.append(head_triple)
-
-        # Case where the rule body has two predicates
-        if len(rule_body) == 2:
-            for j in range(len(tail_dict[rule_body[0]])):
-                tail1 = tail_dict[rule_body[0]][j]
-                for k in range(len(head_dict[rule_body[1]])):
-                    head_entity = head_dict[rule_body[1]][k]
-                    if tail1 == head_entity:
-                        head1 = head_dict[rule_body[0]][j]
-                        tail_entity = tail_dict[rule_body[1]][k]
-                        head_triple = f"{head1}\t{rule_head}\t{tail_entity}"
-
-                        if [head1, tail_entity] not in predicate_dict.get(rule_head, []):
-                            if (rule_head not in predicate_dict_val or [head1, tail_entity] not in predicate_dict_val.get(rule_head, [])):
-                                if (rule_head not in predicate_dict_test or [head1, tail_entity] not in predicate_dict_test.get(rule_head, [])):
-                                    tp.append(head_triple)
-
-    return tp
-
-
-def process_triples(tp):
+        store.relations.add(example.get("Rule Head", [])[0])
+    canonical_relations(store.relations)
+
+    function = partial(call_timed, partial(ground_rule, max_groundings=max_groundings, subpath_cache=subpath_cache,
+                                           fanout_cap=fanout_cap))
+    params = grounding_params(max_groundings, fanout_cap)
+    keys = [rule_key(example, params) for example in rules]
+    reused = [grounding_cache is not None and key in grounding_cache for key in keys]
+    results = map_rules(function, [example for example, hit in zip(rules, reused) if not hit], store, workers)
+    progress = Progress(len(rules), "Processing rules")
+
+    for index, example in enumerate(rules):
+        if reused[index]:
+            # Stored as (head, tail) pairs, since the head relation's ID may differ between runs
+            pairs = grounding_cache.load(keys[index])
+            candidates = np.empty((len(pairs), 3), dtype=np.int32)
+            candidates[:, 0] = pairs[:, 0]
+            candidates[:, 1] = store.resolve(example.get("Rule Head", [])[0])[0]
+            candidates[:, 2] = pairs[:, 1]
+        else:
+            candidates, seconds, stages, counters = next(results)
+            merge(stages, counters)
+            if grounding_cache is not None:
+                grounding_cache.put(keys[index], example, candidates[:, [0, 2]])
+            if rule_log is not None:
+                rule_log.write(index, example, seconds, candidates=len(candidates),
+                               fanout_dropped=counters.get("fan-out dropped groundings", 0))
+        progress.update()
+        yield candidates
+    progress.close()
+
+
+def process_triples(tp, rules, store, key_set):
     """
-    Post-process triples to handle inverted relations and remove duplicates.
+    Post-process triples to remove duplicates.
 
     Args:
-        tp (list): List of generated triples.
+        tp (iterable): Arrays of encoded candidate triples of every rule, in rule order.
+        rules (list): The rules the candidates were generated from.
+        store (TripleStore): Store whose vocabularies encode the triples.
+        key_set (KeySet): Set of the triples emitted so far.
+
+    Yields:
+        tuple: Packed keys of the unique, processed triples not emitted before, and the
+            position in the rule file and the confidence of the rule that produced them.
+    """
+    for rule_id, (candidates, example) in enumerate(zip(tp, rules)):
+        with stage("dedup"):
+            # Candidates are already forward triples, see ground_rule
+            keys = store.pack(candidates)
+            new_keys = list(deduplicate([keys], key_set))
+        for keys in new_keys:
+            yield keys, rule_id, float(example.get("conf", 0))
 
-    Returns:
-        list: List of unique, processed triples.
+
+def save_triples(triples, store, output_file_path, original_train, budgets, seed=None, columnar_format=None):
     """
-    new_tp = []
-
-    for line in tp:
-        parts = line.strip().split("\t")
-        subject = parts[0]
-        relation = parts[1]
-        obj = parts[2]
-
-        if relation.startswith("inv_"):
-            # Remove "inv_" and swap subject and object
-            relation = relation[4:]
-            new_line = f"{obj}\t{relation}\t{subject}"
-            new_tp.append(new_line)
-        else:
-            new_tp.append(line)
+    Save triples to a file and add a uniform sample of them to the training set, once per budget.
 
-    # Remove duplicates
-    unique_lines = set(new_tp)
-    return list(unique_lines)
+    The samples are nested: every budget's sample extends the samples of the
+    smaller budgets, so a single pass over the candidates serves all of them.
 
+    Args:
+        triples (iterable): (packed keys, rule ID, confidence) of the triples to save, see process_triples.
+        store (TripleStore): Store whose vocabularies encode the triples.
+        output_file_path (str or None): Path to the output file, None to not save the candidates.
+        original_train (str): Path to the original training file.
+        budgets (list): (sample size, path of the sampled triples, path of the poisoned
+            training file) for every budget, e.g. [(SORT_LIMIT, sel_path, train_path)].
+        seed (int, optional): Seed of the sample.
+        columnar_format (str, optional): "arrow" or "parquet" to also write every output as a
+            columnar file next to the text one. The candidates and the sampled triples carry
+            the ID and confidence of their rule (see attack.columnar.CANDIDATE_COLUMNS).
 
-def save_triples(triples, output_file_path, sel_output_file_path, original_train, final_train_path):
+    Returns:
+        int: Number of saved triples.
+    """
+    sample_size = max(size for size, _, _ in budgets)
+
+    # Sample while streaming, so the candidates are never all in memory
+    reservoir = Reservoir(sample_size, seed)
+    writer = None
+    confs = {}
+    with open(output_file_path or os.devnull, 'w') as f2:
+        for keys, rule_id, conf in triples:
+            confs[rule_id] = conf
+            if output_file_path is not None:
+                with stage("write"):
+                    for line in store.decode(store.unpack(keys)):
+                        f2.write(line + '\n')
+                    if columnar_format is not None:
+                        # Opened at the first chunk, once the rule heads are in the relation vocabulary
+                        if writer is None:
+                            writer = ColumnarWriter(columnar_path(output_file_path, columnar_format),
+                                                    CANDIDATE_COLUMNS, store, columnar_format)
+                        candidates = store.unpack(keys)
+                        writer.write(head=candidates[:, 0], relation=candidates[:, 1], tail=candidates[:, 2],
+                                     rule=np.full(len(keys), rule_id), conf=np.full(len(keys), conf))
+            with stage("sample"):
+                reservoir.add(keys, np.full(len(keys), rule_id))
+    if writer is not None:
+        writer.close()
+    count("unique triples", reservoir.seen)
+    if reservoir.seen < sample_size:
+        raise ValueError(f"Only {reservoir.seen} candidate triples, fewer than the {sample_size} to sample")
+
+    # Ordered by priority, so the first k sampled triples are a uniform sample of size k
+    with stage("sample"):
+        sampled_keys, sampled_rules = reservoir.sample(with_values=True)
+        sampled_triples = store.unpack(sampled_keys)
+        sampled = store.decode(sampled_triples)
+
+    with stage("write"):
+        with open(original_train, 'r') as f3:
+            original_lines = [line.strip() for line in f3]
+
+        for size, sel_output_file_path, final_train_path in budgets:
+            sel_tp = sampled[:size]
+            for path in (sel_output_file_path, final_train_path):
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(sel_output_file_path, 'w') as f2:
+                for line in sel_tp:
+                    f2.write(line + '\n')
+
+            # Keep the original training triples in file order and append the sampled ones
+            final_train = dict.fromkeys(original_lines)
+            for line in sel_tp:
+                final_train[line] = None
+            with open(final_train_path, 'w') as f4:
+                for line in final_train:
+                    f4.write(line + '\n')
+            if columnar_format is not None:
+                with ColumnarWriter(columnar_path(sel_output_file_path, columnar_format), CANDIDATE_COLUMNS, store,
+                                    columnar_format) as sel_writer:
+                    sel_writer.write(head=sampled_triples[:size, 0], relation=sampled_triples[:size, 1],
+                                     tail=sampled_triples[:size, 2], rule=sampled_rules[:size],
+                                     conf=np.array([confs[rule_id] for rule_id in sampled_rules[:size]]))
+                write_triple_lines(columnar_path(final_train_path, columnar_format), store, list(final_train),
+                                   columnar_format)
+    return reservoir.seen
+
+
+def attack_budgets(dataset, percents=None, num_train=None):
     """
-    Save triples to a file.
+    List the sample sizes and output paths of the attack budgets.
 
     Args:
-        triples (list): List of triples to save.
-        output_file_path (str): Path to the output file.
+        dataset (str): Name of the dataset.
+        percents (list, optional): Budgets as percentages of the training triples; SORT_LIMIT
+            triples written to the default outputs if omitted.
+        num_train (int, optional): Number of training triples, required with percents.
+
+    Returns:
+        list: (sample size, path of the sampled triples, path of the poisoned training file) per budget.
     """
-    with open(output_file_path, 'w') as f2:
-        for line in triples:
-            f2.write(line + '\n')
-    sel_tp = random.sample(triples, SORT_LIMIT)
-    with open(sel_output_file_path, 'w') as f2:
-        for line in sel_tp:
-            f2.write(line + '\n')
-    final_train =set()
-    with open(original_train, 'r') as f3:
-        for line in f3:
-            final_train.add(line.strip())
-    final_train = final_train.union(set(sel_tp))
-    with open(final_train_path, 'w') as f4:
-        for line in final_train:
-            f4.write(line + '\n')
+    if not percents:
+        return [(SORT_LIMIT, OUTPUT_SEL_TP_FILE_PATH.format(dataset, dataset), OUTPUT_TRAIN_FILE_PATH.format(dataset))]
+    budgets = []
+    for percent in sorted(set(percents)):
+        label = budget_label(percent)
+        budgets.append((budget_size(percent, num_train), BUDGET_SEL_TP_FILE_PATH.format(dataset, label, dataset, label),
+                        BUDGET_TRAIN_FILE_PATH.format(dataset, label)))
+    return budgets
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    parser.add_argument("--no-cache", action="store_true", help="Parse the dataset files instead of using the store snapshot.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to ground rules with.")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="MB of deduplication keys to keep in memory before spilling them to disk.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the sampled adversarial triples.")
+    parser.add_argument("--max-groundings", type=int, default=None,
+                        help="Keep only the first groundings of each rule body, in sorted order; disables the sub-path cache.")
+    parser.add_argument("--subpath-cache-size", type=int, default=256,
+                        help="Memory in MB for groundings shared by rules with common body relations, 0 to disable.")
+    parser.add_argument("--rule-log", type=str, default=None,
+                        help="Path of a JSON-lines log with the grounding time and candidates of every rule.")
+    parser.add_argument("--max-fanout", type=int, default=None,
+                        help="Cap the groundings through a single join entity, e.g. a hub in a two-hop body.")
+    parser.add_argument("--fanout-strategy", type=str, default="sample", choices=['sample', 'drop'],
+                        help="Sample the groundings through capped entities, or drop them.")
+    parser.add_argument("--columnar-format", type=str, default=None, choices=['arrow', 'parquet'],
+                        help="Also write the candidates, sampled triples and poisoned training sets in this "
+                             "columnar format; requires pyarrow.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the candidates of rules whose body and head relations are unchanged since the last run.")
+    parser.add_argument("--budgets", type=float, nargs="+", default=None,
+                        help="Budgets in percent of the training triples, e.g. 5 10 20, each written to "
+                             "data_processed/<dataset>_add_<budget>; defaults to SORT_LIMIT triples.")
 
     args = parser.parse_args()
-    # Generate predicate dictionaries
-    predicate_dict = generate_predicate_dict(TRAIN_FILE_PATH.format(args.dataset, args.dataset))
-    predicate_dict_val = generate_predicate_dict(VALID_FILE_PATH.format(args.dataset))
-    predicate_dict_test = generate_predicate_dict(TEST_FILE_PATH.format(args.dataset))
-
-    # Generate head and tail dictionaries
-    head_dict, tail_dict = generate_head_tail_dicts(predicate_dict)
+    start_time = time.perf_counter()
+    # Load the training, validation and test triples
+    store = load_triple_store(args.dataset, use_cache=not args.no_cache)
 
     # Load rules from JSON file
-    with open(OUTPUT_NEGATIVE_RULES_PATH.format(args.dataset, args.dataset), "r") as json_file:
+    with stage("parse"), open(OUTPUT_NEGATIVE_RULES_PATH.format(args.dataset, args.dataset), "r") as json_file:
         rules = json.load(json_file)
-
-    # Generate triples
-    tp = generate_triples(rules, predicate_dict, head_dict, tail_dict, predicate_dict_val, predicate_dict_test)
-
-    # Post-process triples
-    processed_triples = process_triples(tp)
-
-    # Save the triples to a file
-    save_triples(processed_triples, OUTPUT_TP_FILE_PATH.format(args.dataset, args.dataset), OUTPUT_SEL_TP_FILE_PATH.format(args.dataset, args.dataset), ORIGINAL_TRAIN_PATH.format(args.dataset), OUTPUT_TRAIN_FILE_PATH.format(args.dataset))
-
-    print(f"Number of unique triples: {len(processed_triples)}")
+    count("rules", len(rules))
+
+    output_file_path = OUTPUT_TP_FILE_PATH.format(args.dataset, args.dataset)
+    memory_budget = args.memory_budget * 2 ** 20 if args.memory_budget is not None else None
+    with KeySet(memory_budget, spill_dir=os.path.dirname(output_file_path)) as key_set, RuleLog(args.rule_log) as rule_log:
+        # Generate triples
+        subpath_cache = SubpathCache(args.subpath_cache_size * 2 ** 20) if args.subpath_cache_size > 0 else None
+        fanout_cap = FanoutCap(args.max_fanout, args.fanout_strategy, args.seed or 0) if args.max_fanout else None
+        grounding_cache = (GroundingCache(GROUNDING_CACHE_PATH.format(args.dataset, args.dataset), store,
+                                          ("train", "valid", "test")) if args.incremental else None)
+        tp = generate_triples(rules, store, args.workers, args.max_groundings, subpath_cache, rule_log, fanout_cap,
+                              grounding_cache)
+
+        # Post-process triples
+        processed_triples = process_triples(tp, rules, store, key_set)
+
+        # Stream the triples to a file
+        original_train = ORIGINAL_TRAIN_PATH.format(args.dataset)
+        budgets = attack_budgets(args.dataset, args.budgets, count_lines(original_train) if args.budgets else None)
+        num_triples = save_triples(processed_triples, store, output_file_path, original_train, budgets, args.seed,
+                                   args.columnar_format)
+
+    if grounding_cache is not None:
+        grounding_cache.save()
+        print(f"Reused the candidates of {counter('reused rules')} of {len(rules)} rules")
+    print(f"Number of unique triples: {num_triples}")
+    if subpath_cache is not None and args.max_groundings is not None:
+        print("Sub-path cache: disabled by --max-groundings")
+    elif subpath_cache is not None and args.workers <= 1:
+        print(subpath_cache.summary())
+    if fanout_cap is not None:
+        print(f"Fan-out cap: {counter('fan-out dropped groundings')} groundings dropped "
+              f"through {counter('fan-out capped entities')} capped join entities")
+
+    report_path = RUN_REPORT_PATH.format(args.dataset, args.dataset, "generate_neg_triples")
+    write_report(report_path, "generate_neg_triples", args, start_time)
+    print(f"Run report saved to {report_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+"""Shared helpers for the addition and deletion attack scripts."""
@@ -0,0 +1,104 @@
+import argparse
+
+from .evaluate import MODELS, run_evaluate
+from .mining import run_mine
+from .partition import run_partition
+from .pipeline import run
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m attack")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the addition or deletion attack end to end.")
+    run_parser.add_argument("--mode", type=str, required=True, choices=['add', 'del'])
+    run_parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    run_parser.add_argument("--save-intermediates", action="store_true",
+                            help="Also write the intermediate artifacts, so later runs can skip the stages producing them.")
+    run_parser.add_argument("--force", action="store_true", help="Rerun every stage even if its inputs are unchanged.")
+    run_parser.add_argument("--no-cache", action="store_true", help="Parse the dataset files instead of using the store snapshot.")
+    run_parser.add_argument("--workers", type=int, default=1, help="Number of processes to ground rules with.")
+    run_parser.add_argument("--max-groundings", type=int, default=None,
+                            help="Keep only the first groundings of each rule body, in sorted order; disables the sub-path cache.")
+    run_parser.add_argument("--subpath-cache-size", type=int, default=256,
+                            help="Memory in MB for groundings shared by rules with common body relations, 0 to disable.")
+    run_parser.add_argument("--max-fanout", type=int, default=None,
+                            help="Cap the groundings through a single join entity, e.g. a hub in a two-hop body.")
+    run_parser.add_argument("--fanout-strategy", type=str, default="sample", choices=['sample', 'drop'],
+                            help="Sample the groundings through capped entities, or drop them.")
+    run_parser.add_argument("--incremental", action="store_true",
+                            help="Reuse the groundings of rules whose body and head relations are unchanged since the last run.")
+    run_parser.add_argument("--budgets", type=float, nargs="+", default=None,
+                            help="Budgets in percent of the training triples, e.g. 5 10 20, each written to "
+                                 "data_processed/<dataset>_<mode>_<budget>; defaults to SORT_LIMIT triples.")
+    run_parser.add_argument("--top-n", type=int, default=1,
+                            help="add: number of most similar relations each relation is replaced with.")
+    run_parser.add_argument("--memory-budget", type=int, default=None,
+                            help="add: MB of deduplication keys to keep in memory before spilling them to disk.")
+    run_parser.add_argument("--seed", type=int, default=None, help="add: seed of the sampled adversarial triples.")
+    run_parser.add_argument("--instances-format", type=str, default=None, choices=['text', 'jsonl', 'arrow', 'parquet'],
+                            help="del: also write the rule instances in this format; arrow and parquet require pyarrow.")
+    run_parser.add_argument("--engine", type=str, default="join", choices=['join', 'sparse'],
+                            help="del: enumerate the rule instances by joins, or compute the triple scores directly "
+                                 "with sparse matrix products; sparse requires scipy.")
+    run_parser.add_argument("--columnar-format", type=str, default=None, choices=['arrow', 'parquet'],
+                            help="Also write the poisoned training sets (and, for add, the sampled and candidate "
+                                 "triples) in this columnar format; requires pyarrow.")
+
+    mine_parser = subparsers.add_parser("mine", help="Mine path rules of length 1 and 2 from the training set.")
+    mine_parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    mine_parser.add_argument("--max-length", type=int, default=2, choices=[1, 2, 3], help="Maximum number of body atoms.")
+    mine_parser.add_argument("--min-support", type=int, default=2,
+                             help="Minimum number of body groundings the head holds for.")
+    mine_parser.add_argument("--min-head-coverage", type=float, default=0.01,
+                             help="Minimum fraction of the head's triples predicted by the body.")
+    mine_parser.add_argument("--min-conf", type=float, default=0.0, help="Minimum confidence of a rule.")
+    mine_parser.add_argument("--high-conf-threshold", type=float, default=0.5,
+                             help="Rules of at least this confidence go to the high-confidence file, the others to the low one.")
+    mine_parser.add_argument("--workers", type=int, default=1, help="Number of processes to mine rule bodies with.")
+
+    partition_parser = subparsers.add_parser("partition", help="Split triples files into one file per relation.")
+    partition_parser.add_argument("files", nargs="+", help="Triples files to split, e.g. the test.txt and valid.txt "
+                                                           "of every evaluated dataset.")
+    partition_parser.add_argument("--output-dir", type=str, default=None,
+                                  help="Directory of the relation files of a single input file; defaults to "
+                                       "<split>_by_relation next to each input file.")
+    partition_parser.add_argument("--relations", type=str, nargs="+", default=None,
+                                  help="Only write these relations.")
+    partition_parser.add_argument("--index", action="store_true",
+                                  help="Also write the triples grouped by relation, with a JSON index of the byte "
+                                       "offset of every relation's slice.")
+    partition_parser.add_argument("--max-open", type=int, default=64, help="Maximum number of files open at once.")
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Compute filtered MRR and Hits@1/3/10 of trained embeddings.")
+    evaluate_parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    evaluate_parser.add_argument("--model-dir", type=str, required=True,
+                                 help="Directory with entity_embedding.npy, relation_embedding.npy and config.json.")
+    evaluate_parser.add_argument("--model", type=str, default=None, choices=MODELS,
+                                 help="Scoring function; read from config.json if omitted.")
+    evaluate_parser.add_argument("--split", type=str, default="test", choices=['test', 'valid'])
+    evaluate_parser.add_argument("--train-file", type=str, default=None,
+                                 help="Training triples filtered out of the rankings; defaults to the clean train.txt.")
+    evaluate_parser.add_argument("--batch-size", type=int, default=256, help="Number of queries scored at once.")
+    evaluate_parser.add_argument("--threads", type=int, default=1, help="Number of batches scored in parallel.")
+    evaluate_parser.add_argument("--per-relation", action="store_true", help="Also report the metrics of every relation.")
+    evaluate_parser.add_argument("--output", type=str, default=None, help="JSON file the metrics are written to.")
+
+    args = parser.parse_args()
+    if args.command == "partition" and args.output_dir and len(args.files) > 1:
+        partition_parser.error("--output-dir can only be given with a single input file")
+    if args.command == "run":
+        if args.engine == "sparse" and (args.instances_format or args.max_groundings or args.max_fanout or args.incremental):
+            run_parser.error("--engine sparse writes no instances and counts every grounding, so it cannot be combined "
+                             "with --instances-format, --max-groundings, --max-fanout or --incremental")
+        run(args)
+    elif args.command == "mine":
+        run_mine(args)
+    elif args.command == "partition":
+        run_partition(args)
+    elif args.command == "evaluate":
+        run_evaluate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import math
+from fractions import Fraction
+
+
+def budget_size(percent, num_triples):
+    """
+    Number of triples an attack budget allows.
+
+    Args:
+        percent (float): Budget as a percentage of the training triples.
+        num_triples (int): Number of training triples.
+
+    Returns:
+        int: ceil(percent% of num_triples), computed exactly.
+    """
+    return math.ceil(Fraction(str(percent)) * num_triples / 100)
+
+
+def budget_label(percent):
+    """
+    Format a budget for output paths, e.g. 10.0 as "10" and 2.5 as "2.5".
+    """
+    return f"{percent:g}"
+
+
+def count_lines(file_path):
+    """
+    Count the non-empty lines of a triples file.
+    """
+    with open(file_path, 'r') as file:
+        return sum(1 for line in file if line.strip())
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+
+from .instrument import stage
+from .triple_store import TripleStore
+
+SNAPSHOT_VERSION = 3
+
+
+def file_fingerprint(file_path, with_hash=True):
+    """
+    Describe a source file by size, modification time and content hash.
+
+    Args:
+        file_path (str): Path to the file.
+        with_hash (bool): Whether to compute the SHA-1 of the content.
+
+    Returns:
+        dict or None: The fingerprint, or None if the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint["sha1"] = digest.hexdigest()
+    return fingerprint
+
+
+def is_fresh(recorded, file_path):
+    """
+    Check whether a source file still matches its recorded fingerprint.
+
+    Size and modification time are compared first; the content hash is only
+    recomputed when the size matches but the modification time does not.
+
+    Args:
+        recorded (dict or None): Fingerprint stored with the snapshot.
+        file_path (str): Path to the source file.
+
+    Returns:
+        bool: True if the file is unchanged.
+    """
+    current = file_fingerprint(file_path, with_hash=False)
+    if recorded is None or current is None:
+        return recorded is None and current is None
+    if current["size"] != recorded["size"]:
+        return False
+    if current["mtime_ns"] == recorded["mtime_ns"]:
+        return True
+    return file_fingerprint(file_path)["sha1"] == recorded["sha1"]
+
+
+def load_cached_store(cache_dir, split_paths, entities_path, relations_path):
+    """
+    Load a triple store from its on-disk snapshot, rebuilding the snapshot if any source changed.
+
+    The snapshot is a directory of .npy arrays that later runs memory-map instead
+    of parsing the text files again. It is keyed by the fingerprints of the split
+    files and the entity and relation dictionaries it was built from.
+
+    Args:
+        cache_dir (str or None): Snapshot directory, None to always parse the text files.
+        split_paths (dict): Mapping from split name to triples file path.
+        entities_path (str): Path to `entities.dict`.
+        relations_path (str): Path to `relations.dict`.
+
+    Returns:
+        TripleStore: The loaded store.
+    """
+    sources = dict(split_paths, __entities__=entities_path, __relations__=relations_path)
+    meta_path = os.path.join(cache_dir, "snapshot.json") if cache_dir else None
+
+    if meta_path and os.path.exists(meta_path):
+        with open(meta_path, 'r') as meta_file:
+            meta = json.load(meta_file)
+        if (meta.get("version") == SNAPSHOT_VERSION and set(meta["sources"]) == set(sources)
+                and all(is_fresh(meta["sources"][name], path) for name, path in sources.items())):
+            # Record new modification times of files whose content was unchanged, so they are not hashed again
+            touched = False
+            for name, path in sources.items():
+                recorded = meta["sources"][name]
+                if recorded is not None and recorded["mtime_ns"] != os.stat(path).st_mtime_ns:
+                    recorded["mtime_ns"] = os.stat(path).st_mtime_ns
+                    touched = True
+            if touched:
+                with open(meta_path, 'w') as meta_file:
+                    json.dump(meta, meta_file, indent=4)
+            with stage("load snapshot"):
+                return TripleStore.load(cache_dir)
+
+    store = TripleStore.from_dict_files(entities_path, relations_path)
+    for split, file_path in split_paths.items():
+        store.load_split(split, file_path)
+
+    if cache_dir:
+        with stage("write snapshot"):
+            save_snapshot(store, cache_dir, {name: file_fingerprint(path) for name, path in sources.items()})
+    return store
+
+
+def save_snapshot(store, cache_dir, sources):
+    """
+    Write a store snapshot, replacing any previous one in place.
+
+    The snapshot is written to a temporary directory first and its metadata
+    last, so an interrupted write never leaves a snapshot that looks valid.
+
+    Args:
+        store (TripleStore): Store to write.
+        cache_dir (str): Snapshot directory.
+        sources (dict): Fingerprints of the files the store was built from.
+    """
+    temp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    store.save(temp_dir)
+    with open(os.path.join(temp_dir, "snapshot.json"), 'w') as meta_file:
+        json.dump({"version": SNAPSHOT_VERSION, "sources": sources}, meta_file, indent=4)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(temp_dir, cache_dir)
+
+
+class StageManifest:
+    """
+    Record of the pipeline stages that ran, so unchanged stages can be skipped.
+
+    Each stage is identified by a key hashed from its parameters, the content of
+    its input files and the keys of the stages it consumes. A stage is current
+    when its key is unchanged and the outputs it wrote are still on disk unmodified.
+    Stages whose output is random, such as sampling without a seed, are recorded
+    as not reproducible and are never current.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the JSON manifest.
+        """
+        self.path = path
+        self.stages = {}
+        self._fingerprints = {}
+        if os.path.exists(path):
+            with open(path, 'r') as manifest_file:
+                self.stages = json.load(manifest_file)
+
+    def key(self, stage, params, inputs=(), upstream=()):
+        """
+        Compute the key of a stage run.
+
+        Input files are only hashed again if their size or modification time
+        differs from the fingerprint recorded by the last run.
+
+        Args:
+            stage (str): Name of the stage.
+            params (dict): JSON-serializable parameters that change the stage's output.
+            inputs (iterable): Paths of the files the stage reads.
+            upstream (iterable): Keys of the stages whose output the stage consumes.
+
+        Returns:
+            str: The key.
+        """
+        recorded = self.stages.get(stage, {}).get("inputs", {})
+        fingerprints = {}
+        for path in inputs:
+            previous = recorded.get(path)
+            fingerprints[path] = previous if previous and is_fresh(previous, path) else file_fingerprint(path)
+        self._fingerprints[stage] = fingerprints
+        content = [stage, params, list(upstream), {path: fp and fp["sha1"] for path, fp in fingerprints.items()}]
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def is_current(self, stage, key, outputs):
+        """
+        Check whether a stage ran with this key and wrote the given outputs, unchanged since.
+
+        Args:
+            stage (str): Name of the stage.
+            key (str): Key from key().
+            outputs (iterable): Paths of the outputs the caller needs.
+
+        Returns:
+            bool: True if the stage can be skipped.
+        """
+        entry = self.stages.get(stage)
+        outputs = list(outputs)
+        return (bool(outputs) and entry is not None and entry["key"] == key and entry.get("reproducible", False)
+                and all(entry["outputs"].get(path) is not None and is_fresh(entry["outputs"][path], path)
+                        for path in outputs))
+
+    def record(self, stage, key, outputs, reproducible=True):
+        """
+        Record a completed stage run and save the manifest.
+
+        Args:
+            stage (str): Name of the stage.
+            key (str): Key from key().
+            outputs (iterable): Paths of the files the stage wrote; a stage that wrote
+                nothing is recorded but never current.
+            reproducible (bool): Whether a rerun with the same key writes the same
+                outputs; a stage that does not is recorded but never current.
+        """
+        self.stages[stage] = {
+            "key": key,
+            "reproducible": reproducible,
+            "inputs": self._fingerprints.get(stage, {}),
+            "outputs": {path: file_fingerprint(path) for path in outputs},
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(self.stages, manifest_file, indent=4)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Optional, only needed for Arrow and Parquet output
+    pa = None
+
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+# Column name to type. "entity" and "relation" columns hold IDs from the store's
+# vocabularies, dictionary-encoded with the vocabulary names as dictionary.
+TRIPLE_COLUMNS = {
+    "head": "entity",
+    "relation": "relation",
+    "tail": "entity",
+}
+
+# Candidate triples of the addition attack, with the rule that first produced
+# each one (its position in the rule file) and that rule's confidence.
+CANDIDATE_COLUMNS = {
+    "head": "entity",
+    "relation": "relation",
+    "tail": "entity",
+    "rule": "int32",
+    "conf": "float64",
+}
+
+# One row per body atom of every instance; the confidence is repeated on every
+# atom, so summing it per body triple gives the triple's deletion score.
+INSTANCE_COLUMNS = {
+    "instance": "int64",
+    "rule": "int32",
+    "conf": "float64",
+    "atom": "int32",
+    "head_head": "entity",
+    "head_relation": "relation",
+    "head_tail": "entity",
+    "body_head": "entity",
+    "body_relation": "relation",
+    "body_tail": "entity",
+}
+
+
+def columnar_path(path, output_format):
+    """
+    Replace the extension of a text output path with that of a columnar format.
+
+    Args:
+        path (str): Path of the text output, e.g. `train.txt`.
+        output_format (str): "arrow" or "parquet".
+
+    Returns:
+        str: The path with the format's extension, e.g. `train.parquet`.
+    """
+    return os.path.splitext(path)[0] + FORMATS[output_format]
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Arrow and Parquet output require pyarrow, install it with `pip install pyarrow`")
+
+
+class ColumnarWriter:
+    """
+    Writer of an Arrow IPC or Parquet file.
+
+    Entity and relation columns are int32 IDs dictionary-encoded with the names
+    of the store's vocabularies, so readers get integer columns without
+    tokenizing and can still decode them to names. Since every record batch
+    (Parquet row group) carries the full vocabularies as its dictionaries, rows
+    are buffered and flushed once per batch_rows rows.
+    """
+
+    def __init__(self, path, columns, store, output_format="arrow", batch_rows=1 << 20):
+        """
+        Args:
+            path (str): Path of the output file.
+            columns (dict): Column names and types, e.g. TRIPLE_COLUMNS.
+            store (TripleStore): Store whose vocabularies encode the entity and relation columns.
+                Names added to them after the writer is created cannot be written.
+            output_format (str): "arrow" for the Arrow IPC file format, or "parquet".
+            batch_rows (int): Number of rows per record batch.
+        """
+        require_pyarrow()
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self.buffer = []
+        self.buffered_rows = 0
+        self.dictionaries = {
+            "entity": pa.array(store.entities.names, type=pa.string()),
+            "relation": pa.array(store.relations.names, type=pa.string()),
+        }
+        self.schema = pa.schema([
+            pa.field(name, pa.dictionary(pa.int32(), pa.string()) if kind in self.dictionaries
+                     else pa.type_for_alias(kind))
+            for name, kind in columns.items()
+        ])
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if output_format == "parquet":
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, **arrays):
+        """
+        Write rows, flushing a record batch once enough rows are buffered.
+
+        Args:
+            **arrays: One NumPy array per column, all of the same length.
+        """
+        arrays = {name: np.asarray(arrays[name]) for name in self.columns}
+        self.buffer.append(arrays)
+        self.buffered_rows += len(next(iter(arrays.values())))
+        if self.buffered_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as one record batch."""
+        if not self.buffer:
+            return
+        columns = []
+        for name, kind in self.columns.items():
+            values = np.concatenate([arrays[name] for arrays in self.buffer])
+            if kind in self.dictionaries:
+                indices = pa.array(values.astype(np.int32, copy=False), type=pa.int32())
+                columns.append(pa.DictionaryArray.from_arrays(indices, self.dictionaries[kind]))
+            else:
+                columns.append(pa.array(values, type=self.schema.field(name).type))
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.buffer = []
+        self.buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def encode_lines(store, lines):
+    """
+    Encode tab-separated triple lines with the store's vocabularies.
+
+    Names missing from the vocabularies are added.
+
+    Returns:
+        np.ndarray: (n, 3) int32 array of (head, relation, tail) IDs.
+    """
+    triples = np.empty((len(lines), 3), dtype=np.int32)
+    if lines:
+        heads, relations, tails = zip(*(line.split('\t') for line in lines))
+        triples[:, 0] = store.entities.encode(heads)
+        triples[:, 1] = store.relations.encode(relations)
+        triples[:, 2] = store.entities.encode(tails)
+    return triples
+
+
+def write_triple_lines(path, store, lines, output_format):
+    """
+    Write tab-separated triple lines, e.g. a poisoned training set, as a columnar triples file.
+
+    Args:
+        path (str): Path of the output file.
+        store (TripleStore): Store whose vocabularies encode the triples.
+        lines (list): Lines of the triples, in the order to write them.
+        output_format (str): "arrow" or "parquet".
+    """
+    triples = encode_lines(store, lines)
+    with ColumnarWriter(path, TRIPLE_COLUMNS, store, output_format) as writer:
+        writer.write(head=triples[:, 0], relation=triples[:, 1], tail=triples[:, 2])
+
+
+def read_table(path):
+    """
+    Read a columnar file written by ColumnarWriter.
+
+    Returns:
+        pyarrow.Table: The table; Arrow IPC files are memory-mapped rather than copied.
+    """
+    require_pyarrow()
+    if path.endswith(FORMATS["parquet"]):
+        return pq.read_table(path)
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
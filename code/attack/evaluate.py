@@ -0,0 +1,287 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .instrument import Progress, count, stage, write_report
+from .join import expand_matches
+from .pipeline import ADD_DIR, import_script, resolve
+from .triple_store import TripleStore
+
+MODELS = ("TransE", "DistMult", "ComplEx")
+HITS_AT = (1, 3, 10)
+
+# Elements of the (queries, entities, dimension) blocks TransE distances are computed in,
+# small enough to stay in cache, and the fewest entities per block, so that large batches
+# and dimensions are split along the queries instead of into many tiny entity blocks
+TRANSE_BLOCK_ELEMENTS = 1 << 20
+TRANSE_MIN_BLOCK_ENTITIES = 256
+
+
+def load_embeddings(model_dir, model=None):
+    """
+    Load trained embeddings saved in the layout of the KnowledgeGraphEmbedding code
+    the datasets come from: `entity_embedding.npy`, `relation_embedding.npy` and,
+    optionally, `config.json` naming the model.
+
+    Rows of the arrays are the IDs of `entities.dict` and `relations.dict`. ComplEx
+    embeddings hold the real parts in their first half and the imaginary parts in
+    their second half.
+
+    Args:
+        model_dir (str): Directory of the saved model.
+        model (str, optional): "TransE", "DistMult" or "ComplEx"; read from `config.json` if omitted.
+
+    Returns:
+        tuple: (model, entity embeddings, relation embeddings), the arrays as float32.
+    """
+    config_path = os.path.join(model_dir, "config.json")
+    if model is None and os.path.exists(config_path):
+        with open(config_path, 'r') as config_file:
+            model = json.load(config_file).get("model")
+    if model not in MODELS:
+        raise ValueError(f"Unsupported model {model!r}, pass --model with one of {', '.join(MODELS)}")
+    entities = np.load(os.path.join(model_dir, "entity_embedding.npy")).astype(np.float32, copy=False)
+    relations = np.load(os.path.join(model_dir, "relation_embedding.npy")).astype(np.float32, copy=False)
+    return model, entities, relations
+
+
+class FilterIndex:
+    """
+    Known answers of every (entity, relation) query, as a CSR index.
+
+    Triples are sorted by (relation, head) for tail queries and by (relation, tail)
+    for head queries. The offsets of each query's run of answers are found by
+    binary search on the packed keys, and the answers are the other column of the run.
+    """
+
+    def __init__(self, triples, num_entities):
+        """
+        Args:
+            triples (np.ndarray): (n, 3) array of all known (head, relation, tail) triples.
+            num_entities (int): Number of entities.
+        """
+        self.num_entities = num_entities
+        triples = triples.astype(np.int64)
+        self.keys, self.answers = {}, {}
+        for direction, (source, target) in (("tail", (0, 2)), ("head", (2, 0))):
+            keys = triples[:, 1] * num_entities + triples[:, source]
+            order = np.argsort(keys, kind='stable')
+            self.keys[direction] = keys[order]
+            self.answers[direction] = triples[order, target]
+
+    def lookup(self, direction, entities, relations):
+        """
+        Get the known answers of a batch of queries.
+
+        Args:
+            direction (str): "tail" to predict tails of (head, relation) queries, "head" for heads.
+            entities (np.ndarray): Given entity of every query.
+            relations (np.ndarray): Relation of every query.
+
+        Returns:
+            tuple: Query index and answer entity of every known answer.
+        """
+        queries = relations.astype(np.int64) * self.num_entities + entities
+        rows, matches = expand_matches(queries, self.keys[direction])
+        return rows, self.answers[direction][matches]
+
+
+class Scorer:
+    """
+    Scores of every candidate entity for batches of head or tail queries.
+
+    All three models reduce to one query vector per (entity, relation) pair:
+    DistMult and ComplEx score candidates by its dot product with their
+    embeddings, one matrix product per batch, and TransE by the negative L1
+    distance to them, computed in blocks of entities to bound memory.
+    """
+
+    def __init__(self, model, entity_embeddings, relation_embeddings):
+        self.model = model
+        self.entities = entity_embeddings
+        self.relations = relation_embeddings
+
+    def queries(self, direction, entities, relations):
+        given, relation = self.entities[entities], self.relations[relations]
+        if self.model == "TransE":
+            # h + r - t: tails are close to h + r, heads to t - r
+            return given + relation if direction == "tail" else given - relation
+        if self.model == "DistMult":
+            return given * relation
+        # ComplEx: Re(<h, r, conj(t)>), linear in the conjugated tail or in the head
+        given_re, given_im = np.split(given, 2, axis=1)
+        relation_re, relation_im = np.split(relation, 2, axis=1)
+        if direction == "tail":
+            return np.concatenate([given_re * relation_re - given_im * relation_im,
+                                   given_re * relation_im + given_im * relation_re], axis=1)
+        return np.concatenate([relation_re * given_re + relation_im * given_im,
+                               relation_re * given_im - relation_im * given_re], axis=1)
+
+    def scores(self, direction, entities, relations):
+        """
+        Score every entity as the answer of a batch of queries.
+
+        Returns:
+            np.ndarray: (queries, entities) float32 scores, higher is more plausible.
+        """
+        queries = self.queries(direction, entities, relations)
+        if self.model != "TransE":
+            return queries @ self.entities.T
+        scores = np.empty((len(queries), len(self.entities)), dtype=np.float32)
+        dimension = max(1, queries.shape[1])
+        block = max(TRANSE_MIN_BLOCK_ENTITIES, TRANSE_BLOCK_ELEMENTS // (max(1, len(queries)) * dimension))
+        query_block = max(1, TRANSE_BLOCK_ELEMENTS // (block * dimension))
+        for start in range(0, len(self.entities), block):
+            candidates = self.entities[start:start + block]
+            for query_start in range(0, len(queries), query_block):
+                batch = queries[query_start:query_start + query_block]
+                scores[query_start:query_start + query_block, start:start + block] = -np.abs(
+                    batch[:, None, :] - candidates[None, :, :]).sum(axis=2)
+        return scores
+
+
+def rank_batch(scorer, filter_index, direction, triples):
+    """
+    Compute the filtered rank of the true answer of a batch of test triples.
+
+    The rank is 1 plus the number of candidates scored strictly higher than the
+    true answer, other known answers of the query excluded.
+
+    Args:
+        scorer (Scorer): Scorer of the model.
+        filter_index (FilterIndex): Known answers of every query.
+        direction (str): "tail" or "head".
+        triples (np.ndarray): (n, 3) array of test triples.
+
+    Returns:
+        np.ndarray: int64 rank of every triple.
+    """
+    given, target = (triples[:, 0], triples[:, 2]) if direction == "tail" else (triples[:, 2], triples[:, 0])
+    scores = scorer.scores(direction, given, triples[:, 1])
+    true_scores = scores[np.arange(len(triples)), target]
+    rows, answers = filter_index.lookup(direction, given, triples[:, 1])
+    scores[rows, answers] = -np.inf
+    return 1 + (scores > true_scores[:, None]).sum(axis=1)
+
+
+def rank_triples(scorer, filter_index, triples, batch_size=256, threads=1):
+    """
+    Rank the true heads and tails of test triples, in batches spread across threads.
+
+    NumPy releases the GIL in the batch products and comparisons, so threads
+    share the scorer and filter index without copying them.
+
+    Returns:
+        dict: Mapping from "head" and "tail" to the ranks of every triple.
+    """
+    batches = [(direction, triples[start:start + batch_size])
+               for direction in ("tail", "head") for start in range(0, len(triples), batch_size)]
+    progress = Progress(len(batches), "Ranking test triples")
+    ranks = {"tail": [], "head": []}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = executor.map(lambda batch: rank_batch(scorer, filter_index, *batch), batches)
+        for (direction, _), batch_ranks in zip(batches, results):
+            ranks[direction].append(batch_ranks)
+            progress.update()
+    progress.close()
+    return {direction: np.concatenate(batch_ranks) if batch_ranks else np.empty(0, dtype=np.int64)
+            for direction, batch_ranks in ranks.items()}
+
+
+def metrics(ranks):
+    """
+    Compute MRR and Hits@1/3/10 of ranks.
+
+    Returns:
+        dict: "MRR", "Hits@1", "Hits@3", "Hits@10" and "count".
+    """
+    ranks = np.asarray(ranks, dtype=np.float64)
+    if not len(ranks):
+        return {"count": 0}
+    result = {"MRR": float(np.mean(1 / ranks))}
+    for k in HITS_AT:
+        result[f"Hits@{k}"] = float(np.mean(ranks <= k))
+    result["count"] = len(ranks)
+    return result
+
+
+def evaluate(store, scorer, split="test", batch_size=256, threads=1, per_relation=False):
+    """
+    Compute filtered ranking metrics of head and tail prediction on a split.
+
+    Every other split of the store is used as known answers to filter.
+
+    Returns:
+        dict: Metrics of both directions together and of each one, plus one entry
+            per relation with per_relation.
+    """
+    triples = store.triples[split]
+    if len(triples) and (triples[:, [0, 2]].max() >= len(scorer.entities) or
+                         triples[:, 1].max() >= len(scorer.relations)):
+        raise ValueError(f"The {split} split has entities or relations without embeddings")
+    with stage("index"):
+        filter_index = FilterIndex(np.concatenate(list(store.triples.values())), len(store.entities))
+    with stage("rank"):
+        ranks = rank_triples(scorer, filter_index, triples, batch_size, threads)
+    count("ranked queries", 2 * len(triples))
+
+    results = {"both": metrics(np.concatenate([ranks["tail"], ranks["head"]])),
+               "tail": metrics(ranks["tail"]), "head": metrics(ranks["head"])}
+    if per_relation:
+        results["relations"] = {}
+        for relation in np.unique(triples[:, 1]):
+            rows = triples[:, 1] == relation
+            results["relations"][store.relations.names[relation]] = metrics(
+                np.concatenate([ranks["tail"][rows], ranks["head"][rows]]))
+    return results
+
+
+def format_metrics(name, result):
+    if not result["count"]:
+        return f"{name:<48} {'':>8} {'':>8} {'':>8} {'':>8} {0:>8}"
+    return (f"{name:<48} {result['MRR']:>8.4f} {result['Hits@1']:>8.4f} {result['Hits@3']:>8.4f} "
+            f"{result['Hits@10']:>8.4f} {result['count']:>8}")
+
+
+def run_evaluate(args):
+    """
+    Evaluate trained embeddings on a dataset's test or validation split.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of `python -m attack evaluate`.
+    """
+    start_time = time.perf_counter()
+    config = import_script(ADD_DIR, "config")
+    dataset = args.dataset
+    split_paths = {
+        "train": args.train_file or resolve(ADD_DIR, config.ORIGINAL_TRAIN_PATH, dataset),
+        "valid": resolve(ADD_DIR, config.EVAL_VALID_PATH, dataset),
+        "test": resolve(ADD_DIR, config.EVAL_TEST_PATH, dataset),
+    }
+    with stage("parse"):
+        store = TripleStore.from_dict_files(resolve(ADD_DIR, config.ENTITIES_DICT_PATH, dataset),
+                                            resolve(ADD_DIR, config.RELATIONS_DICT_PATH, dataset))
+        for split, path in split_paths.items():
+            store.load_split(split, path)
+        model, entity_embeddings, relation_embeddings = load_embeddings(args.model_dir, args.model)
+
+    results = evaluate(store, Scorer(model, entity_embeddings, relation_embeddings), args.split, args.batch_size,
+                       args.threads, args.per_relation)
+    print(f"{model} on {dataset} {args.split}, filtered with {', '.join(split_paths.values())}")
+    print(f"{'':<48} {'MRR':>8} {'Hits@1':>8} {'Hits@3':>8} {'Hits@10':>8} {'count':>8}")
+    for direction in ("both", "tail", "head"):
+        print(format_metrics(direction, results[direction]))
+    for relation, result in results.get("relations", {}).items():
+        print(format_metrics(relation, result))
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            json.dump({"model": model, "dataset": dataset, "split": args.split, "filter": split_paths,
+                       "results": results}, output_file, indent=4)
+        write_report(os.path.splitext(args.output)[0] + "_report.json", "evaluate", args, start_time)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .instrument import count
+
+GROUNDINGS_VERSION = 2
+
+
+def rule_key(rule, params):
+    """
+    Hash the parts of a rule that determine its groundings.
+
+    The confidence is left out, so re-scoring a rule does not re-ground it.
+
+    Args:
+        rule (dict): Rule loaded from the JSON file.
+        params (dict): JSON-serializable grounding parameters, e.g. --max-groundings.
+
+    Returns:
+        str: SHA-1 hex digest of the rule head, body and parameters.
+    """
+    content = [rule.get("Rule Head", []), rule.get("Rule Body", []), params]
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def grounding_params(max_groundings=None, fanout_cap=None):
+    """
+    Collect the grounding options that change a rule's groundings, for rule_key().
+    """
+    return {
+        "max_groundings": max_groundings,
+        "fanout_cap": None if fanout_cap is None else [fanout_cap.max_fanout, fanout_cap.strategy, fanout_cap.seed],
+    }
+
+
+def relation_digests(store, splits):
+    """
+    Hash the triples of every relation in the given splits.
+
+    Args:
+        store (TripleStore): Store holding the splits.
+        splits (iterable): Names of the splits the groundings read.
+
+    Returns:
+        dict: Mapping from split name to a mapping from relation name to the SHA-1 of its (head, tail) pairs.
+    """
+    digests = {}
+    for split in splits:
+        offsets = store.offsets[split]
+        digests[split] = {}
+        for relation in np.flatnonzero(np.diff(offsets)):
+            rows = store.triples[split][offsets[relation]:offsets[relation + 1]]
+            pairs = np.ascontiguousarray(rows[:, [0, 2]])
+            digests[split][store.relations.names[relation]] = hashlib.sha1(pairs.tobytes()).hexdigest()
+    return digests
+
+
+def _vocabulary_digest(names):
+    return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+
+
+def _inverse_name(relation):
+    return relation[4:] if relation.startswith("inv_") else "inv_" + relation
+
+
+class GroundingCache:
+    """
+    Per-rule grounding results kept on disk between runs.
+
+    Every rule's groundings are stored as an int32 array of entity IDs, keyed by
+    a hash of the rule and the grounding parameters. The index records the
+    entity vocabulary and a digest of every relation's triples, the version of
+    the dataset the groundings were computed on. On the next run a rule is only
+    re-grounded if it is new, or if a relation it reads (its body relations and
+    head, including their inverses) gained or lost triples; all other rules are
+    loaded from disk. Results of rules no longer in the rule file are deleted
+    when the index is saved.
+    """
+
+    def __init__(self, directory, store, splits):
+        """
+        Args:
+            directory (str): Directory of the stored groundings.
+            store (TripleStore): Store the rules are grounded in.
+            splits (iterable): Names of the splits the groundings read.
+        """
+        self.directory = directory
+        self.store = store
+        self.digests = relation_digests(store, splits)
+        self.entries = {}
+        self.used = set()
+        self.changed = set()
+
+        index_path = os.path.join(directory, "index.json")
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r') as index_file:
+            index = json.load(index_file)
+        # Entity IDs of stored groundings stay valid as long as new entities were only appended
+        known = index.get("entities", {}).get("count", 0)
+        if (index.get("version") != GROUNDINGS_VERSION or set(index["relations"]) != set(self.digests)
+                or len(store.entities) < known
+                or _vocabulary_digest(store.entities.names[:known]) != index["entities"]["sha1"]):
+            return
+        self.entries = index["rules"]
+        for split, digests in self.digests.items():
+            recorded = index["relations"][split]
+            for relation in set(digests) | set(recorded):
+                if digests.get(relation) != recorded.get(relation):
+                    self.changed.update((relation, _inverse_name(relation)))
+
+    def __contains__(self, key):
+        """Check whether a rule's groundings are stored and none of the relations it reads changed."""
+        entry = self.entries.get(key)
+        return (entry is not None and self.changed.isdisjoint(entry["relations"])
+                and os.path.exists(os.path.join(self.directory, entry["file"])))
+
+    def load(self, key):
+        """
+        Load the stored groundings of a rule.
+
+        Args:
+            key (str): Key from rule_key().
+
+        Returns:
+            np.ndarray: The stored int32 array.
+        """
+        self.used.add(key)
+        count("reused rules")
+        return np.load(os.path.join(self.directory, self.entries[key]["file"]))
+
+    def put(self, key, rule, groundings):
+        """
+        Store the groundings of a rule.
+
+        Args:
+            key (str): Key from rule_key().
+            rule (dict): The rule, whose head and body relations are recorded.
+            groundings (np.ndarray): Array of entity IDs to store.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = key + ".npy"
+        temp_path = os.path.join(self.directory, f"{key}.tmp-{os.getpid()}.npy")
+        np.save(temp_path, np.asarray(groundings, dtype=np.int32))
+        os.replace(temp_path, os.path.join(self.directory, file_name))
+        self.entries[key] = {"file": file_name,
+                             "relations": sorted(set(rule.get("Rule Head", [])) | set(rule.get("Rule Body", [])))}
+        self.used.add(key)
+
+    def save(self):
+        """
+        Write the index of the groundings used in this run and delete all others.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entries = {key: self.entries[key] for key in self.used}
+        kept = {entry["file"] for entry in entries.values()} | {"index.json"}
+        for file_name in os.listdir(self.directory):
+            if file_name not in kept:
+                os.remove(os.path.join(self.directory, file_name))
+        index = {
+            "version": GROUNDINGS_VERSION,
+            "entities": {"count": len(self.store.entities), "sha1": _vocabulary_digest(self.store.entities.names)},
+            "relations": self.digests,
+            "rules": entries,
+        }
+        temp_path = os.path.join(self.directory, f"index.json.tmp-{os.getpid()}")
+        with open(temp_path, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(temp_path, os.path.join(self.directory, "index.json"))
@@ -0,0 +1,159 @@
+from functools import partial
+
+import numpy as np
+
+from .instrument import Progress, call_timed, count, merge, stage
+from .parallel import map_rules
+from .sparse import adjacency_matrices, nonzero_pairs, require_scipy, sp
+
+
+class InfluenceEngine:
+    """
+    Deletion influence of training triples, computed with sparse matrix products.
+
+    A rule r1, ..., rk => h has one instance per body path X0, ..., Xk whose head
+    triple h(X0, Xk) holds, and every instance adds the rule's confidence to the
+    score of each of its body triples. The number of instances through an edge
+    (a, b) of atom i is
+
+        sum over X0, Xk of L[X0, a] * H[X0, Xk] * R[b, Xk]
+
+    where H is the head's adjacency matrix, L the product of the adjacency
+    matrices of atoms 1..i-1 (paths from X0 to a) and R that of atoms i+1..k
+    (paths from b to Xk). P = L^T H is one sparse product, and the count of every
+    edge is the dot product of row a of P with row b of R, evaluated only at the
+    edges of atom i. This gives the same scores as summing the confidences of the
+    enumerated instances, without materializing them.
+    """
+
+    def __init__(self, store, split="train", target="original", chunk_size=1 << 16):
+        """
+        Args:
+            store (TripleStore): Store holding the split the rules are grounded in.
+            split (str): Name of that split.
+            target (str): Name of the split whose rows are scored, e.g. the training file.
+            chunk_size (int): Number of edges whose rows are gathered at once.
+        """
+        require_scipy("The sparse influence engine")
+        self.store = store
+        self.target = target
+        self.chunk_size = chunk_size
+        with stage("adjacency"):
+            self.matrices = adjacency_matrices(store, split)
+            self.identity = sp.identity(len(store.entities), dtype=np.int64, format='csr')
+
+    def matrix(self, relation):
+        """Get the adjacency matrix of a relation, empty if it has no triples."""
+        if relation not in self.matrices:
+            num_entities = len(self.store.entities)
+            self.matrices[relation] = sp.csr_matrix((num_entities, num_entities), dtype=np.int32)
+        return self.matrices[relation]
+
+    def edge_counts(self, left, right, heads, tails):
+        """
+        Count the instances through given edges.
+
+        Args:
+            left (scipy.sparse.csr_matrix): L^T H, indexed by the edges' heads.
+            right (scipy.sparse.csr_matrix): Paths from the edges' tails to Xk.
+            heads (np.ndarray): Head entity of every edge.
+            tails (np.ndarray): Tail entity of every edge.
+
+        Returns:
+            np.ndarray: float64 instance count of every edge.
+        """
+        counts = np.empty(len(heads), dtype=np.float64)
+        for start in range(0, len(heads), self.chunk_size):
+            end = start + self.chunk_size
+            if right is self.identity:
+                counts[start:end] = np.asarray(left[heads[start:end], tails[start:end]]).ravel()
+            else:
+                rows = left[heads[start:end]].multiply(right[tails[start:end]])
+                counts[start:end] = np.asarray(rows.sum(axis=1)).ravel()
+        return counts
+
+    def rule_influence(self, rule):
+        """
+        Compute the confidence a rule adds to the scored triples.
+
+        Only rules whose body is a path of two or more predicates are scored, like
+        in generate_del_instances.ground_rule.
+
+        Args:
+            rule (dict): Rule loaded from the JSON file.
+
+        Returns:
+            tuple or None: Rows of the target split and the confidence added to each,
+                or None if no instance of the rule holds.
+        """
+        rule_body = rule.get("Rule Body", [])
+        if len(rule_body) < 2:
+            return None
+        conf = float(rule.get("conf", 0))
+
+        with stage("product"):
+            body = [self.matrix(relation).astype(np.int64) for relation in rule_body]
+            head = self.matrix(rule.get("Rule Head", [])[0]).astype(np.int64)
+            # An instance counts once however many times its head triple is listed
+            head.data[:] = 1
+            # suffixes[i] counts the paths through the atoms after atom i, the identity for the last one
+            suffixes = [self.identity]
+            for matrix in reversed(body[1:]):
+                suffixes.insert(0, matrix if suffixes[0] is self.identity else (matrix @ suffixes[0]).tocsr())
+            if not head.nnz:
+                return None
+
+        rows, values = [], []
+        prefix = self.identity
+        for i, relation in enumerate(rule_body):
+            with stage("product"):
+                left = head if prefix is self.identity else (prefix.T @ head).tocsr()
+                heads, tails = nonzero_pairs(body[i])
+                # A triple listed several times is an edge of that many instances per path through it
+                counts = self.edge_counts(left, suffixes[i], heads, tails) * body[i].data
+                prefix = body[i] if prefix is self.identity else (prefix @ body[i]).tocsr()
+            if i == 0:
+                # Every instance goes through exactly one edge of the first atom
+                count("instances", counts.sum())
+            with stage("score"):
+                keep = counts > 0
+                count("scored edges", keep.sum())
+                forward, inverse = self.store.resolve(relation)
+                triples = np.empty((keep.sum(), 3), dtype=np.int64)
+                triples[:, 0] = tails[keep] if inverse else heads[keep]
+                triples[:, 1] = forward
+                triples[:, 2] = heads[keep] if inverse else tails[keep]
+                found = self.store.find(self.target, triples)
+                rows.append(found[found >= 0])
+                values.append(counts[keep][found >= 0] * conf)
+        rows, values = np.concatenate(rows), np.concatenate(values)
+        return (rows, values) if len(rows) else None
+
+
+def _rule_influence(rule, engine):
+    return engine.rule_influence(rule)
+
+
+def score_rules(rules, store, scores, workers=1, split="train", target="original"):
+    """
+    Add the confidence of every rule instance to the scores of its body triples.
+
+    Args:
+        rules (list): Rules loaded from the JSON file.
+        store (TripleStore): Store holding the split the rules are grounded in.
+        scores (np.ndarray): Float array with one entry per sorted row of the target split, updated in place.
+        workers (int): Number of worker processes the rules are spread across.
+        split (str): Name of the split the rules are grounded in.
+        target (str): Name of the split whose rows are scored.
+    """
+    engine = InfluenceEngine(store, split, target)
+    results = map_rules(partial(call_timed, _rule_influence), rules, engine, workers)
+    progress = Progress(len(rules), "Scoring rules")
+    for influence, _, stages, counters in results:
+        merge(stages, counters)
+        if influence is not None:
+            rows, values = influence
+            with stage("score"):
+                scores += np.bincount(rows, weights=values, minlength=len(scores))
+        progress.update()
+    progress.close()
@@ -0,0 +1,206 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Totals of the current process, updated by stage() and count(). Per-rule calls
+# made through call_timed() record into fresh tables that are returned with the
+# result, so totals from worker processes can be merged into the parent's.
+_stages = {}
+_counters = {}
+
+
+def peak_rss_mb(children=False):
+    """
+    Get the peak resident set size of this process, or of its finished children.
+
+    Returns:
+        float or None: Peak RSS in MB, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / 2 ** 20
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of code and add it to the named stage.
+
+    Stages should not be nested, so their times add up to the run's total.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = _stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += time.perf_counter() - start
+        entry["calls"] += 1
+        entry["peak_rss_mb"] = peak_rss_mb()
+
+
+def staged(name, iterable):
+    """
+    Iterate over a lazy iterable, adding the time spent producing each item to the named stage.
+
+    The loop body is not timed, so it can run stages of its own.
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, None)
+        if item is None:
+            return
+        yield item
+
+
+def count(name, value=1):
+    """Add to a named counter, e.g. the number of candidates a stage produced."""
+    _counters[name] = _counters.get(name, 0) + int(value)
+
+
+def counter(name):
+    """Get the current total of a named counter, 0 if nothing was counted."""
+    return _counters.get(name, 0)
+
+
+def call_timed(function, rule, state):
+    """
+    Call a per-rule function, recording the stages and counters of that call separately.
+
+    Meant to be passed to map_rules through functools.partial.
+
+    Returns:
+        tuple: (result, seconds, stages, counters) of the call.
+    """
+    global _stages, _counters
+    outer = _stages, _counters
+    _stages, _counters = {}, {}
+    start = time.perf_counter()
+    try:
+        result = function(rule, state)
+        return result, time.perf_counter() - start, _stages, _counters
+    finally:
+        _stages, _counters = outer
+
+
+def merge(stages, counters):
+    """Add the stages and counters returned by call_timed() to this process's totals."""
+    for name, entry in stages.items():
+        total = _stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        total["seconds"] += entry["seconds"]
+        total["calls"] += entry["calls"]
+        if entry.get("peak_rss_mb") is not None:
+            total["peak_rss_mb"] = max(total.get("peak_rss_mb") or 0.0, entry["peak_rss_mb"])
+    for name, value in counters.items():
+        count(name, value)
+
+
+class Progress:
+    """
+    Progress bar for a known number of steps, redrawn at most once per interval.
+    """
+
+    def __init__(self, total, label, interval=0.5, stream=None):
+        """
+        Args:
+            total (int): Number of steps.
+            label (str): Text shown before the bar.
+            interval (float): Minimum seconds between redraws.
+            stream (file, optional): Stream to draw on, stderr if omitted.
+        """
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_draw = None
+
+    def update(self, steps=1):
+        self.done += steps
+        now = time.perf_counter()
+        if self.last_draw is None or now - self.last_draw >= self.interval or self.done >= self.total:
+            self.last_draw = now
+            self.draw(now)
+
+    def draw(self, now):
+        fraction = self.done / self.total if self.total else 1.0
+        filled = int(fraction * 30)
+        elapsed = now - self.start
+        remaining = elapsed / self.done * (self.total - self.done) if self.done else 0.0
+        self.stream.write(f"\r{self.label}: [{'#' * filled}{'.' * (30 - filled)}] {self.done}/{self.total} "
+                          f"{elapsed:.1f}s elapsed, {remaining:.1f}s left")
+        self.stream.flush()
+
+    def close(self):
+        if self.last_draw is None or self.done < self.total:
+            self.draw(time.perf_counter())
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+class RuleLog:
+    """
+    Optional JSON-lines log with the cost of every rule, one object per line.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): Path of the log, no log is written if omitted.
+        """
+        self.file = open(path, 'w') if path else None
+
+    def write(self, index, rule, seconds, **counts):
+        if self.file is None:
+            return
+        record = {"rule": index, "head": rule.get("Rule Head"), "body": rule.get("Rule Body"), "seconds": seconds}
+        record.update(counts)
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_report(path, script, args, start_time):
+    """
+    Write the JSON run report of a script: its arguments, wall time, peak memory,
+    and the time, calls and counters of every stage.
+
+    Args:
+        path (str): Path of the report.
+        script (str): Name of the script.
+        args (argparse.Namespace): Parsed command-line arguments.
+        start_time (float): time.perf_counter() at the start of the run.
+    """
+    report = {
+        "script": script,
+        "args": vars(args),
+        "wall_seconds": time.perf_counter() - start_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_children_mb": peak_rss_mb(children=True),
+        "stages": _stages,
+        "counters": _counters,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=4)
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def expand_matches(keys, sorted_keys):
+    """
+    Match every key against a sorted array, returning all (key, match) index pairs.
+
+    Args:
+        keys (np.ndarray): Keys to probe with.
+        sorted_keys (np.ndarray): Sorted keys to probe into.
+
+    Returns:
+        tuple: Index arrays into keys and into sorted_keys, one entry per match.
+    """
+    low = np.searchsorted(sorted_keys, keys, side='left')
+    high = np.searchsorted(sorted_keys, keys, side='right')
+    counts = high - low
+    left = np.repeat(np.arange(len(keys)), counts)
+    # Position of each match inside its run of equal keys
+    starts = np.cumsum(counts) - counts
+    right = np.arange(counts.sum()) - np.repeat(starts - low, counts)
+    return left, right
+
+
+def ground_two_hop(store, first, second, split="train"):
+    """
+    Ground the rule body first(X, Y), second(Y, Z) by joining on Y.
+
+    The second predicate's rows are already sorted by head in the store, so every
+    tail of the first predicate is probed against them with a binary search.
+    Every matching (X, Y, Z) path is produced once, so the result holds the same
+    groundings, with the same multiplicity, as a nested loop over both predicates.
+
+    Args:
+        store (TripleStore): Store holding the split.
+        first (int or str): Predicate of the first body atom.
+        second (int or str): Predicate of the second body atom.
+        split (str): Split to ground the body in.
+
+    Returns:
+        tuple: X, Y and Z int32 arrays, one entry per grounding of the body.
+    """
+    heads1, tails1 = store.pairs(split, first)
+    heads2, tails2 = store.pairs(split, second)
+    left, right = expand_matches(tails1, heads2)
+    return heads1[left], tails1[left], tails2[right]
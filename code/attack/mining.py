@@ -0,0 +1,237 @@
+import itertools
+import json
+import os
+import time
+from functools import partial
+
+import numpy as np
+
+from .instrument import Progress, call_timed, count, merge, stage, write_report
+from .join import expand_matches
+from .parallel import map_rules
+from .pipeline import ADD_DIR, import_script, resolve
+from .sparse import adjacency_matrices, inverse_name, nonzero_pairs, require_scipy
+from .triple_store import TripleStore
+
+
+class RuleMiner:
+    """
+    Miner of path rules of length 1 to 3 over one split of a triple store.
+
+    Rules follow the conventions of the rule files the attacks read:
+    a length-1 rule {"Rule Head": [h], "Rule Body": [r]} states
+    r(X, Y) => h(Y, X), and a longer rule with body [r1, ..., rk] states
+    r1(X, Y1), ..., rk(Yk-1, Z) => h(X, Z). Bodies and heads range over every
+    relation and its "inv_" inverse.
+
+    Every relation is a sparse boolean adjacency matrix; the body pairs of a
+    longer rule are the non-zeros of the product of its matrices, found once
+    per body and matched against the pairs of every head at once.
+    A rule's support is the number of body pairs its head holds for, its head
+    coverage the support over the head's number of pairs, and its confidence
+    the support over the number of body pairs.
+    """
+
+    def __init__(self, store, split="train"):
+        """
+        Args:
+            store (TripleStore): Store holding the split to mine.
+            split (str): Name of the split.
+        """
+        require_scipy("Rule mining")
+        self.num_entities = len(store.entities)
+        with stage("adjacency"):
+            self.matrices = adjacency_matrices(store, split)
+            self.relations = list(self.matrices)
+
+            # Sorted (X, Z) keys of every head relation's pairs, to count supports by binary search
+            keys, head_ids = [], []
+            for index, name in enumerate(self.relations):
+                keys.append(self._pair_keys(self.matrices[name]))
+                head_ids.append(np.full(len(keys[-1]), index, dtype=np.int32))
+            keys, head_ids = np.concatenate(keys), np.concatenate(head_ids)
+            order = np.argsort(keys, kind='stable')
+            self.head_keys = keys[order]
+            self.head_ids = head_ids[order]
+            self.head_sizes = np.bincount(head_ids, minlength=len(self.relations))
+
+    def _pair_keys(self, matrix):
+        # Keys of the non-zero (row, column) pairs of a CSR matrix
+        rows, columns = nonzero_pairs(matrix)
+        return rows * self.num_entities + columns
+
+    def supports(self, body_keys):
+        """
+        Count, for every head relation, the body pairs it holds for.
+
+        Args:
+            body_keys (np.ndarray): Distinct (X, Z) keys of the body pairs.
+
+        Returns:
+            np.ndarray: Support of the body for every relation in self.relations.
+        """
+        _, matches = expand_matches(body_keys, self.head_keys)
+        return np.bincount(self.head_ids[matches], minlength=len(self.relations))
+
+    def body_pairs(self, body):
+        """
+        Get the distinct (X, Z) keys of the pairs a body holds for, X != Z.
+
+        Args:
+            body (tuple): Relation names of the body atoms.
+
+        Returns:
+            np.ndarray: int64 keys.
+        """
+        if len(body) == 1:
+            # r(X, Y) => h(Y, X): the pairs are those of the inverse
+            matrix = self.matrices[inverse_name(body[0])]
+        else:
+            matrix = self.matrices[body[0]]
+            for relation in body[1:]:
+                matrix = (matrix @ self.matrices[relation]).tocsr()
+                # Only whether a path exists matters, and path counts could overflow
+                matrix.data[:] = 1
+            matrix.setdiag(0)
+            matrix.eliminate_zeros()
+        count("body pairs", matrix.nnz)
+        return self._pair_keys(matrix)
+
+    def mine_body(self, body, min_support=2, min_head_coverage=0.01, min_conf=0.0):
+        """
+        Mine the rules of one body, and of its mirrored body for lengths 2 and up.
+
+        The mirrored body of r1, ..., rk is inv_rk, ..., inv_r1, whose body pairs
+        are the swapped pairs of r1, ..., rk, so the rule r1, ..., rk => h has the
+        same support and confidence as inv_rk, ..., inv_r1 => inv_h.
+
+        Returns:
+            list: Rules with "Rule Head", "Rule Body", "conf", "Support" and "Head Coverage" fields.
+        """
+        with stage("product"):
+            body_keys = self.body_pairs(body)
+        if not len(body_keys):
+            return []
+        with stage("support"):
+            supports = self.supports(body_keys)
+
+        bodies = [list(body)]
+        mirrored = [inverse_name(relation) for relation in reversed(body)]
+        if len(body) >= 2 and mirrored != bodies[0]:
+            bodies.append(mirrored)
+        rules = []
+        for head in np.flatnonzero(supports >= max(min_support, 1)):
+            name = self.relations[head]
+            support = int(supports[head])
+            head_coverage = support / self.head_sizes[head]
+            conf = support / len(body_keys)
+            # r(X, Y) => inv_r(Y, X) always holds
+            if len(body) == 1 and name == inverse_name(body[0]):
+                continue
+            if head_coverage < min_head_coverage or conf < min_conf:
+                continue
+            for index, rule_body in enumerate(bodies):
+                rules.append({
+                    "Rule Head": [name if index == 0 else inverse_name(name)],
+                    "Rule Body": rule_body,
+                    "conf": round(conf, 4),
+                    "Support": support,
+                    "Head Coverage": round(float(head_coverage), 4),
+                })
+        return rules
+
+    def bodies(self, max_length=2):
+        """
+        List the bodies to mine: every relation, and every sequence of up to max_length
+        relations that is not the mirror of a sequence listed before it.
+        """
+        bodies = [(relation,) for relation in self.relations]
+        for length in range(2, max_length + 1):
+            for body in itertools.product(self.relations, repeat=length):
+                if body <= tuple(inverse_name(relation) for relation in reversed(body)):
+                    bodies.append(body)
+        return bodies
+
+
+def _mine_body(body, state):
+    miner, options = state
+    return miner.mine_body(body, **options)
+
+
+def mine_rules(store, split="train", max_length=2, workers=1, **options):
+    """
+    Mine path rules of length 1 to max_length, spreading the bodies across processes.
+
+    Args:
+        store (TripleStore): Store holding the split to mine.
+        split (str): Name of the split.
+        max_length (int): Maximum number of body atoms, 1 to 3.
+        workers (int): Number of worker processes.
+        **options: min_support, min_head_coverage and min_conf passed to RuleMiner.mine_body.
+
+    Returns:
+        list: The rules, by decreasing confidence.
+    """
+    miner = RuleMiner(store, split)
+    bodies = miner.bodies(max_length)
+    progress = Progress(len(bodies), "Mining rule bodies")
+    rules = []
+    results = map_rules(partial(call_timed, _mine_body), bodies, (miner, options), workers)
+    for body_rules, _, stages, counters in results:
+        merge(stages, counters)
+        rules += body_rules
+        progress.update()
+    progress.close()
+    count("rules", len(rules))
+    rules.sort(key=lambda rule: (-rule["conf"], rule["Rule Head"], rule["Rule Body"]))
+    return rules
+
+
+def split_rules(rules, threshold):
+    """
+    Split rules into high-confidence rules, whose confidence is at least threshold, and the others.
+
+    Returns:
+        tuple: Lists of the high- and low-confidence rules, in their original order.
+    """
+    high_conf_rules = [rule for rule in rules if rule["conf"] >= threshold]
+    low_conf_rules = [rule for rule in rules if rule["conf"] < threshold]
+    return high_conf_rules, low_conf_rules
+
+
+def save_rules(rules, path):
+    """
+    Write rules to a JSON file, in the layout of the rule files the attacks read.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as output_file:
+        json.dump(rules, output_file, indent=4)
+
+
+def run_mine(args):
+    """
+    Mine the rules of a dataset's training set and split them by confidence.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of `python -m attack mine`.
+    """
+    start_time = time.perf_counter()
+    config = import_script(ADD_DIR, "config")
+    dataset = args.dataset
+    with stage("parse"):
+        store = TripleStore.from_dict_files(resolve(ADD_DIR, config.ENTITIES_DICT_PATH, dataset),
+                                            resolve(ADD_DIR, config.RELATIONS_DICT_PATH, dataset))
+        store.load_split("train", resolve(ADD_DIR, config.ORIGINAL_TRAIN_PATH, dataset))
+
+    rules = mine_rules(store, "train", args.max_length, args.workers, min_support=args.min_support,
+                       min_head_coverage=args.min_head_coverage, min_conf=args.min_conf)
+    high_conf_rules, low_conf_rules = split_rules(rules, args.high_conf_threshold)
+
+    with stage("write"):
+        for name, selected in (("HIGH", high_conf_rules), ("LOW", low_conf_rules)):
+            path = resolve(ADD_DIR, getattr(config, f"MINED_{name}_CONF_RULES_PATH"), dataset, dataset)
+            save_rules(selected, path)
+            print(f"Number of {name.lower()}-confidence rules: {len(selected)} in {path}")
+    write_report(resolve(ADD_DIR, config.MINED_REPORT_PATH, dataset, dataset), "mine", args, start_time)
@@ -0,0 +1,45 @@
+import multiprocessing
+
+# Set in each worker by _init_worker. Forked workers inherit the rules and the
+# store, including its memory-mapped arrays, instead of receiving a pickled
+# copy with every task; only rule indexes and results cross the process boundary.
+_worker_payload = None
+
+
+def _init_worker(payload):
+    global _worker_payload
+    _worker_payload = payload
+
+
+def _run_task(index):
+    function, rules, state = _worker_payload
+    return function(rules[index], state)
+
+
+def map_rules(function, rules, state, workers=1):
+    """
+    Apply a per-rule function to every rule, optionally across a process pool.
+
+    Results are yielded in rule order regardless of which worker produced them,
+    so merging them gives the same output as a single-process run.
+
+    Args:
+        function (callable): Module-level function called as function(rule, state).
+        rules (list): Rules to process.
+        state: Shared read-only state, e.g. the triple store. It is inherited by
+            forked workers, or sent once per worker where fork is unavailable.
+        workers (int): Number of worker processes, 1 to run in this process.
+
+    Yields:
+        The result of function for each rule, in order.
+    """
+    if workers <= 1 or len(rules) <= 1:
+        for rule in rules:
+            yield function(rule, state)
+        return
+
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    context = multiprocessing.get_context(method)
+    with context.Pool(min(workers, len(rules)), initializer=_init_worker,
+                      initargs=((function, rules, state),)) as pool:
+        yield from pool.imap(_run_task, range(len(rules)))
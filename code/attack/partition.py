@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+from .instrument import count, stage
+
+# Files of a dataset directory that relation files must never replace
+SPLIT_FILES = ("train.txt", "valid.txt", "test.txt")
+
+
+def relation_file_name(relation):
+    """
+    Name the file of one relation's triples, e.g. `_hypernym.txt`.
+
+    The slashes of Freebase relations are replaced with dots, so
+    `/people/person/nationality` becomes `people.person.nationality.txt`.
+    """
+    return relation.strip('/').replace('/', '.') + '.txt'
+
+
+class RelationWriters:
+    """
+    Buffered writers of one file per relation, sharing a bounded pool of open files.
+
+    Lines are buffered per relation and written once a relation's buffer reaches
+    buffer_size bytes, so every file is written in large blocks. At most max_open
+    files are open at once; the least recently written one is closed to make room
+    and reopened for appending later. Lines go to temporary files that replace
+    the outputs only in commit(), so an interrupted run leaves the previous files
+    untouched and a rerun never appends to them.
+    """
+
+    def __init__(self, output_dir, buffer_size=1 << 20, max_open=64, reserved=SPLIT_FILES):
+        """
+        Args:
+            output_dir (str): Directory of the relation files.
+            buffer_size (int): Bytes buffered per relation before they are written.
+            max_open (int): Maximum number of files open at once.
+            reserved (iterable): Names of files in output_dir no relation file may replace.
+        """
+        self.output_dir = output_dir
+        self.reserved = set(reserved)
+        self.file_names = {}
+        self.buffer_size = buffer_size
+        self.max_open = max_open
+        self.buffers = {}
+        self.buffered = {}
+        self.lines = {}
+        self.files = OrderedDict()
+        self.temp_paths = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, relation, line):
+        if relation not in self.buffers:
+            file_name = relation_file_name(relation)
+            if file_name in self.reserved:
+                raise ValueError(f"The file of relation {relation!r} would replace {file_name} in {self.output_dir}")
+            if file_name in self.file_names:
+                raise ValueError(f"Relations {self.file_names[file_name]!r} and {relation!r} have the same file "
+                                 f"{file_name} in {self.output_dir}")
+            self.file_names[file_name] = relation
+            self.buffers[relation] = []
+            self.buffered[relation] = 0
+            self.lines[relation] = 0
+            self.temp_paths[relation] = os.path.join(
+                self.output_dir, f".{relation_file_name(relation)}.tmp-{os.getpid()}")
+        self.buffers[relation].append(line)
+        self.buffered[relation] += len(line)
+        self.lines[relation] += 1
+        if self.buffered[relation] >= self.buffer_size:
+            self.flush(relation)
+
+    def flush(self, relation):
+        """Write the buffered lines of a relation to its temporary file."""
+        if not self.buffers[relation]:
+            return
+        output_file = self.files.pop(relation, None)
+        if output_file is None:
+            if len(self.files) >= self.max_open:
+                _, oldest = self.files.popitem(last=False)
+                oldest.close()
+            # The first flush creates the file, later ones append to it
+            output_file = open(self.temp_paths[relation], 'ab' if os.path.exists(self.temp_paths[relation]) else 'wb')
+        self.files[relation] = output_file
+        output_file.write(b''.join(self.buffers[relation]))
+        count("partition writes")
+        self.buffers[relation] = []
+        self.buffered[relation] = 0
+
+    def commit(self):
+        """
+        Flush every buffer and move the temporary files over the relation files.
+
+        Returns:
+            dict: Mapping from relation to the path of its file, in first-seen order.
+        """
+        for relation in self.buffers:
+            self.flush(relation)
+        self.close_files()
+        paths = {}
+        for relation, temp_path in self.temp_paths.items():
+            paths[relation] = os.path.join(self.output_dir, relation_file_name(relation))
+            os.replace(temp_path, paths[relation])
+        self.temp_paths = {}
+        return paths
+
+    def close_files(self):
+        while self.files:
+            self.files.popitem()[1].close()
+
+    def close(self):
+        """Close the open files and delete the temporary files that were not committed."""
+        self.close_files()
+        for temp_path in self.temp_paths.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_grouped(paths, lines, grouped_path, index_path):
+    """
+    Concatenate the relation files into one file grouped by relation, and index its slices.
+
+    Args:
+        paths (dict): Mapping from relation to the path of its file, in the order to concatenate them.
+        lines (dict): Mapping from relation to its number of lines.
+        grouped_path (str): Path of the grouped file.
+        index_path (str): Path of the JSON index, mapping every relation to the byte
+            offset, byte length and number of lines of its slice in the grouped file.
+    """
+    index = {"file": os.path.basename(grouped_path), "relations": {}}
+    temp_path = f"{grouped_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as grouped_file:
+        for relation, path in paths.items():
+            offset = grouped_file.tell()
+            with open(path, 'rb') as relation_file:
+                shutil.copyfileobj(relation_file, grouped_file, 1 << 20)
+            index["relations"][relation] = {"offset": offset, "length": grouped_file.tell() - offset,
+                                            "lines": lines[relation]}
+    os.replace(temp_path, grouped_path)
+    temp_path = f"{index_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'w') as index_file:
+        json.dump(index, index_file, indent=4)
+    os.replace(temp_path, index_path)
+
+
+def partition_by_relation(input_path, output_dir, relations=None, index=False, buffer_size=1 << 20, max_open=64):
+    """
+    Split a file of tab-separated triples into one file per relation in a single pass.
+
+    Lines keep their order within each relation. Lines that are not triples are skipped.
+    A relation whose file would replace the input file, a dataset split or the grouped
+    file, or the file of another relation, raises a ValueError before anything is replaced.
+
+    Args:
+        input_path (str): Path of the triples file, e.g. `test.txt`.
+        output_dir (str): Directory of the relation files, named by relation_file_name().
+        relations (iterable, optional): Relations to write, all if omitted.
+        index (bool): Also write the lines grouped by relation to `<split>_by_relation.txt`
+            in output_dir, with an offset index `<split>_by_relation.json`, so readers can
+            seek to one relation's slice without reading the others.
+        buffer_size (int): Bytes buffered per relation before they are written.
+        max_open (int): Maximum number of relation files open at once.
+
+    Returns:
+        dict: Mapping from relation to its number of lines, in first-seen order.
+    """
+    relations = None if relations is None else set(relations)
+    split = os.path.splitext(os.path.basename(input_path))[0]
+    reserved = set(SPLIT_FILES) | {f"{split}_by_relation.txt"}
+    if os.path.abspath(os.path.dirname(input_path)) == os.path.abspath(output_dir):
+        reserved.add(os.path.basename(input_path))
+    skipped = 0
+    with stage("partition"), RelationWriters(output_dir, buffer_size, max_open, reserved) as writers:
+        with open(input_path, 'rb') as input_file:
+            for line in input_file:
+                parts = line.rstrip(b'\r\n').split(b'\t')
+                if len(parts) != 3:
+                    skipped += 1
+                    continue
+                relation = parts[1].decode('utf-8')
+                if relations is not None and relation not in relations:
+                    continue
+                writers.write(relation, line if line.endswith(b'\n') else line + b'\n')
+        paths = writers.commit()
+        lines = dict(writers.lines)
+    count("skipped lines", skipped)
+    count("partitioned lines", sum(lines.values()))
+
+    if index:
+        with stage("index"):
+            write_grouped(paths, lines, os.path.join(output_dir, f"{split}_by_relation.txt"),
+                          os.path.join(output_dir, f"{split}_by_relation.json"))
+    return lines
+
+
+def read_relation(index_path, relation):
+    """
+    Read one relation's lines from a grouped file written by partition_by_relation(index=True).
+
+    Args:
+        index_path (str): Path of the `<split>_by_relation.json` index.
+        relation (str): Name of the relation.
+
+    Returns:
+        list: The relation's lines, without line endings; empty if it has none.
+    """
+    with open(index_path, 'r') as index_file:
+        index = json.load(index_file)
+    entry = index["relations"].get(relation)
+    if entry is None:
+        return []
+    with open(os.path.join(os.path.dirname(index_path), index["file"]), 'rb') as grouped_file:
+        grouped_file.seek(entry["offset"])
+        return grouped_file.read(entry["length"]).decode('utf-8').splitlines()
+
+
+def run_partition(args):
+    """
+    Split every given triples file by relation.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of `python -m attack partition`.
+    """
+    for input_path in args.files:
+        split = os.path.splitext(os.path.basename(input_path))[0]
+        output_dir = args.output_dir or os.path.join(os.path.dirname(input_path), f"{split}_by_relation")
+        lines = partition_by_relation(input_path, output_dir, args.relations, args.index, max_open=args.max_open)
+        print(f"Split {sum(lines.values())} triples of {input_path} into {len(lines)} relation files in {output_dir}")
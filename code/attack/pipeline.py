@@ -0,0 +1,280 @@
+import importlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .budget import budget_label, budget_size, count_lines
+from .cache import StageManifest, load_cached_store
+from .columnar import FORMATS, columnar_path, write_triple_lines
+from .incremental import GroundingCache
+from .influence import score_rules
+from .instrument import count, counter, stage, write_report
+from .plan import FanoutCap, SubpathCache
+from .stream import KeySet
+from .triple_store import TripleStore
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADD_DIR = "add_attack"
+DEL_DIR = "del_attack"
+
+
+def import_script(directory, name):
+    """
+    Import one of the attack scripts, or their config module.
+
+    The add and del scripts each import their own `config` module, so the one
+    cached by a previous import is dropped first.
+
+    Args:
+        directory (str): Directory of the script, relative to the code directory.
+        name (str): Module name of the script.
+
+    Returns:
+        module: The imported module.
+    """
+    sys.modules.pop("config", None)
+    sys.path.insert(0, os.path.join(CODE_DIR, directory))
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.pop(0)
+
+
+def resolve(directory, template, *values):
+    """
+    Resolve a config path, written relative to a script directory, against the code directory.
+    """
+    return os.path.normpath(os.path.join(CODE_DIR, directory, template.format(*values)))
+
+
+def report_fanout(fanout_cap):
+    """
+    Print how many groundings the fan-out cap dropped, if one was set.
+    """
+    if fanout_cap is not None:
+        print(f"Fan-out cap: {counter('fan-out dropped groundings')} groundings dropped "
+              f"through {counter('fan-out capped entities')} capped join entities")
+
+
+def run_add(args, start_time):
+    """
+    Run the addition attack: generate the negative rules, ground them and sample
+    the adversarial triples added to the training set.
+
+    The negative rules are passed to grounding in memory. Only the sampled
+    triples and the poisoned training set are written, plus the negative rules,
+    top relations and all candidate triples with --save-intermediates.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of `python -m attack run`.
+        start_time (float): time.perf_counter() at the start of the run.
+    """
+    config = import_script(ADD_DIR, "config")
+    neg_rules = import_script(ADD_DIR, "generate_neg_rules")
+    neg_triples = import_script(ADD_DIR, "generate_neg_triples")
+    dataset = args.dataset
+    manifest = StageManifest(resolve(ADD_DIR, config.PIPELINE_MANIFEST_PATH, dataset, dataset))
+
+    rule_inputs = {
+        name: resolve(ADD_DIR, getattr(config, name), dataset, dataset)
+        for name in ("RELATION_MATRIX_PATH", "RELATION_TO_NUMBER_PATH", "LOW_CONF_RULES_PATH",
+                     "INDICES_PATH", "HIGH_CONF_RULES_PATH")
+    }
+    rules_path = resolve(ADD_DIR, config.OUTPUT_NEGATIVE_RULES_PATH, dataset, dataset)
+    top_relations_path = resolve(ADD_DIR, config.OUTPUT_TOP1_RELATIONS_DICT_PATH, dataset, dataset)
+    rules_key = manifest.key("negative rules", {"top_n": args.top_n}, rule_inputs.values())
+
+    split_paths = {
+        "train": resolve(ADD_DIR, config.TRAIN_FILE_PATH, dataset, dataset),
+        "valid": resolve(ADD_DIR, config.VALID_FILE_PATH, dataset),
+        "test": resolve(ADD_DIR, config.TEST_FILE_PATH, dataset),
+    }
+    entities_path = resolve(ADD_DIR, config.ENTITIES_DICT_PATH, dataset)
+    relations_path = resolve(ADD_DIR, config.RELATIONS_DICT_PATH, dataset)
+    original_train = resolve(ADD_DIR, config.ORIGINAL_TRAIN_PATH, dataset)
+    tp_path = resolve(ADD_DIR, config.OUTPUT_TP_FILE_PATH, dataset, dataset)
+    budgets = [(size, resolve(ADD_DIR, sel_path), resolve(ADD_DIR, train_path)) for size, sel_path, train_path in
+               neg_triples.attack_budgets(dataset, args.budgets, count_lines(original_train) if args.budgets else None)]
+    outputs = [path for _, sel_path, train_path in budgets for path in (sel_path, train_path)]
+    if args.columnar_format:
+        outputs += [columnar_path(path, args.columnar_format) for path in outputs]
+    triples_key = manifest.key(
+        "adversarial triples",
+        {"seed": args.seed, "max_groundings": args.max_groundings, "max_fanout": args.max_fanout,
+         "fanout_strategy": args.fanout_strategy, "sample_sizes": [size for size, _, _ in budgets]},
+        list(split_paths.values()) + [entities_path, relations_path, original_train],
+        upstream=[rules_key])
+    if not args.force and manifest.is_current("adversarial triples", triples_key, outputs):
+        print("Poisoned training sets are up to date, skipping the addition attack")
+        return
+
+    # Negative rules, read back only if a previous run saved them from the same inputs
+    if not args.force and manifest.is_current("negative rules", rules_key, [rules_path]):
+        print(f"Negative rules are up to date, loading {rules_path}")
+        with stage("parse"):
+            rules = neg_rules.load_json(rules_path)
+    else:
+        with stage("parse"):
+            relation_matrix = neg_rules.load_relation_matrix(rule_inputs["RELATION_MATRIX_PATH"])
+            _, number_to_relation = neg_rules.load_relation_mappings(rule_inputs["RELATION_TO_NUMBER_PATH"])
+            low_conf_rules = neg_rules.load_json(rule_inputs["LOW_CONF_RULES_PATH"])
+            indices = neg_rules.load_txt(rule_inputs["INDICES_PATH"])
+            high_conf_rules = neg_rules.load_json(rule_inputs["HIGH_CONF_RULES_PATH"])
+        with stage("top relations"):
+            top_relations_dict = neg_rules.generate_top_relations(relation_matrix, number_to_relation, top_n=args.top_n)
+        with stage("generate"):
+            new_rules = neg_rules.generate_new_rules(low_conf_rules, indices, top_relations_dict)
+        with stage("filter rules"):
+            rules = neg_rules.filter_existing_rules(new_rules, high_conf_rules)
+        if args.save_intermediates:
+            with stage("write"):
+                neg_rules.save_json(top_relations_dict, top_relations_path)
+                neg_rules.save_json(rules, rules_path)
+            manifest.record("negative rules", rules_key, [rules_path, top_relations_path])
+    count("negative rules", len(rules))
+
+    # Adversarial triples
+    store = load_cached_store(None if args.no_cache else resolve(ADD_DIR, config.STORE_CACHE_PATH, dataset, dataset),
+                              split_paths, entities_path, relations_path)
+    memory_budget = args.memory_budget * 2 ** 20 if args.memory_budget is not None else None
+    subpath_cache = SubpathCache(args.subpath_cache_size * 2 ** 20) if args.subpath_cache_size > 0 else None
+    fanout_cap = FanoutCap(args.max_fanout, args.fanout_strategy, args.seed or 0) if args.max_fanout else None
+    with KeySet(memory_budget, spill_dir=os.path.dirname(tp_path)) as key_set:
+        grounding_cache = (GroundingCache(resolve(ADD_DIR, config.GROUNDING_CACHE_PATH, dataset, dataset), store,
+                                          ("train", "valid", "test")) if args.incremental else None)
+        tp = neg_triples.generate_triples(rules, store, args.workers, args.max_groundings, subpath_cache,
+                                          fanout_cap=fanout_cap, grounding_cache=grounding_cache)
+        processed_triples = neg_triples.process_triples(tp, rules, store, key_set)
+        num_triples = neg_triples.save_triples(processed_triples, store, tp_path if args.save_intermediates else None,
+                                               original_train, budgets, args.seed, args.columnar_format)
+    if grounding_cache is not None:
+        grounding_cache.save()
+    # Without a seed every run samples different triples, so the next run samples again
+    manifest.record("adversarial triples", triples_key, outputs, reproducible=args.seed is not None)
+    print(f"Number of unique triples: {num_triples}")
+    report_fanout(fanout_cap)
+
+    write_report(resolve(ADD_DIR, config.RUN_REPORT_PATH, dataset, dataset, "pipeline"), "pipeline add", args, start_time)
+
+
+def run_del(args, start_time):
+    """
+    Run the deletion attack: ground the high-confidence rules, score every
+    training triple by the confidence of the instances it supports, and delete
+    the top-scoring ones.
+
+    Scores are passed to the selection in memory. Only the reduced training set
+    is written, plus the score vector with --save-intermediates and the
+    instances file with --instances-format.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of `python -m attack run`.
+        start_time (float): time.perf_counter() at the start of the run.
+    """
+    config = import_script(DEL_DIR, "config")
+    del_instances = import_script(DEL_DIR, "generate_del_instances")
+    del_triples = import_script(DEL_DIR, "generate_del_triples")
+    dataset = args.dataset
+    manifest = StageManifest(resolve(DEL_DIR, config.PIPELINE_MANIFEST_PATH, dataset, dataset))
+
+    rules_path = resolve(DEL_DIR, config.RULES_JSON_FILE_PATH, dataset, dataset)
+    split_paths = {
+        "train": resolve(DEL_DIR, config.TRAIN_ALL_FILE_PATH, dataset, dataset),
+        "original": resolve(DEL_DIR, config.TRAIN_FILE_PATH, dataset),
+    }
+    entities_path = resolve(DEL_DIR, config.ENTITIES_DICT_PATH, dataset)
+    relations_path = resolve(DEL_DIR, config.RELATIONS_DICT_PATH, dataset)
+    scores_path = resolve(DEL_DIR, config.OUTPUT_SCORES_FILE_PATH, dataset, dataset)
+    if args.budgets:
+        percents = sorted(set(args.budgets))
+        num_train = count_lines(split_paths["original"])
+        limits = [budget_size(percent, num_train) for percent in percents]
+        train_paths = [resolve(DEL_DIR, config.BUDGET_TRAIN_FILE_PATH, dataset, budget_label(percent))
+                       for percent in percents]
+    else:
+        limits = [config.SORT_LIMIT]
+        train_paths = [resolve(DEL_DIR, config.OUTPUT_TRAIN_FILE_PATH, dataset)]
+    scores_key = manifest.key("triple scores", {"max_groundings": args.max_groundings, "max_fanout": args.max_fanout,
+                                                "fanout_strategy": args.fanout_strategy, "engine": args.engine},
+                              [rules_path, entities_path, relations_path] + list(split_paths.values()))
+    outputs = list(train_paths)
+    if args.columnar_format:
+        outputs += [columnar_path(path, args.columnar_format) for path in train_paths]
+    select_key = manifest.key("deleted triples", {"limits": limits}, [split_paths["original"]], upstream=[scores_key])
+    if not args.force and not args.instances_format and manifest.is_current("deleted triples", select_key, outputs):
+        print("Reduced training sets are up to date, skipping the deletion attack")
+        return
+
+    # Scores of the training triples, read back only if a previous run saved them from the same inputs
+    if not args.force and not args.instances_format and manifest.is_current("triple scores", scores_key, [scores_path]):
+        print(f"Triple scores are up to date, loading {scores_path}")
+        with stage("parse"):
+            scores = np.load(scores_path)
+    else:
+        store = load_cached_store(None if args.no_cache else resolve(DEL_DIR, config.STORE_CACHE_PATH, dataset, dataset),
+                                  split_paths, entities_path, relations_path)
+        with stage("parse"), open(rules_path, "r") as json_file:
+            rules = json.load(json_file)
+        count("rules", len(rules))
+
+        sorted_scores = np.zeros(len(store.triples["original"]), dtype=np.float64)
+        if args.engine == "sparse":
+            score_rules(rules, store, sorted_scores, args.workers)
+            print(f"The number of rule instances: {counter('instances')}")
+        else:
+            subpath_cache = SubpathCache(args.subpath_cache_size * 2 ** 20) if args.subpath_cache_size > 0 else None
+            fanout_cap = FanoutCap(args.max_fanout, args.fanout_strategy) if args.max_fanout else None
+            grounding_cache = (GroundingCache(resolve(DEL_DIR, config.GROUNDING_CACHE_PATH, dataset, dataset), store,
+                                              ("train",)) if args.incremental else None)
+            instances = del_instances.generate_instances(rules, store, args.workers, args.max_groundings, subpath_cache,
+                                                         fanout_cap=fanout_cap, grounding_cache=grounding_cache)
+            instances = del_instances.accumulate_confidence(instances, store, sorted_scores)
+            instances_path = resolve(DEL_DIR, config.OUTPUT_INSTANCES_JSONL_FILE_PATH if args.instances_format == "jsonl"
+                                     else config.OUTPUT_INSTANCES_FILE_PATH, dataset, dataset)
+            if args.instances_format in FORMATS:
+                instances_path = columnar_path(instances_path, args.instances_format)
+            num_instances = del_instances.save_instances_to_file(instances, instances_path, store,
+                                                                 args.instances_format or "none", rules)
+            print(f"The number of generated instances: {num_instances}")
+            report_fanout(fanout_cap)
+            if grounding_cache is not None:
+                grounding_cache.save()
+        scores = store.to_file_order("original", sorted_scores)
+        if args.save_intermediates:
+            with stage("write"):
+                np.save(scores_path, scores)
+            manifest.record("triple scores", scores_key, [scores_path])
+
+    # Deleted triples
+    with stage("select"):
+        conf_count = del_triples.confidence_from_scores(scores, split_paths["original"])
+        remaining_per_budget = del_triples.exclude_top_triples_per_budget(split_paths["original"], conf_count, limits)
+    vocabularies = TripleStore.from_dict_files(entities_path, relations_path) if args.columnar_format else None
+    for remaining_lines, train_path in zip(remaining_per_budget, train_paths):
+        with stage("write"):
+            os.makedirs(os.path.dirname(train_path), exist_ok=True)
+            del_triples.save_remaining_lines(remaining_lines, train_path)
+            if vocabularies is not None:
+                write_triple_lines(columnar_path(train_path, args.columnar_format), vocabularies, remaining_lines,
+                                   args.columnar_format)
+        print(f"Number of remaining triples: {len(remaining_lines)} in {train_path}")
+    manifest.record("deleted triples", select_key, outputs)
+
+    write_report(resolve(DEL_DIR, config.RUN_REPORT_PATH, dataset, dataset, "pipeline"), "pipeline del", args, start_time)
+
+
+def run(args):
+    """
+    Run one attack end to end in this process.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of `python -m attack run`.
+    """
+    start_time = time.perf_counter()
+    if args.mode == "add":
+        run_add(args, start_time)
+    else:
+        run_del(args, start_time)
@@ -0,0 +1,443 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from .instrument import count
+
+
+class Segment:
+    """
+    Groundings of a contiguous run of body atoms, as columns of entity IDs.
+
+    In "paths" mode the columns are every variable of the run, with one row per
+    path; in "endpoints" mode only the first and last variable are kept and rows
+    are distinct (start, end) pairs.
+    """
+
+    def __init__(self, first, last, columns, sorted_by_start=False):
+        self.first = first
+        self.last = last
+        self.columns = columns
+        self.sorted_by_start = sorted_by_start
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    @property
+    def start(self):
+        return self.columns[0]
+
+    @property
+    def end(self):
+        return self.columns[-1]
+
+    def take(self, rows):
+        return Segment(self.first, self.last, [column[rows] for column in self.columns])
+
+    def sort_by_start(self):
+        if self.sorted_by_start:
+            return self
+        segment = self.take(np.argsort(self.start, kind="stable"))
+        segment.sorted_by_start = True
+        return segment
+
+
+class SubpathCache:
+    """
+    Size-bounded LRU cache of grounded sub-paths, keyed by split, join mode and
+    the sequence of body relations.
+
+    Rules whose bodies are identical, or share a run of relations, reuse the
+    groundings of the first rule that joined them instead of joining again.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes (int): Total size of the cached groundings; least recently used
+                entries are evicted beyond it.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get a cached segment and mark it as recently used.
+
+        Returns:
+            Segment or None: The segment, or None if it is not cached.
+        """
+        segment = self.entries.get(key)
+        if segment is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return segment
+
+    def put(self, key, segment):
+        """Cache a freshly joined segment, evicting old entries to make room."""
+        size = sum(column.nbytes for column in segment.columns)
+        if size > self.max_bytes or key in self.entries:
+            return
+        while self.bytes + size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= sum(column.nbytes for column in evicted.columns)
+        self.entries[key] = segment
+        self.bytes += size
+
+    def summary(self):
+        """
+        Returns:
+            str: Hit and miss counts and the size of the cache.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (f"Sub-path cache: {self.hits} hits, {self.misses} misses ({rate:.1%} hit rate), "
+                f"{len(self.entries)} entries, {self.bytes / 2 ** 20:.1f} MB")
+
+
+class FanoutCap:
+    """
+    Limit on the groundings through a single join entity.
+
+    The fan-out of an entity Y in a join is the number of rows ending at Y on
+    the left times the number of rows starting at Y on the right. Hubs whose
+    fan-out exceeds the limit are either dropped from the join, or sampled
+    down to about the limit: at most max_fanout of their left rows are kept,
+    each joined with a random run of max_fanout // kept right rows, so every
+    grounding through the hub is kept with the same probability.
+    """
+
+    def __init__(self, max_fanout, strategy="sample", seed=0):
+        """
+        Args:
+            max_fanout (int): Maximum number of groundings through one join entity.
+            strategy (str): "sample" to keep a random subset of a hub's groundings, or
+                "drop" to skip the hub.
+            seed (int): Seed of the sampling, combined with the rule body.
+        """
+        if strategy not in ("sample", "drop"):
+            raise ValueError(f"Unknown fan-out strategy {strategy!r}")
+        self.max_fanout = max_fanout
+        self.strategy = strategy
+        self.seed = seed
+
+    def apply(self, join_entities, counts, num_entities, rng):
+        """
+        Decide how many right matches every left row keeps.
+
+        Args:
+            join_entities (np.ndarray): Join entity of every left row.
+            counts (np.ndarray): Number of right rows matching every left row.
+            num_entities (int): Size of the entity vocabulary.
+            rng (np.random.Generator): Random number generator of the sampling.
+
+        Returns:
+            tuple: Number of right matches every left row keeps, and the offset of
+                the first one within its run of matches.
+        """
+        left_degree = np.bincount(join_entities, minlength=num_entities)
+        fanout = left_degree[join_entities].astype(np.int64) * counts
+        capped = fanout > self.max_fanout
+        take = counts.copy()
+        offsets = np.zeros(len(counts), dtype=np.int64)
+        if not capped.any():
+            return take, offsets
+
+        if self.strategy == "drop":
+            take[capped] = 0
+        else:
+            rows = np.flatnonzero(capped)
+            # Keep a random max_fanout of each hub's left rows
+            priority = rng.random(len(rows))
+            order = np.lexsort((priority, join_entities[rows]))
+            hubs = join_entities[rows[order]]
+            rank = np.arange(len(order)) - np.searchsorted(hubs, hubs, side='left')
+            dropped_rows = rows[order[rank >= self.max_fanout]]
+            take[dropped_rows] = 0
+
+            kept_rows = rows[order[rank < self.max_fanout]]
+            kept = np.minimum(left_degree[join_entities[kept_rows]], self.max_fanout)
+            take[kept_rows] = np.minimum(counts[kept_rows], np.maximum(self.max_fanout // kept, 1))
+            offsets[kept_rows] = rng.integers(0, counts[kept_rows])
+
+        count("fan-out capped entities", len(np.unique(join_entities[capped])))
+        count("fan-out dropped groundings", int(counts.sum() - take.sum()))
+        return take, offsets
+
+
+class JoinPlan:
+    """
+    Join plan grounding a path rule body r1(X0, X1), r2(X1, X2), ..., rk(Xk-1, Xk).
+
+    Atoms are merged pairwise, always joining the adjacent pair whose result is
+    smallest; result sizes are computed exactly from per-entity degree counts
+    before anything is materialized. The last join is streamed in blocks so a
+    rule's groundings never have to be held in memory at once: its left side is
+    sorted, blocks never split a run of equal left rows, and every block is
+    sorted on its own, so the blocks come out already in canonical order.
+    """
+
+    def __init__(self, store, body, split="train", mode="paths", cache=None, fanout_cap=None):
+        """
+        Args:
+            store (TripleStore): Store holding the split.
+            body (list): Relation names or IDs of the body atoms, in path order.
+            split (str): Split to ground the body in.
+            mode (str): "paths" to keep every variable and every path, or "endpoints"
+                to keep only the (X0, Xk) pairs.
+            cache (SubpathCache, optional): Cache of sub-path groundings shared across rules.
+            fanout_cap (FanoutCap, optional): Limit on the groundings through one join entity.
+                Capped plans do not use the cache.
+        """
+        if mode not in ("paths", "endpoints"):
+            raise ValueError(f"Unknown join mode {mode!r}")
+        self.store = store
+        self.body = list(body)
+        self.split = split
+        self.mode = mode
+        self.num_entities = len(store.entities)
+        self.cache = cache if fanout_cap is None else None
+        self.fanout_cap = fanout_cap
+        self.body_ids = [store._relation_id(relation) for relation in self.body]
+        if fanout_cap is not None:
+            # Seeded by the rule body, so a rule samples the same groundings in any worker
+            unknown = len(store.relations)
+            self.rng = np.random.default_rng([fanout_cap.seed] + [unknown if relation is None else relation
+                                                                  for relation in self.body_ids])
+
+    def atom(self, index):
+        """
+        Get the groundings of a single body atom.
+
+        Args:
+            index (int): Position of the atom in the body.
+
+        Returns:
+            Segment: The atom's (head, tail) pairs, sorted by head.
+        """
+        heads, tails = self.store.pairs(self.split, self.body[index])
+        return Segment(index, index, [heads, tails], sorted_by_start=True)
+
+    def join_size(self, left, right):
+        """
+        Count the rows of joining two adjacent segments without materializing them.
+
+        Returns:
+            int: Exact number of joined rows.
+        """
+        left_degree = np.bincount(left.end, minlength=self.num_entities)
+        right_degree = np.bincount(right.start, minlength=self.num_entities)
+        return int(np.dot(left_degree.astype(np.int64), right_degree.astype(np.int64)))
+
+    def join(self, left, right):
+        """
+        Join two adjacent segments on the variable they share.
+
+        Args:
+            left (Segment): Segment ending at the shared variable.
+            right (Segment): Segment starting at the shared variable.
+
+        Returns:
+            Segment: The joined segment, or None if no rows join.
+        """
+        for segment in self.join_blocks(left, right):
+            return self._dedup(segment)
+        return None
+
+    def join_blocks(self, left, right, block_size=None, group_starts=None):
+        """
+        Join two adjacent segments, yielding the result in blocks.
+
+        Args:
+            left (Segment): Segment ending at the shared variable.
+            right (Segment): Segment starting at the shared variable.
+            block_size (int, optional): Approximate number of rows per block, all rows at once if omitted.
+            group_starts (np.ndarray, optional): Sorted indexes of left rows that blocks may
+                start at, including 0; blocks never split the rows between two of them.
+
+        Yields:
+            Segment: Blocks of the joined segment.
+        """
+        right = right.sort_by_start()
+        low = np.searchsorted(right.start, left.end, side='left')
+        counts = np.searchsorted(right.start, left.end, side='right') - low
+        if self.fanout_cap is not None:
+            take, offsets = self.fanout_cap.apply(left.end, counts, self.num_entities, self.rng)
+        else:
+            take, offsets = counts, None
+        total = np.cumsum(take)
+
+        block_start = 0
+        while block_start < len(left):
+            if block_size is None:
+                block_end = len(left)
+            else:
+                # Take rows until the block holds block_size joined rows, and at least one row
+                base = total[block_start - 1] if block_start else 0
+                block_end = max(int(np.searchsorted(total, base + block_size, side='right')), block_start + 1)
+                if group_starts is not None:
+                    # Extend the block to the start of the next group
+                    index = int(np.searchsorted(group_starts, block_end, side='left'))
+                    block_end = int(group_starts[index]) if index < len(group_starts) else len(left)
+            rows = np.arange(block_start, block_end)
+            left_rows = np.repeat(rows, take[rows])
+            # Position of each match inside its run of matches, rotated by the sampling offset
+            starts = np.cumsum(take[rows]) - take[rows]
+            positions = np.arange(len(left_rows)) - np.repeat(starts, take[rows])
+            if offsets is not None:
+                positions = (positions + offsets[left_rows]) % np.maximum(counts[left_rows], 1)
+            right_rows = low[left_rows] + positions
+            block_start = block_end
+            if not len(left_rows):
+                continue
+            yield Segment(left.first, right.last, self._joined_columns(left, right, left_rows, right_rows))
+
+    def execute(self, block_size=1 << 20, max_groundings=None):
+        """
+        Ground the whole body.
+
+        Groundings come out in a canonical order that does not depend on the join
+        order or on which sub-paths were served from the cache: sorted paths in
+        "paths" mode, and sorted distinct pairs in "endpoints" mode.
+
+        Args:
+            block_size (int, optional): Approximate number of rows per join block and
+                per yielded block, all of them at once if None.
+            max_groundings (int, optional): Keep only the first groundings of the rule in
+                canonical order. Intermediate joins are not capped, so the kept groundings
+                do not depend on the join order. Capped plans do not use the cache.
+
+        Yields:
+            np.ndarray: Blocks of groundings, as (n, k + 1) arrays of X0..Xk in "paths"
+                mode or (n, 2) arrays of (X0, Xk) in "endpoints" mode.
+        """
+        if not self.body:
+            return
+        cache = self.cache if max_groundings is None else None
+
+        result = self._cached(0, len(self.body)) if cache is not None else None
+        if result is None and len(self.body) == 1:
+            result = self._seed_segments(cache)[0]
+        if result is not None:
+            groundings = np.stack(result.columns, axis=1)[:max_groundings]
+            step = block_size or max(len(groundings), 1)
+            for start in range(0, len(groundings), step):
+                yield groundings[start:start + step]
+            return
+
+        segments = self._seed_segments(cache)
+        while len(segments) > 2:
+            sizes = [self.join_size(segments[i], segments[i + 1]) for i in range(len(segments) - 1)]
+            best = int(np.argmin(sizes))
+            joined = self.join(segments[best], segments[best + 1])
+            if joined is None:
+                return
+            segments[best:best + 2] = [joined]
+            if cache is not None:
+                cache.put(self._cache_key(joined.first, joined.last + 1), joined)
+
+        # Keep the streamed blocks for the cache only while they fit in it
+        kept, kept_bytes = ([], 0) if cache is not None else (None, 0)
+        produced = 0
+        for block in self._canonical_blocks(segments[0], segments[1], block_size):
+            if max_groundings is not None:
+                block = block[:max_groundings - produced]
+            produced += len(block)
+            if kept is not None:
+                kept_bytes += block.nbytes
+                if kept_bytes <= cache.max_bytes:
+                    kept.append(block)
+                else:
+                    kept = None
+            yield block
+            if max_groundings is not None and produced >= max_groundings:
+                return
+        if kept:
+            groundings = np.concatenate(kept)
+            cache.put(self._cache_key(0, len(self.body)),
+                      Segment(0, len(self.body) - 1, [np.ascontiguousarray(column) for column in groundings.T],
+                              sorted_by_start=True))
+
+    def _cache_key(self, start, end):
+        return self.split, self.mode, tuple(self.body_ids[start:end])
+
+    def _cached(self, start, end):
+        """Get the cached grounding of body atoms start..end - 1, as a segment at that position."""
+        if end - start < 2:
+            return None
+        segment = self.cache.get(self._cache_key(start, end))
+        if segment is None:
+            self.cache.misses += 1
+            return None
+        return Segment(start, end - 1, segment.columns, segment.sorted_by_start)
+
+    def _seed_segments(self, cache):
+        """
+        Split the body into segments, using the longest sub-path in the cache at
+        each position and single atoms elsewhere.
+        """
+        segments = []
+        start = 0
+        while start < len(self.body):
+            for end in range(len(self.body), start + 1, -1):
+                if cache is not None and self._cache_key(start, end) in cache:
+                    segments.append(self._cached(start, end))
+                    break
+            else:
+                segments.append(self._dedup(self.atom(start)))
+                end = start + 1
+            start = end
+        return segments
+
+    def _canonical(self, segment):
+        if self.mode == "endpoints":
+            return self._dedup(segment)
+        order = np.lexsort(segment.columns[::-1])
+        return segment.take(order)
+
+    def _canonical_blocks(self, left, right, block_size):
+        """
+        Join the last two segments in blocks that come out in canonical order.
+
+        The left rows are sorted and grouped: by whole row in "paths" mode and by
+        start in "endpoints" mode. Blocks never split a group, so every block covers
+        a range of groups greater than those of the blocks before it, and sorting
+        (or deduplicating) each block on its own sorts the whole result.
+
+        Yields:
+            np.ndarray: Blocks of groundings, as in execute().
+        """
+        if not len(left) or not len(right):
+            return
+        left = self._canonical(left)
+        keys = left.columns if self.mode == "paths" else [left.start]
+        changed = np.zeros(len(left), dtype=bool)
+        changed[0] = True
+        for column in keys:
+            changed[1:] |= column[1:] != column[:-1]
+        for block in self.join_blocks(left, right, block_size, group_starts=np.flatnonzero(changed)):
+            block = self._canonical(block)
+            if len(block):
+                yield np.stack(block.columns, axis=1)
+
+    def _joined_columns(self, left, right, left_rows, right_rows):
+        if self.mode == "endpoints":
+            return [left.start[left_rows], right.end[right_rows]]
+        return [column[left_rows] for column in left.columns] + [column[right_rows] for column in right.columns[1:]]
+
+    def _dedup(self, segment):
+        if self.mode != "endpoints":
+            return segment
+        keys = np.unique(segment.start.astype(np.int64) * self.num_entities + segment.end)
+        start, end = np.divmod(keys, self.num_entities)
+        return Segment(segment.first, segment.last, [start.astype(np.int32), end.astype(np.int32)],
+                       sorted_by_start=True)
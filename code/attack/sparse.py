@@ -0,0 +1,52 @@
+import numpy as np
+
+try:
+    import scipy.sparse as sp
+except ImportError:  # Optional, only needed by the sparse-matrix engines
+    sp = None
+
+
+def require_scipy(feature):
+    if sp is None:
+        raise ImportError(f"{feature} requires scipy, install it with `pip install scipy`")
+
+
+def inverse_name(relation):
+    return relation[4:] if relation.startswith("inv_") else "inv_" + relation
+
+
+def adjacency_matrices(store, split):
+    """
+    Build the adjacency matrix of every relation with triples in a split, and of its inverse.
+
+    Args:
+        store (TripleStore): Store holding the split.
+        split (str): Name of the split.
+
+    Returns:
+        dict: Mapping from relation name, including the "inv_" names, to a square
+            int32 CSR matrix with a 1 at (head, tail) for every triple.
+    """
+    require_scipy("Sparse adjacency matrices")
+    num_entities = len(store.entities)
+    matrices = {}
+    for relation in np.flatnonzero(np.diff(store.offsets[split])):
+        name = store.relations.names[relation]
+        heads, tails = store.pairs(split, relation)
+        matrix = sp.csr_matrix((np.ones(len(heads), dtype=np.int32), (heads, tails)),
+                               shape=(num_entities, num_entities))
+        matrix.sum_duplicates()
+        matrices[name] = matrix
+        matrices[inverse_name(name)] = matrix.T.tocsr()
+    return matrices
+
+
+def nonzero_pairs(matrix):
+    """
+    Get the (row, column) pairs of the stored entries of a CSR matrix, in row-major order.
+
+    Returns:
+        tuple: Row and column int64 arrays.
+    """
+    rows = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr))
+    return rows, matrix.indices.astype(np.int64)
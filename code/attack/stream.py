@@ -0,0 +1,197 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+class KeySet:
+    """
+    Compact set of int64 keys for deduplicating a stream of candidates.
+
+    Keys are held as sorted NumPy runs, 8 bytes per key, that are merged as they
+    grow like a log-structured merge tree. When the in-memory runs exceed the
+    memory budget the largest one is spilled to a memory-mapped file on disk, so
+    memory stays bounded while lookups still binary-search every run. Spilled runs
+    are merged on disk the same way, in bounded chunks, so their number stays
+    logarithmic in the number of keys.
+    """
+
+    def __init__(self, memory_budget=None, spill_dir=None):
+        """
+        Args:
+            memory_budget (int, optional): Bytes of keys to keep in memory, unbounded if omitted.
+            spill_dir (str, optional): Directory for spilled runs, a temporary directory if omitted.
+        """
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.memory_runs = []
+        self.disk_runs = []
+        self._temp_dir = None
+        self._files = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, keys):
+        """
+        Add keys to the set.
+
+        Args:
+            keys (np.ndarray): Keys to add, possibly with duplicates.
+
+        Returns:
+            np.ndarray: Sorted keys that were not in the set before.
+        """
+        keys = np.unique(np.asarray(keys, dtype=np.int64))
+        for run in self.disk_runs + self.memory_runs:
+            if not len(keys):
+                break
+            positions = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            keys = keys[run[positions] != keys]
+
+        if len(keys):
+            self._size += len(keys)
+            self.memory_runs.append(keys)
+            # Merge runs of similar size so lookups stay logarithmic
+            while len(self.memory_runs) > 1 and len(self.memory_runs[-2]) <= len(self.memory_runs[-1]):
+                last = self.memory_runs.pop()
+                self.memory_runs[-1] = np.sort(np.concatenate((self.memory_runs[-1], last)))
+            self._spill()
+        return keys
+
+    def close(self):
+        """
+        Drop all keys and remove spilled runs.
+        """
+        self.memory_runs = []
+        self.disk_runs = []
+        self._size = 0
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+    def _spill(self):
+        if self.memory_budget is None:
+            return
+        while self.memory_runs and sum(run.nbytes for run in self.memory_runs) > self.memory_budget:
+            if self._temp_dir is None:
+                self._temp_dir = tempfile.mkdtemp(prefix="keyset-", dir=self.spill_dir)
+            run = self.memory_runs.pop(0)
+            path = self._run_path()
+            np.save(path, run)
+            self.disk_runs.append(np.load(path, mmap_mode='r'))
+            # Merge runs until each is more than twice the size of the next
+            while len(self.disk_runs) > 1 and len(self.disk_runs[-2]) <= 2 * len(self.disk_runs[-1]):
+                last = self.disk_runs.pop()
+                self.disk_runs[-1] = self._merge_runs(self.disk_runs[-1], last)
+
+    def _run_path(self):
+        self._files += 1
+        return os.path.join(self._temp_dir, f"run-{self._files}.npy")
+
+    def _merge_runs(self, first, second):
+        # Merge two disjoint sorted runs into a new file, a bounded chunk of each at a time
+        chunk = max(1 << 10, self.memory_budget // 32)
+        path = self._run_path()
+        merged = np.lib.format.open_memmap(path, mode='w+', dtype=np.int64, shape=(len(first) + len(second),))
+        i = j = 0
+        while i < len(first) or j < len(second):
+            # Every key up to the smaller of the two chunk ends can be written
+            ends = [run[min(start + chunk, len(run)) - 1] for run, start in ((first, i), (second, j))
+                    if start < len(run)]
+            pivot = min(ends)
+            first_end = int(np.searchsorted(first, pivot, side='right'))
+            second_end = int(np.searchsorted(second, pivot, side='right'))
+            keys = np.sort(np.concatenate((first[i:first_end], second[j:second_end])))
+            merged[i + j:first_end + second_end] = keys
+            i, j = first_end, second_end
+        merged.flush()
+        del merged
+        for run in (first, second):
+            os.remove(run.filename)
+        return np.load(path, mmap_mode='r')
+
+
+def deduplicate(chunks, key_set):
+    """
+    Drop keys already seen earlier in the stream.
+
+    Args:
+        chunks (iterable): Arrays of int64 keys.
+        key_set (KeySet): Set that records the keys seen so far.
+
+    Yields:
+        np.ndarray: The new keys of each chunk, sorted.
+    """
+    for keys in chunks:
+        new_keys = key_set.add(keys)
+        if len(new_keys):
+            yield new_keys
+
+
+class Reservoir:
+    """
+    Uniform random sample of a fixed number of keys from a stream.
+
+    Every key gets an independent uniform random priority and the reservoir
+    keeps the keys with the smallest priorities, so at any point it holds a
+    uniform sample without replacement of the keys seen so far. With a fixed
+    seed and the same stream order the sample is reproducible. Every key can
+    carry an integer value, e.g. the ID of the rule that produced it.
+    """
+
+    def __init__(self, size, seed=None):
+        """
+        Args:
+            size (int): Number of keys to sample.
+            seed (int, optional): Seed of the random priorities.
+        """
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.priorities = np.empty(0, dtype=np.float64)
+        self.values = np.empty(0, dtype=np.int64)
+        self.seen = 0
+
+    def add(self, keys, values=None):
+        """
+        Offer a chunk of distinct keys to the reservoir.
+
+        Args:
+            keys (np.ndarray): Keys not offered before.
+            values (np.ndarray, optional): Value of every key, -1 if omitted.
+        """
+        priorities = self.rng.random(len(keys))
+        self.seen += len(keys)
+        if values is None:
+            values = np.full(len(keys), -1, dtype=np.int64)
+        self.keys = np.concatenate((self.keys, keys))
+        self.priorities = np.concatenate((self.priorities, priorities))
+        self.values = np.concatenate((self.values, values))
+        if len(self.keys) > self.size:
+            kept = np.argpartition(self.priorities, self.size - 1)[:self.size] if self.size else []
+            self.keys = self.keys[kept]
+            self.priorities = self.priorities[kept]
+            self.values = self.values[kept]
+
+    def sample(self, with_values=False):
+        """
+        Get the sampled keys.
+
+        Args:
+            with_values (bool): Also return the value of every sampled key.
+
+        Returns:
+            np.ndarray or tuple: The sampled keys, ordered by priority, and their values
+                with with_values.
+        """
+        order = np.argsort(self.priorities, kind="stable")
+        return (self.keys[order], self.values[order]) if with_values else self.keys[order]
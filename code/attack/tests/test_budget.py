@@ -0,0 +1,50 @@
+import numpy as np
+
+from attack.budget import budget_label, budget_size
+from attack.pipeline import ADD_DIR, DEL_DIR, import_script
+from attack.tests.test_del_scoring import write_train_file
+from attack.triple_store import TripleStore, Vocabulary
+
+
+def test_budget_size_is_exact():
+    assert budget_size(10, 86835) == 8684
+    assert budget_size(2.5, 86835) == 2171
+    # 0.7 * 100 is 70.00000000000001 in floating point
+    assert budget_size(0.7, 10000) == 70
+    assert [budget_label(percent) for percent in (10.0, 2.5, 1)] == ["10", "2.5", "1"]
+
+
+def test_added_budgets_are_nested_samples(tmp_path):
+    neg_triples = import_script(ADD_DIR, "generate_neg_triples")
+    store = TripleStore(Vocabulary([f"e{entity}" for entity in range(20)]), Vocabulary(["r0", "r1"]))
+    original_train = tmp_path / "train.txt"
+    original_train.write_text("e0\tr0\te1\ne1\tr1\te2\n")
+    # Every other triple between distinct entities is a candidate
+    original = {(0, 0, 1), (1, 1, 2)}
+    candidates = np.array([[head, relation, tail] for head in range(20) for relation in range(2) for tail in range(20)
+                           if head != tail and (head, relation, tail) not in original])
+    keys = store.pack(candidates)
+    triples = [(keys[:300], 0, 0.5), (keys[300:], 1, 0.25)]
+    budgets = [(size, str(tmp_path / f"sel_{size}.txt"), str(tmp_path / f"train_{size}.txt")) for size in (5, 50, 200)]
+
+    assert neg_triples.save_triples(triples, store, None, str(original_train), budgets, seed=0) == len(keys)
+    samples = [open(sel_path).read().splitlines() for _, sel_path, _ in budgets]
+    for (size, _, train_path), sample in zip(budgets, samples):
+        assert len(set(sample)) == size
+        assert open(train_path).read().splitlines() == ["e0\tr0\te1", "e1\tr1\te2"] + sample
+    assert samples[1][:5] == samples[0] and samples[2][:50] == samples[1]
+
+
+def test_deleted_budgets_match_one_run_per_budget(tmp_path):
+    del_triples = import_script(DEL_DIR, "generate_del_triples")
+    train_path = tmp_path / "train.txt"
+    write_train_file(train_path, seed=0)
+    lines = list(dict.fromkeys(train_path.read_text().splitlines()))
+    # Few distinct scores, so the cutoffs fall inside runs of ties
+    conf_count = {line: float(index % 4) for index, line in enumerate(lines) if index % 5}
+    limits = [3, 40, 90]
+    remaining = del_triples.exclude_top_triples_per_budget(str(train_path), conf_count, limits)
+    for lines_left, limit in zip(remaining, limits):
+        assert lines_left == del_triples.exclude_top_triples_per_budget(str(train_path), conf_count, [limit])[0]
+        assert len(lines_left) == len(lines) - limit
+    assert set(remaining[2]) <= set(remaining[1]) <= set(remaining[0])
@@ -0,0 +1,51 @@
+import os
+
+from attack.cache import StageManifest
+
+
+def write(path, text):
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def run_stage(manifest_path, input_path, output_path, params, reproducible=True):
+    """Run a stage that copies its input unless the manifest says it is current; return whether it ran."""
+    manifest = StageManifest(manifest_path)
+    key = manifest.key("copy", params, [input_path])
+    if manifest.is_current("copy", key, [output_path]):
+        return False
+    with open(input_path, 'r') as input_file:
+        write(output_path, input_file.read())
+    manifest.record("copy", key, [output_path], reproducible=reproducible)
+    return True
+
+
+def test_stage_is_skipped_until_its_inputs_params_or_outputs_change(tmp_path):
+    manifest_path, input_path, output_path = (str(tmp_path / name) for name in ("manifest.json", "in.txt", "out.txt"))
+    write(input_path, "a\n")
+    assert run_stage(manifest_path, input_path, output_path, {"seed": 1})
+    assert not run_stage(manifest_path, input_path, output_path, {"seed": 1})
+
+    # Touching an input without changing its content keeps the stage current
+    os.utime(input_path, ns=(0, 0))
+    assert not run_stage(manifest_path, input_path, output_path, {"seed": 1})
+
+    write(input_path, "b\n")
+    assert run_stage(manifest_path, input_path, output_path, {"seed": 1})
+    assert run_stage(manifest_path, input_path, output_path, {"seed": 2})
+    assert not run_stage(manifest_path, input_path, output_path, {"seed": 2})
+
+    write(output_path, "edited\n")
+    assert run_stage(manifest_path, input_path, output_path, {"seed": 2})
+    os.remove(output_path)
+    assert run_stage(manifest_path, input_path, output_path, {"seed": 2})
+
+
+def test_stage_that_is_not_reproducible_always_reruns(tmp_path):
+    manifest_path, input_path, output_path = (str(tmp_path / name) for name in ("manifest.json", "in.txt", "out.txt"))
+    write(input_path, "a\n")
+    for _ in range(3):
+        assert run_stage(manifest_path, input_path, output_path, {"seed": None}, reproducible=False)
+    # Once a seeded run is recorded, the stage is skipped again
+    assert run_stage(manifest_path, input_path, output_path, {"seed": 0})
+    assert not run_stage(manifest_path, input_path, output_path, {"seed": 0})
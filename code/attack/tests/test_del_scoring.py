@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from attack.pipeline import DEL_DIR, import_script
+from attack.triple_store import TripleStore, Vocabulary
+
+RULES = [
+    {"Rule Head": ["r0"], "Rule Body": ["r1", "r2"], "conf": 0.5},
+    {"Rule Head": ["inv_r1"], "Rule Body": ["r0", "inv_r2"], "conf": 0.5},
+    {"Rule Head": ["r2"], "Rule Body": ["r0", "r1", "r2"], "conf": 0.1},
+    {"Rule Head": ["r1"], "Rule Body": ["inv_r0", "r2"], "conf": 0.3},
+]
+
+
+def write_train_file(path, seed):
+    rng = np.random.default_rng(seed)
+    triples = np.stack([rng.integers(0, 15, 150), rng.integers(0, 3, 150), rng.integers(0, 15, 150)], axis=1)
+    lines = [f"e{head}\tr{relation}\te{tail}" for head, relation, tail in triples.tolist()]
+    # A repeated line, so file order and first-seen order differ
+    lines.append(lines[3])
+    path.write_text("".join(line + "\n" for line in lines))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fused_and_instance_files_exclude_the_same_triples(seed, tmp_path):
+    del_instances = import_script(DEL_DIR, "generate_del_instances")
+    del_triples = import_script(DEL_DIR, "generate_del_triples")
+    train_path = tmp_path / "train.txt"
+    write_train_file(train_path, seed)
+    store = TripleStore(Vocabulary(), Vocabulary())
+    store.load_split("train", str(train_path))
+    store.load_split("original", str(train_path))
+    limits = [5, 20, 60]
+
+    conf_counts = {}
+    for output_format, load in (("text", del_triples.load_rules_with_confidence),
+                                ("jsonl", del_triples.load_jsonl_rules_with_confidence)):
+        instances_path = tmp_path / f"instances.{output_format}"
+        del_instances.save_instances_to_file(del_instances.generate_instances(RULES, store), str(instances_path),
+                                             store, output_format, RULES)
+        conf_counts[output_format] = load(str(instances_path))
+
+    scores = np.zeros(len(store.triples["original"]))
+    instances = del_instances.accumulate_confidence(del_instances.generate_instances(RULES, store), store, scores)
+    del_instances.save_instances_to_file(instances, None, store, "none")
+    conf_counts["fused"] = del_triples.confidence_from_scores(store.to_file_order("original", scores), str(train_path))
+
+    remaining = {name: del_triples.exclude_top_triples_per_budget(str(train_path), conf_count, limits)
+                 for name, conf_count in conf_counts.items()}
+    # Equal confidences give ties at the cutoffs
+    assert len(set(conf_counts["text"].values())) < len(conf_counts["text"])
+    assert remaining["text"] == remaining["jsonl"] == remaining["fused"]
+    for lines, limit in zip(remaining["text"], limits):
+        assert len(lines) == len(set(train_path.read_text().splitlines())) - limit
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from attack import evaluate
+from attack.evaluate import MODELS, FilterIndex, Scorer, metrics, rank_triples
+
+NUM_ENTITIES = 40
+NUM_RELATIONS = 4
+DIMENSION = 6
+
+
+def naive_score(model, entities, relations, head, relation, tail):
+    h, r, t = entities[head], relations[relation], entities[tail]
+    if model == "TransE":
+        return -np.abs(h + r - t).sum()
+    if model == "DistMult":
+        return (h * r * t).sum()
+    h, r, t = (np.complex128(x[:DIMENSION // 2]) + 1j * x[DIMENSION // 2:] for x in (h, r, t))
+    return np.real((h * r * np.conj(t)).sum())
+
+
+def naive_ranks(model, entities, relations, triples, known):
+    ranks = {"tail": [], "head": []}
+    for head, relation, tail in triples.tolist():
+        for direction in ("tail", "head"):
+            def score(entity):
+                if direction == "tail":
+                    return naive_score(model, entities, relations, head, relation, entity)
+                return naive_score(model, entities, relations, entity, relation, tail)
+            target = tail if direction == "tail" else head
+            true_score = score(target)
+            rank = 1
+            for entity in range(NUM_ENTITIES):
+                triple = (head, relation, entity) if direction == "tail" else (entity, relation, tail)
+                if entity != target and triple not in known and score(entity) > true_score + 1e-4:
+                    rank += 1
+            ranks[direction].append(rank)
+    return ranks
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_filtered_ranks_match_a_naive_ranking(model, monkeypatch):
+    # Small TransE blocks, so the scores are computed in several blocks of entities and queries
+    monkeypatch.setattr(evaluate, "TRANSE_BLOCK_ELEMENTS", 2 * 7 * DIMENSION)
+    monkeypatch.setattr(evaluate, "TRANSE_MIN_BLOCK_ENTITIES", 7)
+    rng = np.random.default_rng(0)
+    entities = rng.standard_normal((NUM_ENTITIES, DIMENSION)).astype(np.float32)
+    relations = rng.standard_normal((NUM_RELATIONS, DIMENSION)).astype(np.float32)
+    known_triples = np.unique(np.stack([rng.integers(0, NUM_ENTITIES, 300), rng.integers(0, NUM_RELATIONS, 300),
+                                        rng.integers(0, NUM_ENTITIES, 300)], axis=1), axis=0)
+    test_triples = known_triples[rng.choice(len(known_triples), 30, replace=False)]
+    known = set(map(tuple, known_triples.tolist()))
+
+    ranks = rank_triples(Scorer(model, entities, relations), FilterIndex(known_triples, NUM_ENTITIES), test_triples,
+                         batch_size=8, threads=2)
+    expected = naive_ranks(model, entities, relations, test_triples, known)
+    for direction in ("tail", "head"):
+        assert ranks[direction].tolist() == expected[direction]
+
+
+def test_metrics():
+    result = metrics([1, 2, 4, 20])
+    assert result["count"] == 4
+    assert result["MRR"] == pytest.approx((1 + 1 / 2 + 1 / 4 + 1 / 20) / 4)
+    assert (result["Hits@1"], result["Hits@3"], result["Hits@10"]) == (0.25, 0.5, 0.75)
@@ -0,0 +1,59 @@
+import numpy as np
+
+from attack.incremental import GroundingCache, grounding_params, rule_key
+from attack.pipeline import ADD_DIR, import_script
+from attack.tests.test_plan import NUM_ENTITIES, NUM_RELATIONS, make_store
+from attack.triple_store import TripleStore, Vocabulary
+
+RULES = [
+    {"Rule Head": ["r0"], "Rule Body": ["r1"]},
+    {"Rule Head": ["r1"], "Rule Body": ["r0", "r1"]},
+    {"Rule Head": ["inv_r1"], "Rule Body": ["r1", "r0"]},
+    # Every rule below reads r2 through its body or head, directly or inverted
+    {"Rule Head": ["r0"], "Rule Body": ["r2", "r1"]},
+    {"Rule Head": ["r1"], "Rule Body": ["inv_r2", "r0"]},
+    {"Rule Head": ["r2"], "Rule Body": ["r0", "r1"]},
+    {"Rule Head": ["inv_r2"], "Rule Body": ["r1"]},
+]
+READS_R2 = [False, False, False, True, True, True, True]
+
+
+def build_store(train):
+    store = TripleStore(Vocabulary([str(entity) for entity in range(NUM_ENTITIES)]),
+                        Vocabulary([f"r{relation}" for relation in range(NUM_RELATIONS)]))
+    store.add_split("train", train)
+    store.add_split("valid", train[:5])
+    store.add_split("test", train[5:10])
+    return store
+
+
+def generate(store, grounding_cache=None):
+    neg_triples = import_script(ADD_DIR, "generate_neg_triples")
+    return [candidates.copy() for candidates in neg_triples.generate_triples(RULES, store,
+                                                                             grounding_cache=grounding_cache)]
+
+
+def test_only_rules_reading_an_edited_relation_are_grounded_again(tmp_path):
+    train = make_store().triples["train"]
+    directory = str(tmp_path / "groundings")
+    cache = GroundingCache(directory, build_store(train), ("train", "valid", "test"))
+    generate(cache.store, cache)
+    cache.save()
+
+    keys = [rule_key(rule, grounding_params()) for rule in RULES]
+    unchanged = build_store(train)
+    assert all(key in GroundingCache(directory, unchanged, ("train", "valid", "test")) for key in keys)
+
+    # Drop some r2 triples, so every rule reading r2 or inv_r2 is stale and all others are reused
+    edited_train = np.delete(train, np.flatnonzero(train[:, 1] == 2)[:3], axis=0)
+    edited = build_store(edited_train)
+    cache = GroundingCache(directory, edited, ("train", "valid", "test"))
+    assert [key not in cache for key in keys] == READS_R2
+
+    candidates = generate(edited, cache)
+    cache.save()
+    expected = generate(build_store(edited_train))
+    assert any(len(rule_candidates) for rule_candidates in expected)
+    for rule_candidates, rule_expected in zip(candidates, expected):
+        assert np.array_equal(rule_candidates, rule_expected)
+    assert all(key in GroundingCache(directory, build_store(edited_train), ("train", "valid", "test")) for key in keys)
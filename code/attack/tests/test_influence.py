@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from attack.pipeline import DEL_DIR, import_script
+from attack.tests.test_plan import make_store
+
+pytest.importorskip("scipy")
+from attack.influence import score_rules  # noqa: E402
+
+RULES = [
+    {"Rule Head": ["r0"], "Rule Body": ["r1", "r2"], "conf": 0.5},
+    {"Rule Head": ["inv_r1"], "Rule Body": ["r0", "inv_r2"], "conf": 0.25},
+    {"Rule Head": ["r2"], "Rule Body": ["r0", "r1", "r2"], "conf": 0.125},
+    {"Rule Head": ["r1"], "Rule Body": ["inv_r0", "r0", "inv_r1"], "conf": 0.0625},
+    # Length-1 bodies are not scored by either path
+    {"Rule Head": ["r0"], "Rule Body": ["r1"], "conf": 0.9},
+]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_sparse_scores_match_enumerated_instances(seed):
+    del_instances = import_script(DEL_DIR, "generate_del_instances")
+    store = make_store(seed, num_triples=300)
+    # Repeated training rows are scored in every copy and their head triples count once
+    store.add_split("original", store.triples["train"])
+
+    expected = np.zeros(len(store.triples["original"]))
+    for _ in del_instances.accumulate_confidence(del_instances.generate_instances(RULES, store), store, expected):
+        pass
+    scores = np.zeros_like(expected)
+    score_rules(RULES, store, scores)
+    assert expected.any()
+    np.testing.assert_allclose(scores, expected)
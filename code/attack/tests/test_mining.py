@@ -0,0 +1,82 @@
+import itertools
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+from attack.mining import RuleMiner, mine_rules, split_rules  # noqa: E402
+from attack.sparse import inverse_name  # noqa: E402
+from attack.triple_store import TripleStore, Vocabulary  # noqa: E402
+
+NUM_ENTITIES = 12
+RELATIONS = ["r0", "r1", "r2"]
+
+
+def make_store(seed=0, num_triples=60):
+    rng = np.random.default_rng(seed)
+    triples = np.stack([rng.integers(0, NUM_ENTITIES, num_triples), rng.integers(0, len(RELATIONS), num_triples),
+                        rng.integers(0, NUM_ENTITIES, num_triples)], axis=1).astype(np.int32)
+    store = TripleStore(Vocabulary([str(entity) for entity in range(NUM_ENTITIES)]), Vocabulary(RELATIONS))
+    store.add_split("train", triples)
+    return store
+
+
+def relation_pairs(store):
+    """Distinct (head, tail) pairs of every relation and of its inverse."""
+    pairs = {}
+    for relation in RELATIONS:
+        heads, tails = store.pairs("train", store.relations.ids[relation])
+        pairs[relation] = set(zip(heads.tolist(), tails.tolist()))
+        pairs[inverse_name(relation)] = {(tail, head) for head, tail in pairs[relation]}
+    return pairs
+
+
+def brute_force_body_pairs(pairs, body):
+    if len(body) == 1:
+        # r(X, Y) => h(Y, X)
+        return {(tail, head) for head, tail in pairs[body[0]]}
+    paths = set(pairs[body[0]])
+    for relation in body[1:]:
+        paths = {(start, tail) for start, middle in paths for head, tail in pairs[relation] if head == middle}
+    return {(start, end) for start, end in paths if start != end}
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_mined_rules_match_brute_force_counts(seed):
+    store = make_store(seed)
+    pairs = relation_pairs(store)
+    min_support, min_head_coverage = 2, 0.1
+    rules = mine_rules(store, max_length=3, min_support=min_support, min_head_coverage=min_head_coverage)
+
+    expected = {}
+    for length in (1, 2, 3):
+        for body in itertools.product(pairs, repeat=length):
+            body_pairs = brute_force_body_pairs(pairs, body)
+            for head, head_pairs in pairs.items():
+                if length == 1 and head == inverse_name(body[0]):
+                    continue
+                support = len(body_pairs & head_pairs)
+                if support >= min_support and support / len(head_pairs) >= min_head_coverage:
+                    expected[(head, body)] = (support, round(support / len(head_pairs), 4),
+                                              round(support / len(body_pairs), 4))
+    mined = {(rule["Rule Head"][0], tuple(rule["Rule Body"])): (rule["Support"], rule["Head Coverage"], rule["conf"])
+             for rule in rules}
+    assert len(mined) == len(rules)
+    assert any(len(body) == 3 for _, body in mined)
+    assert mined == expected
+
+
+def test_bodies_skip_mirrored_sequences():
+    miner = RuleMiner(make_store())
+    bodies = miner.bodies(max_length=3)
+    assert len(bodies) == len(set(bodies))
+    for body in bodies:
+        mirrored = tuple(inverse_name(relation) for relation in reversed(body))
+        assert len(body) == 1 or mirrored == body or mirrored not in bodies
+
+
+def test_split_rules_by_confidence():
+    rules = [{"conf": conf} for conf in (0.9, 0.5, 0.49, 0.0, 0.5)]
+    high_conf_rules, low_conf_rules = split_rules(rules, 0.5)
+    assert high_conf_rules == [rules[0], rules[1], rules[4]]
+    assert low_conf_rules == [rules[2], rules[3]]
@@ -0,0 +1,21 @@
+import os
+
+import numpy as np
+
+from attack.parallel import map_rules
+from attack.plan import JoinPlan
+from attack.tests.test_plan import BODIES, make_store
+
+
+def _ground(body, store):
+    return os.getpid(), np.concatenate(list(JoinPlan(store, body).execute(block_size=7)))
+
+
+def test_workers_give_the_results_of_a_single_process_in_rule_order():
+    store = make_store()
+    rules = BODIES * 4
+    expected = [paths for _, paths in map_rules(_ground, rules, store)]
+    results = list(map_rules(_ground, rules, store, workers=3))
+    assert len(results) == len(rules)
+    assert all(np.array_equal(paths, reference) for (_, paths), reference in zip(results, expected))
+    assert {pid for pid, _ in results} != {os.getpid()}
@@ -0,0 +1,61 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from attack.partition import partition_by_relation, read_relation, relation_file_name
+
+RELATIONS = ["_hypernym", "_also_see", "/people/person/nationality", "/film/film/genre"]
+
+
+def write_triples(path, seed=0, num_lines=500):
+    rng = np.random.default_rng(seed)
+    lines = [f"e{head}\t{RELATIONS[relation]}\te{tail}"
+             for head, relation, tail in zip(rng.integers(0, 50, num_lines), rng.integers(0, len(RELATIONS), num_lines),
+                                             rng.integers(0, 50, num_lines))]
+    path.write_text("".join(line + "\n" for line in lines) + "not a triple\n")
+    return lines
+
+
+@pytest.mark.parametrize("max_open", [1, 64])
+def test_partition_round_trip(tmp_path, max_open):
+    input_path = tmp_path / "test.txt"
+    lines = write_triples(input_path)
+    output_dir = tmp_path / "test_by_relation"
+    # Small buffers and few open files, so relation files are flushed and reopened many times
+    for _ in range(2):
+        counts = partition_by_relation(str(input_path), str(output_dir), index=True, buffer_size=64,
+                                       max_open=max_open)
+
+    for relation in RELATIONS:
+        expected = [line for line in lines if line.split("\t")[1] == relation]
+        assert counts[relation] == len(expected)
+        assert (output_dir / relation_file_name(relation)).read_text().splitlines() == expected
+        assert read_relation(str(output_dir / "test_by_relation.json"), relation) == expected
+    assert read_relation(str(output_dir / "test_by_relation.json"), "_unknown") == []
+    with open(output_dir / "test_by_relation.json") as index_file:
+        assert list(json.load(index_file)["relations"]) == list(counts)
+    # Nothing but the relation files and the grouped file and index, no leftover temporary files
+    assert len(os.listdir(output_dir)) == len(RELATIONS) + 2
+
+
+def test_partition_writes_only_selected_relations(tmp_path):
+    input_path = tmp_path / "valid.txt"
+    lines = write_triples(input_path, seed=1)
+    counts = partition_by_relation(str(input_path), str(tmp_path / "out"), relations=["_also_see"])
+    assert list(counts) == ["_also_see"]
+    assert os.listdir(tmp_path / "out") == ["_also_see.txt"]
+    assert counts["_also_see"] == sum(line.split("\t")[1] == "_also_see" for line in lines)
+
+
+@pytest.mark.parametrize("relation", ["train", "test", "a.b"])
+def test_partition_refuses_to_replace_other_files(tmp_path, relation):
+    input_path = tmp_path / "test.txt"
+    input_path.write_text(f"e1\t{relation}\te2\ne2\t/a/b\te3\n")
+    (tmp_path / "train.txt").write_text("e1\tr\te2\n")
+    with pytest.raises(ValueError):
+        partition_by_relation(str(input_path), str(tmp_path))
+    assert (tmp_path / "train.txt").read_text() == "e1\tr\te2\n"
+    assert input_path.read_text() == f"e1\t{relation}\te2\ne2\t/a/b\te3\n"
+    assert sorted(os.listdir(tmp_path)) == ["test.txt", "train.txt"]
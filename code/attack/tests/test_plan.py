@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from attack.plan import FanoutCap, JoinPlan, SubpathCache
+from attack.triple_store import TripleStore, Vocabulary
+
+NUM_ENTITIES = 30
+NUM_RELATIONS = 3
+BODIES = [[0, 1], [0, 1, 2], [2, 0, 1, 2], ["inv_r1", 0], ["r0", "inv_r2", "r1"]]
+
+
+def make_store(seed=0, num_triples=200):
+    """Random graph whose training split repeats some of its triples."""
+    rng = np.random.default_rng(seed)
+    triples = np.stack([rng.integers(0, NUM_ENTITIES, num_triples), rng.integers(0, NUM_RELATIONS, num_triples),
+                        rng.integers(0, NUM_ENTITIES, num_triples)], axis=1).astype(np.int32)
+    store = TripleStore(Vocabulary([str(entity) for entity in range(NUM_ENTITIES)]),
+                        Vocabulary([f"r{relation}" for relation in range(NUM_RELATIONS)]))
+    store.add_split("train", np.concatenate([triples, triples[:20]]))
+    return store
+
+
+def brute_force_paths(store, body):
+    """Every path of a body, enumerated one atom at a time; repeated triples give repeated paths."""
+    edges = {}
+    for relation in body:
+        forward, inverse = store.resolve(relation)
+        heads, tails = store.pairs("train", forward)
+        edges[relation] = list(zip(tails.tolist(), heads.tolist()) if inverse else zip(heads.tolist(), tails.tolist()))
+    paths = [list(edge) for edge in edges[body[0]]]
+    for relation in body[1:]:
+        paths = [path + [tail] for path in paths for head, tail in edges[relation] if head == path[-1]]
+    return sorted(map(tuple, paths))
+
+
+def ground(plan, **options):
+    blocks = list(plan.execute(**options))
+    width = len(plan.body) + 1 if plan.mode == "paths" else 2
+    return np.concatenate(blocks) if blocks else np.empty((0, width), dtype=np.int64)
+
+
+@pytest.mark.parametrize("body", BODIES)
+@pytest.mark.parametrize("block_size", [None, 1, 7])
+def test_paths_match_brute_force(body, block_size):
+    store = make_store()
+    expected = brute_force_paths(store, body)
+    paths = ground(JoinPlan(store, body), block_size=block_size)
+    assert [tuple(path) for path in paths.tolist()] == expected
+
+
+@pytest.mark.parametrize("body", BODIES)
+def test_endpoints_are_sorted_distinct_pairs(body):
+    store = make_store()
+    expected = sorted({(path[0], path[-1]) for path in brute_force_paths(store, body)})
+    pairs = ground(JoinPlan(store, body, mode="endpoints"), block_size=5)
+    assert [tuple(pair) for pair in pairs.tolist()] == expected
+
+
+@pytest.mark.parametrize("mode", ["paths", "endpoints"])
+def test_cache_gives_the_same_groundings(mode):
+    store = make_store()
+    cache = SubpathCache(1 << 30)
+    bodies = [[0, 1], [0, 1, 2], [2, 0, 1, 2], [0, 1, 2], [1, 2]]
+    for body in bodies:
+        expected = ground(JoinPlan(store, body, mode=mode), block_size=13)
+        assert np.array_equal(ground(JoinPlan(store, body, mode=mode, cache=cache), block_size=13), expected)
+    # The repeated body is a hit, and every other body a failed lookup
+    assert cache.hits >= 1
+    assert cache.misses == len(bodies) - 1
+
+
+def test_cache_stays_within_its_size():
+    store = make_store()
+    cache = SubpathCache(2000)
+    for body in BODIES * 3:
+        expected = ground(JoinPlan(store, body))
+        assert np.array_equal(ground(JoinPlan(store, body, cache=cache)), expected)
+        assert cache.bytes <= 2000
+
+
+@pytest.mark.parametrize("mode", ["paths", "endpoints"])
+@pytest.mark.parametrize("body", BODIES)
+def test_max_groundings_keeps_a_prefix_of_the_canonical_order(mode, body):
+    store = make_store()
+    expected = ground(JoinPlan(store, body, mode=mode))
+    cache = SubpathCache(1 << 30)
+    for block_size in (1, 5, None):
+        for max_groundings in (1, 7, 100):
+            plan = JoinPlan(store, body, mode=mode, cache=cache)
+            assert np.array_equal(ground(plan, block_size=block_size, max_groundings=max_groundings),
+                                  expected[:max_groundings])
+    # Capped plans bypass the cache
+    assert len(cache) == 0 and cache.hits == cache.misses == 0
+
+
+def make_hub_store(seed=1):
+    """Graph where entity 0 ends many r0 triples and starts many r1 triples."""
+    rng = np.random.default_rng(seed)
+    first = np.stack([rng.integers(1, NUM_ENTITIES, 40), np.zeros(40, dtype=np.int64), np.zeros(40, dtype=np.int64)],
+                     axis=1)
+    second = np.stack([np.zeros(30, dtype=np.int64), np.ones(30, dtype=np.int64), rng.integers(1, NUM_ENTITIES, 30)],
+                      axis=1)
+    other = np.stack([rng.integers(0, NUM_ENTITIES, 100), rng.integers(0, 2, 100),
+                      rng.integers(0, NUM_ENTITIES, 100)], axis=1)
+    store = TripleStore(Vocabulary([str(entity) for entity in range(NUM_ENTITIES)]), Vocabulary(["r0", "r1"]))
+    store.add_split("train", np.unique(np.concatenate([first, second, other]), axis=0).astype(np.int32))
+    return store
+
+
+@pytest.mark.parametrize("block_size", [None, 7])
+def test_fanout_drop_skips_hubs(block_size):
+    store = make_hub_store()
+    max_fanout = 50
+    paths = brute_force_paths(store, [0, 1])
+    in_degree = np.bincount([path[1] for path in paths], minlength=NUM_ENTITIES)
+    # Every path through Y is one of the in_degree[Y] groundings through it
+    expected = [path for path in paths if in_degree[path[1]] <= max_fanout]
+    assert len(expected) < len(paths)
+    plan = JoinPlan(store, [0, 1], fanout_cap=FanoutCap(max_fanout, "drop"))
+    assert [tuple(path) for path in ground(plan, block_size=block_size).tolist()] == expected
+
+
+@pytest.mark.parametrize("block_size", [None, 7])
+def test_fanout_sample_is_a_bounded_reproducible_subset(block_size):
+    store = make_hub_store()
+    max_fanout = 50
+    paths = set(brute_force_paths(store, [0, 1]))
+    sampled = ground(JoinPlan(store, [0, 1], fanout_cap=FanoutCap(max_fanout, "sample", seed=3)), block_size=block_size)
+    assert set(map(tuple, sampled.tolist())) <= paths
+    assert np.bincount(sampled[:, 1]).max() <= max_fanout
+    again = ground(JoinPlan(store, [0, 1], fanout_cap=FanoutCap(max_fanout, "sample", seed=3)), block_size=block_size)
+    assert np.array_equal(sampled, again)
+
+
+def test_fanout_cap_with_max_groundings():
+    store = make_hub_store()
+    cap = FanoutCap(50, "drop")
+    expected = ground(JoinPlan(store, [0, 1], fanout_cap=cap))
+    capped = ground(JoinPlan(store, [0, 1], fanout_cap=cap), block_size=3, max_groundings=10)
+    assert np.array_equal(capped, expected[:10])
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+from attack.stream import KeySet, Reservoir, deduplicate
+
+
+def key_chunks(seed=0, num_chunks=60, chunk_size=500, num_keys=20000):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, num_keys, chunk_size) for _ in range(num_chunks)]
+
+
+@pytest.mark.parametrize("memory_budget", [None, 8 * 1000, 8 * 64])
+def test_key_set_returns_only_new_keys(memory_budget, tmp_path):
+    seen = set()
+    with KeySet(memory_budget, spill_dir=str(tmp_path)) as key_set:
+        for keys in key_chunks():
+            expected = np.array(sorted(set(keys.tolist()) - seen), dtype=np.int64)
+            seen.update(keys.tolist())
+            assert np.array_equal(key_set.add(keys), expected)
+            assert len(key_set) == len(seen)
+        if memory_budget is not None:
+            assert sum(run.nbytes for run in key_set.memory_runs) <= memory_budget
+            assert key_set.disk_runs
+    # Spilled runs are removed on close
+    assert os.listdir(tmp_path) == []
+
+
+def test_key_set_merges_spilled_runs(tmp_path):
+    with KeySet(8 * 64, spill_dir=str(tmp_path)) as key_set:
+        for keys in key_chunks(num_chunks=200):
+            key_set.add(keys)
+            sizes = [len(run) for run in key_set.disk_runs]
+            # Every run is more than twice the size of the next, so there are logarithmically many
+            assert all(size > 2 * following for size, following in zip(sizes, sizes[1:]))
+            assert len(os.listdir(key_set._temp_dir)) == len(key_set.disk_runs)
+        for run in key_set.disk_runs:
+            assert np.all(np.diff(run) > 0)
+
+
+def test_deduplicate_skips_empty_chunks():
+    with KeySet() as key_set:
+        chunks = [np.array([3, 1, 3]), np.array([1]), np.array([2, 3])]
+        assert [keys.tolist() for keys in deduplicate(chunks, key_set)] == [[1, 3], [2]]
+
+
+def test_reservoir_samples_are_nested_prefixes():
+    chunks = [np.unique(keys) for keys in key_chunks(seed=1, num_chunks=10)]
+    chunks = [keys + index * 20000 for index, keys in enumerate(chunks)]
+    samples = {}
+    for size in (10, 100, 1000):
+        reservoir = Reservoir(size, seed=7)
+        for keys in chunks:
+            reservoir.add(keys)
+        samples[size] = reservoir.sample()
+        assert len(samples[size]) == size
+        assert len(np.unique(samples[size])) == size
+    # A smaller budget samples the first triples of a larger one
+    assert np.array_equal(samples[100][:10], samples[10])
+    assert np.array_equal(samples[1000][:100], samples[100])
+
+
+def test_reservoir_is_reproducible_and_keeps_everything_below_its_size():
+    keys = np.arange(50, dtype=np.int64)
+    first, second = Reservoir(100, seed=3), Reservoir(100, seed=3)
+    first.add(keys)
+    second.add(keys)
+    assert np.array_equal(first.sample(), second.sample())
+    assert sorted(first.sample().tolist()) == keys.tolist()
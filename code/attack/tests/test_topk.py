@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from attack.pipeline import ADD_DIR, import_script
+from attack.topk import top_k_indices
+
+
+def stable_top(scores, k):
+    return np.argsort(-scores, kind="stable")[:k]
+
+
+@pytest.mark.parametrize("k", [0, 1, 5, 37, 200, 500])
+def test_top_k_indices_match_a_stable_sort(k):
+    # Few distinct scores, so most cutoffs fall inside a run of ties
+    scores = np.random.default_rng(0).integers(0, 6, 200).astype(np.float64)
+    assert np.array_equal(top_k_indices(scores, k), stable_top(scores, k))
+
+
+@pytest.mark.parametrize("top_n", [1, 3, 12])
+def test_top_n_indices_match_a_stable_sort_per_row(top_n):
+    neg_rules = import_script(ADD_DIR, "generate_neg_rules")
+    matrix = np.random.default_rng(1).integers(0, 4, (23, 12)).astype(np.float64)
+    expected = np.stack([stable_top(row, top_n) for row in matrix])
+    assert np.array_equal(neg_rules.top_n_indices(matrix, top_n, block_size=5), expected)
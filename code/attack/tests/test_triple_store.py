@@ -0,0 +1,98 @@
+import numpy as np
+
+from attack.tests.test_plan import NUM_ENTITIES, NUM_RELATIONS, make_store
+from attack.triple_store import TripleStore
+
+ALL_FILE = [
+    ("a", "r0", "b"),
+    ("b", "inv_r0", "a"),
+    ("c", "inv_r1", "a"),
+    ("a", "r0", "b"),
+    ("b", "r1", "c"),
+    ("c", "inv_r1", "b"),
+    ("d", "r0", "a"),
+]
+
+
+def test_load_split_keeps_forward_rows_and_drops_mirrored_inverse_rows(tmp_path):
+    path = tmp_path / "train_all.txt"
+    path.write_text("".join("\t".join(triple) + "\n" for triple in ALL_FILE))
+    store = TripleStore()
+    store.load_split("train", str(path))
+
+    # The repeated forward row is kept; "inv_r1" rows without a forward copy become "r1" rows
+    expected = sorted([("a", "r0", "b"), ("a", "r0", "b"), ("d", "r0", "a"), ("a", "r1", "c"), ("b", "r1", "c")],
+                      key=lambda triple: (triple[1], triple[0], triple[2]))
+    assert [tuple(line.split("\t")) for line in store.decode(store.triples["train"])] == expected
+    # Every row maps back to the line it was read from
+    lines = [ALL_FILE[line] for line in store.order["train"]]
+    assert [tuple(line.split("\t")) for line in store.decode(store.triples["train"])] == [
+        (tail, relation[4:], head) if relation.startswith("inv_") else (head, relation, tail)
+        for head, relation, tail in lines]
+
+
+def test_contains_and_find_match_a_set_of_triples():
+    store = make_store()
+    other = make_store(seed=1, num_triples=50).triples["train"]
+    store.add_split("valid", other)
+    known = {split: set(map(tuple, store.triples[split].tolist())) for split in ("train", "valid")}
+
+    rng = np.random.default_rng(2)
+    queries = np.concatenate([store.triples["train"][::3], other[::2],
+                              np.stack([rng.integers(0, NUM_ENTITIES, 200), rng.integers(0, NUM_RELATIONS, 200),
+                                        rng.integers(0, NUM_ENTITIES, 200)], axis=1)]).astype(np.int32)
+    for relation in range(NUM_RELATIONS):
+        rows = queries[queries[:, 1] == relation]
+        for splits in (None, ["train"], ["valid"]):
+            expected = [any((head, relation, tail) in known[split] for split in splits or ("train", "valid"))
+                        for head, _, tail in rows.tolist()]
+            assert store.contains(rows[:, 0], relation, rows[:, 2], splits=splits).tolist() == expected
+            # The inverse relation answers for the swapped triple
+            assert store.contains(rows[:, 2], f"inv_r{relation}", rows[:, 0], splits=splits).tolist() == expected
+    assert not store.contains(queries[:, 0], "unknown", queries[:, 2]).any()
+
+    positions = store.find("train", queries)
+    for triple, position in zip(queries.tolist(), positions.tolist()):
+        if tuple(triple) in known["train"]:
+            assert store.triples["train"][position].tolist() == triple
+        else:
+            assert position == -1
+
+
+def test_inverse_relations_are_swapped_views_sorted_by_head():
+    store = make_store()
+    for relation in range(NUM_RELATIONS):
+        heads, tails = store.pairs("train", relation)
+        inverse_heads, inverse_tails = store.pairs("train", f"inv_r{relation}")
+        expected = sorted(zip(tails.tolist(), heads.tolist()))
+        assert list(zip(inverse_heads.tolist(), inverse_tails.tolist())) == expected
+        rows = store.relation_slice("train", f"inv_r{relation}")
+        assert np.array_equal(rows[:, [0, 2]], np.array(expected).reshape(-1, 2))
+        assert (rows[:, 1] == store.relations.get(f"inv_r{relation}")).all()
+    assert store.resolve("inv_r1") == (store.relations.get("r1"), True)
+
+
+def test_saved_store_loads_the_same_rows(tmp_path):
+    store = make_store()
+    store.add_split("valid", make_store(seed=1, num_triples=50).triples["train"])
+    store.save(str(tmp_path))
+    loaded = TripleStore.load(str(tmp_path))
+    assert loaded.entities.names == store.entities.names and loaded.relations.names == store.relations.names
+    for split in ("train", "valid"):
+        for name in ("triples", "offsets", "order", "inverse_order"):
+            assert np.array_equal(getattr(loaded, name)[split], getattr(store, name)[split])
+    keys = loaded.pack(loaded.triples["train"])
+    assert np.array_equal(loaded.unpack(keys), store.triples["train"])
+    # Repeated rows are found at their first copy
+    positions = loaded.find("valid", store.triples["valid"])
+    assert np.array_equal(loaded.triples["valid"][positions], store.triples["valid"])
+    assert (positions <= np.arange(len(positions))).all()
+
+
+def test_to_file_order_undoes_the_sort():
+    rng = np.random.default_rng(3)
+    lines = np.stack([rng.integers(0, NUM_ENTITIES, 100), rng.integers(0, NUM_RELATIONS, 100),
+                      rng.integers(0, NUM_ENTITIES, 100)], axis=1)
+    store = make_store()
+    store.add_split("original", lines)
+    assert np.array_equal(store.to_file_order("original", store.triples["original"]), lines)
@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def top_k_indices(scores, k):
+    """
+    Find the indices of the k highest scores in O(n + k log k).
+
+    Ties are broken by position, lower indices first, which matches a stable
+    descending sort of the scores.
+
+    Args:
+        scores (np.ndarray): 1-D array of scores.
+        k (int): Number of indices to return.
+
+    Returns:
+        np.ndarray: Indices of the top k scores, highest score first.
+    """
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # The k-th highest score; everything above it is in, ties at it are taken by position
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    above = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate((above, tied))
+    order = np.lexsort((selected, -scores[selected]))
+    return selected[order]
@@ -0,0 +1,485 @@
+import os
+
+import numpy as np
+
+from .instrument import count, stage
+
+
+class Vocabulary:
+    """
+    Bidirectional mapping between entity or relation names and dense integer IDs.
+    """
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.ids = {name: index for index, name in enumerate(self.names)}
+        self._decoder = None
+
+    @classmethod
+    def from_dict_file(cls, file_path):
+        """
+        Load a vocabulary from an `entities.dict` / `relations.dict` style file.
+
+        Args:
+            file_path (str): Path to a file with one "id<TAB>name" pair per line.
+
+        Returns:
+            Vocabulary: The vocabulary, with IDs taken from the file.
+        """
+        pairs = []
+        with open(file_path, 'r', encoding="utf-8") as file:
+            for line in file:
+                index, name = line.rstrip('\n').split('\t')
+                pairs.append((int(index), name))
+        pairs.sort()
+        if [index for index, _ in pairs] != list(range(len(pairs))):
+            raise ValueError(f"IDs in {file_path} are not dense")
+        return cls(name for _, name in pairs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name):
+        """
+        Look up the ID of a name without adding it.
+
+        Returns:
+            int or None: The ID, or None if the name is unknown.
+        """
+        return self.ids.get(name)
+
+    def add(self, name):
+        """
+        Look up the ID of a name, assigning the next free ID if it is new.
+
+        Returns:
+            int: The ID of the name.
+        """
+        index = self.ids.get(name)
+        if index is None:
+            index = len(self.names)
+            self.ids[name] = index
+            self.names.append(name)
+        return index
+
+    def encode(self, names):
+        """
+        Encode a sequence of names, adding unknown ones.
+
+        Args:
+            names (list): Names to encode.
+
+        Returns:
+            np.ndarray: int32 array of IDs.
+        """
+        ids = self.ids
+        try:
+            return np.fromiter((ids[name] for name in names), dtype=np.int32, count=len(names))
+        except KeyError:
+            return np.fromiter((self.add(name) for name in names), dtype=np.int32, count=len(names))
+
+    def decode(self, ids):
+        """
+        Decode an array of IDs back to names.
+
+        Args:
+            ids (np.ndarray): Array of IDs.
+
+        Returns:
+            np.ndarray: Object array of names.
+        """
+        if self._decoder is None or len(self._decoder) != len(self.names):
+            self._decoder = np.asarray(self.names, dtype=object)
+        return self._decoder[ids]
+
+
+class TripleStore:
+    """
+    Integer-encoded triples of one or more dataset splits.
+
+    Every split is an (n, 3) int32 array of (head, relation, tail) rows sorted by
+    relation, head and tail, with CSR-style offsets so that the rows of relation r
+    are triples[offsets[r]:offsets[r + 1]]. order maps every sorted row back to
+    its line in the source file. Entities and relations share one vocabulary
+    each across splits, so IDs are comparable between splits.
+
+    Only forward relations are stored. An inverse relation "inv_r" has its own
+    ID but is a view over the rows of r with head and tail swapped, read
+    through inverse_order, the permutation sorting each split by relation, tail
+    and head.
+    """
+
+    def __init__(self, entities=None, relations=None):
+        self.entities = entities if entities is not None else Vocabulary()
+        self.relations = relations if relations is not None else Vocabulary()
+        self.triples = {}
+        self.offsets = {}
+        self.order = {}
+        self.inverse_order = {}
+        self._keys = {}
+
+    @classmethod
+    def from_dict_files(cls, entities_path, relations_path):
+        """
+        Create an empty store whose vocabularies are seeded from dict files where present.
+
+        Args:
+            entities_path (str): Path to `entities.dict`.
+            relations_path (str): Path to `relations.dict`.
+
+        Returns:
+            TripleStore: The empty store.
+        """
+        entities = Vocabulary.from_dict_file(entities_path) if os.path.exists(entities_path) else None
+        relations = Vocabulary.from_dict_file(relations_path) if os.path.exists(relations_path) else None
+        return cls(entities, relations)
+
+    def save(self, directory):
+        """
+        Write the store to a directory as .npy arrays and vocabulary files.
+
+        Args:
+            directory (str): Directory to write to, created if missing.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, vocabulary in (("entities", self.entities), ("relations", self.relations)):
+            with open(os.path.join(directory, f"{name}.txt"), 'w', encoding="utf-8") as file:
+                file.write("".join(f"{item}\n" for item in vocabulary.names))
+        for split in self.triples:
+            np.save(os.path.join(directory, f"{split}.triples.npy"), self.triples[split])
+            np.save(os.path.join(directory, f"{split}.offsets.npy"), self.offsets[split])
+            np.save(os.path.join(directory, f"{split}.order.npy"), self.order[split])
+            np.save(os.path.join(directory, f"{split}.inverse_order.npy"), self.inverse_order[split])
+            np.save(os.path.join(directory, f"{split}.keys.npy"), self._split_keys(split))
+        with open(os.path.join(directory, "splits.txt"), 'w', encoding="utf-8") as file:
+            file.write("".join(f"{split}\n" for split in self.triples))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Load a store written by save, memory-mapping its arrays.
+
+        Args:
+            directory (str): Directory the store was saved to.
+            mmap_mode (str or None): Memory-map mode passed to np.load, None to read into memory.
+
+        Returns:
+            TripleStore: The loaded store.
+        """
+        vocabularies = []
+        for name in ("entities", "relations"):
+            with open(os.path.join(directory, f"{name}.txt"), 'r', encoding="utf-8") as file:
+                vocabularies.append(Vocabulary(file.read().split('\n')[:-1]))
+        store = cls(*vocabularies)
+        with open(os.path.join(directory, "splits.txt"), 'r', encoding="utf-8") as file:
+            splits = file.read().split()
+        for split in splits:
+            store.triples[split] = np.load(os.path.join(directory, f"{split}.triples.npy"), mmap_mode=mmap_mode)
+            store.offsets[split] = np.load(os.path.join(directory, f"{split}.offsets.npy"), mmap_mode=mmap_mode)
+            store.order[split] = np.load(os.path.join(directory, f"{split}.order.npy"), mmap_mode=mmap_mode)
+            store.inverse_order[split] = np.load(os.path.join(directory, f"{split}.inverse_order.npy"),
+                                                 mmap_mode=mmap_mode)
+            keys = np.load(os.path.join(directory, f"{split}.keys.npy"), mmap_mode=mmap_mode)
+            store._keys[split] = (len(store.entities), keys)
+        return store
+
+    def load_split(self, split, file_path):
+        """
+        Parse a tab-separated triples file and add it as a split.
+
+        Args:
+            split (str): Name of the split, e.g. "train", "valid" or "test".
+            file_path (str): Path to the triples file.
+        """
+        with stage("parse"):
+            with open(file_path, 'r', encoding="utf-8") as file:
+                fields = file.read().replace('\n', '\t').split('\t')
+            if fields and fields[-1] == '':
+                fields.pop()
+            if len(fields) % 3:
+                raise ValueError(f"{file_path} is not a file of tab-separated triples")
+
+            triples = np.empty((len(fields) // 3, 3), dtype=np.int32)
+            triples[:, 0] = self.entities.encode(fields[0::3])
+            triples[:, 1] = self.relations.encode(fields[1::3])
+            triples[:, 2] = self.entities.encode(fields[2::3])
+        count(f"{split} triples", len(triples))
+        with stage("index"):
+            self.add_split(split, triples)
+
+    def add_split(self, split, triples):
+        """
+        Add an (n, 3) array of encoded triples as a split, sorting it per relation.
+
+        "inv_r" rows are rewritten as "r" rows with head and tail swapped, and
+        dropped if that row is already in the split, as in the `_all` files that
+        list every triple in both directions.
+
+        Args:
+            split (str): Name of the split.
+            triples (np.ndarray): Encoded (head, relation, tail) rows.
+        """
+        triples = np.asarray(triples, dtype=np.int32).reshape(-1, 3)
+        rows = np.arange(len(triples))
+        _, inverse = canonical_relations(self.relations)
+        # Every forward relation gets an ID for its inverse, so "inv_r" can be queried like any relation
+        for name in list(self.relations.names):
+            if not name.startswith("inv_"):
+                self.relations.add("inv_" + name)
+
+        flip = inverse[triples[:, 1]]
+        if flip.any():
+            triples = normalize_inverse_triples(triples, self.relations)
+            keys = self.pack(triples)
+            # Keep the first copy of the flipped rows that are not already in the split
+            flipped = np.flatnonzero(flip & ~np.isin(keys, keys[~flip]))
+            _, first = np.unique(keys[flipped], return_index=True)
+            keep = ~flip
+            keep[flipped[first]] = True
+            count(f"{split} inverse triples dropped", len(triples) - int(keep.sum()))
+            triples, rows = triples[keep], rows[keep]
+
+        order = np.lexsort((triples[:, 2], triples[:, 0], triples[:, 1]))
+        self.triples[split] = triples[order]
+        self.order[split] = rows[order].astype(np.int32)
+        sorted_triples = self.triples[split]
+        self.inverse_order[split] = np.lexsort((sorted_triples[:, 0], sorted_triples[:, 2],
+                                                sorted_triples[:, 1])).astype(np.int32)
+        counts = np.bincount(sorted_triples[:, 1], minlength=len(self.relations))
+        self.offsets[split] = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._keys.pop(split, None)
+
+    def relation_slice(self, split, relation):
+        """
+        Get the rows of one relation in a split.
+
+        Args:
+            split (str): Name of the split.
+            relation (int or str): Relation ID or name.
+
+        Returns:
+            np.ndarray: (n, 3) rows sorted by head and tail; a view for forward relations,
+                and a swapped copy of the forward rows for inverse ones.
+        """
+        forward, inverse = self.resolve(relation)
+        offsets = self.offsets.get(split)
+        if forward is None or offsets is None or forward + 1 >= len(offsets):
+            return np.empty((0, 3), dtype=np.int32)
+        if not inverse:
+            return self.triples[split][offsets[forward]:offsets[forward + 1]]
+        heads, tails = self.pairs(split, relation)
+        rows = np.empty((len(heads), 3), dtype=np.int32)
+        rows[:, 0] = heads
+        rows[:, 1] = self._relation_id(relation)
+        rows[:, 2] = tails
+        return rows
+
+    def pairs(self, split, relation):
+        """
+        Get the (head, tail) pairs of one relation in a split, sorted by head.
+
+        Pairs of an inverse relation are the tail and head of its forward relation,
+        gathered in inverse_order.
+
+        Returns:
+            tuple: Head and tail int32 arrays.
+        """
+        relation, inverse = self.resolve(relation)
+        offsets = self.offsets.get(split)
+        if relation is None or offsets is None or relation + 1 >= len(offsets):
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty
+        start, end = offsets[relation], offsets[relation + 1]
+        rows = self.triples[split]
+        if not inverse:
+            return rows[start:end, 0], rows[start:end, 2]
+        positions = self.inverse_order[split][start:end]
+        return rows[positions, 2], rows[positions, 0]
+
+    def resolve(self, relation):
+        """
+        Map a relation ID or name to the forward relation it is stored under.
+
+        Returns:
+            tuple: The forward relation ID, None if it is unknown, and whether the relation is its inverse.
+        """
+        name = relation if isinstance(relation, str) else self.relations.names[int(relation)]
+        if name.startswith("inv_"):
+            return self.relations.get(name[4:]), True
+        return self.relations.get(name), False
+
+    def contains(self, heads, relation, tails, splits=None):
+        """
+        Vectorized membership test for triples sharing one relation.
+
+        Args:
+            heads (np.ndarray): Head entity IDs.
+            relation (int or str): Relation ID or name.
+            tails (np.ndarray): Tail entity IDs.
+            splits (iterable, optional): Splits to query, all splits if omitted.
+
+        Returns:
+            np.ndarray: Boolean array, True where the triple occurs in any queried split.
+        """
+        relation, inverse = self.resolve(relation)
+        if inverse:
+            heads, tails = tails, heads
+        heads = np.asarray(heads, dtype=np.int64)
+        found = np.zeros(len(heads), dtype=bool)
+        if relation is None or not len(heads):
+            return found
+
+        queries = (relation * len(self.entities) + heads) * len(self.entities) + np.asarray(tails, dtype=np.int64)
+        for split in (self.triples if splits is None else splits):
+            offsets = self.offsets.get(split)
+            if offsets is None or relation + 1 >= len(offsets):
+                continue
+            keys = self._split_keys(split)[offsets[relation]:offsets[relation + 1]]
+            if not len(keys):
+                continue
+            positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+            found |= keys[positions] == queries
+        return found
+
+    def find(self, split, triples):
+        """
+        Locate encoded triples among the sorted rows of a split.
+
+        Args:
+            split (str): Name of the split.
+            triples (np.ndarray): (n, 3) array of encoded triples.
+
+        Returns:
+            np.ndarray: Row index of each triple in the split, -1 where it does not occur.
+        """
+        keys = self._split_keys(split)
+        queries = self.pack(triples)
+        if not len(keys):
+            return np.full(len(queries), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        return np.where(keys[positions] == queries, positions, -1)
+
+    def to_file_order(self, split, values):
+        """
+        Reorder per-row values of a split from sorted row order to source file order.
+
+        Args:
+            split (str): Name of the split.
+            values (np.ndarray): One value per sorted row.
+
+        Returns:
+            np.ndarray: The values, one per line of the source file.
+        """
+        reordered = np.empty_like(values)
+        reordered[self.order[split]] = values
+        return reordered
+
+    def pack(self, triples):
+        """
+        Pack encoded triples into single int64 keys.
+
+        Keys order triples by relation, head and tail, and stay valid as long
+        as no entities are added to the store.
+
+        Args:
+            triples (np.ndarray): (n, 3) array of encoded triples.
+
+        Returns:
+            np.ndarray: int64 keys.
+        """
+        num_entities = len(self.entities)
+        if len(self.relations) * num_entities * num_entities >= 2 ** 63:
+            raise ValueError("Too many entities and relations to pack triples into int64 keys")
+        triples = np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+        return (triples[:, 1] * num_entities + triples[:, 0]) * num_entities + triples[:, 2]
+
+    def unpack(self, keys):
+        """
+        Unpack int64 keys created by pack.
+
+        Args:
+            keys (np.ndarray): int64 keys.
+
+        Returns:
+            np.ndarray: (n, 3) int32 array of encoded triples.
+        """
+        num_entities = len(self.entities)
+        keys = np.asarray(keys, dtype=np.int64)
+        triples = np.empty((len(keys), 3), dtype=np.int32)
+        triples[:, 1], rest = np.divmod(keys, num_entities * num_entities)
+        triples[:, 0], triples[:, 2] = np.divmod(rest, num_entities)
+        return triples
+
+    def decode(self, triples):
+        """
+        Decode encoded triples back to tab-separated strings.
+
+        Args:
+            triples (np.ndarray): (n, 3) array of encoded triples.
+
+        Returns:
+            list: "head<TAB>relation<TAB>tail" strings.
+        """
+        triples = np.asarray(triples).reshape(-1, 3)
+        heads = self.entities.decode(triples[:, 0])
+        relations = self.relations.decode(triples[:, 1])
+        tails = self.entities.decode(triples[:, 2])
+        return [f"{head}\t{relation}\t{tail}" for head, relation, tail in zip(heads, relations, tails)]
+
+    def _relation_id(self, relation):
+        if isinstance(relation, str):
+            return self.relations.get(relation)
+        return int(relation)
+
+    def _split_keys(self, split):
+        # Packed keys follow the row order, so they are sorted and can be binary-searched
+        cached = self._keys.get(split)
+        if cached is None or cached[0] != len(self.entities):
+            cached = (len(self.entities), self.pack(self.triples[split]))
+            self._keys[split] = cached
+        return cached[1]
+
+
+def canonical_relations(relations):
+    """
+    Map every relation ID to its forward relation, resolving the "inv_" prefix.
+
+    Args:
+        relations (Vocabulary): Relation vocabulary; forward relations missing from it are added.
+
+    Returns:
+        tuple: int32 array of forward relation IDs and a boolean array marking inverse relations.
+    """
+    names = list(relations.names)
+    forward = np.empty(len(names), dtype=np.int32)
+    inverse = np.zeros(len(names), dtype=bool)
+    for index, name in enumerate(names):
+        if name.startswith("inv_"):
+            forward[index] = relations.add(name[4:])
+            inverse[index] = True
+        else:
+            forward[index] = index
+    return forward, inverse
+
+
+def normalize_inverse_triples(triples, relations):
+    """
+    Rewrite "inv_r" triples as their forward "r" triple with head and tail swapped.
+
+    Args:
+        triples (np.ndarray): (n, 3) array of encoded triples.
+        relations (Vocabulary): Relation vocabulary of the triples.
+
+    Returns:
+        np.ndarray: (n, 3) array of forward triples.
+    """
+    triples = np.asarray(triples, dtype=np.int32).reshape(-1, 3)
+    if not len(triples):
+        return triples.copy()
+    forward, inverse = canonical_relations(relations)
+    flip = inverse[triples[:, 1]]
+    normalized = np.empty_like(triples)
+    normalized[:, 0] = np.where(flip, triples[:, 2], triples[:, 0])
+    normalized[:, 1] = forward[triples[:, 1]]
+    normalized[:, 2] = np.where(flip, triples[:, 0], triples[:, 2])
+    return normalized
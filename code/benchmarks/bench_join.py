@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ADD_ATTACK_DIR = os.path.join(CODE_DIR, "add_attack")
+sys.path.insert(0, CODE_DIR)
+sys.path.insert(0, ADD_ATTACK_DIR)
+from attack.join import ground_two_hop
+from attack.triple_store import TripleStore
+from config import TRAIN_FILE_PATH, OUTPUT_NEGATIVE_RULES_PATH
+
+
+def generate_head_tail_dicts(file_path):
+    """
+    Parse a triples file into the original head and tail dictionaries.
+
+    Args:
+        file_path (str): Path to the triples file.
+
+    Returns:
+        tuple: Two dictionaries mapping each predicate to its head and tail entities.
+    """
+    head_dict = {}
+    tail_dict = {}
+    with open(file_path, 'r') as file:
+        for line in file:
+            subject, predicate, obj = line.strip().split('\t')
+            head_dict.setdefault(predicate, []).append(subject)
+            tail_dict.setdefault(predicate, []).append(obj)
+    return head_dict, tail_dict
+
+
+def nested_loop_two_hop(first, second, head_dict, tail_dict):
+    """
+    Ground a two-predicate rule body with the original nested loop.
+
+    Args:
+        first (str): Predicate of the first body atom.
+        second (str): Predicate of the second body atom.
+        head_dict (dict): Dictionary of head entities for each predicate.
+        tail_dict (dict): Dictionary of tail entities for each predicate.
+
+    Returns:
+        list: (X, Y, Z) entity triples for each grounding of the body.
+    """
+    groundings = []
+    for j in range(len(tail_dict.get(first, []))):
+        tail1 = tail_dict[first][j]
+        for k in range(len(head_dict.get(second, []))):
+            if tail1 == head_dict[second][k]:
+                groundings.append((head_dict[first][j], tail1, tail_dict[second][k]))
+    return groundings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare nested-loop and indexed grounding of two-hop rules.")
+    parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    parser.add_argument("--train", type=str, default=None, help="Triples file, defaults to TRAIN_FILE_PATH.")
+    parser.add_argument("--rules", type=str, default=None, help="Rules file, defaults to OUTPUT_NEGATIVE_RULES_PATH.")
+    parser.add_argument("--max-rules", type=int, default=20, help="Number of two-hop rules to benchmark.")
+    parser.add_argument("--max-pairs", type=int, default=10 ** 8,
+                        help="Skip the nested loop for rules whose |r1|*|r2| exceeds this.")
+
+    args = parser.parse_args()
+    train_path = args.train or os.path.join(ADD_ATTACK_DIR, TRAIN_FILE_PATH.format(args.dataset, args.dataset))
+    rules_path = args.rules or os.path.join(ADD_ATTACK_DIR, OUTPUT_NEGATIVE_RULES_PATH.format(args.dataset, args.dataset))
+
+    head_dict, tail_dict = generate_head_tail_dicts(train_path)
+
+    start = time.perf_counter()
+    store = TripleStore()
+    store.load_split("train", train_path)
+    index_time = time.perf_counter() - start
+    print(f"Store build: {index_time:.3f}s")
+
+    with open(rules_path, "r") as json_file:
+        rules = [rule for rule in json.load(json_file) if len(rule.get("Rule Body", [])) == 2]
+
+    total_nested = 0.0
+    total_join = 0.0
+    print(f"{'rule body':<70} {'pairs':>14} {'groundings':>11} {'nested(s)':>10} {'join(s)':>9}")
+    for rule in rules[:args.max_rules]:
+        first, second = rule["Rule Body"]
+        pairs = len(tail_dict.get(first, [])) * len(head_dict.get(second, []))
+
+        start = time.perf_counter()
+        heads, middles, tails = ground_two_hop(store, first, second)
+        joined = list(zip(store.entities.decode(heads), store.entities.decode(middles), store.entities.decode(tails)))
+        join_time = time.perf_counter() - start
+        total_join += join_time
+
+        if pairs <= args.max_pairs:
+            start = time.perf_counter()
+            nested = nested_loop_two_hop(first, second, head_dict, tail_dict)
+            nested_time = time.perf_counter() - start
+            total_nested += nested_time
+            assert Counter(nested) == Counter(joined), f"Groundings differ for {first}, {second}"
+            nested_label = f"{nested_time:.3f}"
+        else:
+            nested_label = "skipped"
+
+        print(f"{first + ' , ' + second:<70.70} {pairs:>14} {len(joined):>11} {nested_label:>10} {join_time:>9.3f}")
+
+    print(f"Total nested loop: {total_nested:.3f}s, total join: {total_join:.3f}s (+{index_time:.3f}s store)")
+
+
+if __name__ == "__main__":
+    main()
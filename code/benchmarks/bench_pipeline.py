@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, CODE_DIR)
+from attack.instrument import peak_rss_mb
+from attack.pipeline import import_script
+from attack.stream import KeySet
+from attack.triple_store import TripleStore
+
+neg_rules = import_script("add_attack", "generate_neg_rules")
+neg_triples = import_script("add_attack", "generate_neg_triples")
+del_instances = import_script("del_attack", "generate_del_instances")
+del_triples = import_script("del_attack", "generate_del_triples")
+
+
+def make_graph(num_entities, num_relations, num_triples, skew, rng):
+    """
+    Generate a random knowledge graph whose entity degrees follow a power law.
+
+    Args:
+        num_entities (int): Number of entities.
+        num_relations (int): Number of relations.
+        num_triples (int): Number of triples to draw; duplicates are dropped.
+        skew (float): Exponent of the degree distribution, 0 for uniform degrees.
+        rng (np.random.Generator): Random number generator.
+
+    Returns:
+        np.ndarray: (n, 3) array of distinct (head, relation, tail) IDs.
+    """
+    weights = np.arange(1, num_entities + 1, dtype=np.float64) ** -skew
+    weights /= weights.sum()
+    # Shuffle so hubs are not always the lowest IDs
+    entity_ids = rng.permutation(num_entities)
+    triples = np.stack([
+        entity_ids[rng.choice(num_entities, num_triples, p=weights)],
+        rng.integers(0, num_relations, num_triples),
+        entity_ids[rng.choice(num_entities, num_triples, p=weights)],
+    ], axis=1)
+    triples = triples[triples[:, 0] != triples[:, 2]]
+    return np.unique(triples, axis=0).astype(np.int32)
+
+
+def make_rules(num_rules, relations, max_body, rng):
+    """
+    Generate random path rules over the forward and inverse relations.
+
+    Args:
+        num_rules (int): Number of rules to generate.
+        relations (list): Forward relation names.
+        max_body (int): Maximum number of body atoms.
+        rng (random.Random): Random number generator.
+
+    Returns:
+        list: Rules with "Rule Head", "Rule Body" and "conf" fields.
+    """
+    names = relations + ["inv_" + relation for relation in relations]
+    return [
+        {
+            "Rule Head": [rng.choice(names)],
+            "Rule Body": [rng.choice(names) for _ in range(rng.randint(1, max_body))],
+            "conf": round(rng.random(), 4),
+        }
+        for _ in range(num_rules)
+    ]
+
+
+def write_triples(path, lines):
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+def write_dataset(directory, entities, relations, splits):
+    """
+    Write a synthetic dataset in the layout of the real ones.
+
+    Every split is written once as is and once with the inverse of every triple
+    appended, like the files in `dataset/<dataset_name>_all`.
+
+    Returns:
+        dict: Paths of the written files.
+    """
+    paths = {
+        "entities": os.path.join(directory, "entities.dict"),
+        "relations": os.path.join(directory, "relations.dict"),
+    }
+    for path, names in ((paths["entities"], entities), (paths["relations"], relations)):
+        write_triples(path, (f"{i}\t{name}" for i, name in enumerate(names)))
+    for split, triples in splits.items():
+        lines = [f"{entities[h]}\t{relations[r]}\t{entities[t]}" for h, r, t in triples]
+        inverse = [f"{entities[t]}\tinv_{relations[r]}\t{entities[h]}" for h, r, t in triples]
+        paths[split] = os.path.join(directory, f"{split}.txt")
+        paths[split + "_all"] = os.path.join(directory, f"{split}_all.txt")
+        write_triples(paths[split], lines)
+        write_triples(paths[split + "_all"], lines + inverse)
+    return paths
+
+
+class Timer:
+    """
+    Wall time and peak memory of each benchmarked stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.stages[name] = {"seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+        return result
+
+    def count(self, name, **counts):
+        self.stages[name].update(counts)
+
+
+def run_once(args, paths, rules, low_conf_rules, indices, top_relations_dict):
+    """
+    Run every stage of both pipelines once on the synthetic dataset.
+
+    Returns:
+        dict: Per-stage seconds, peak RSS and output counts.
+    """
+    timer = Timer()
+
+    def load_store():
+        store = TripleStore.from_dict_files(paths["entities"], paths["relations"])
+        for split in ("train", "valid", "test"):
+            store.load_split(split, paths[split + "_all"])
+        store.load_split("original", paths["train"])
+        return store
+
+    store = timer.run("parse", load_store)
+    timer.count("parse", triples=sum(len(triples) for triples in store.triples.values()))
+
+    new_rules = timer.run("generate_new_rules", neg_rules.generate_new_rules, low_conf_rules, indices, top_relations_dict)
+    timer.count("generate_new_rules", rules=len(new_rules))
+    negative_rules = timer.run("filter_existing_rules", neg_rules.filter_existing_rules, new_rules, rules)
+    timer.count("filter_existing_rules", rules=len(negative_rules))
+
+    def add_candidates():
+        with KeySet() as key_set:
+            tp = neg_triples.generate_triples(negative_rules, store, args.workers, args.max_groundings)
+            return sum(len(keys) for keys, _, _ in neg_triples.process_triples(tp, negative_rules, store, key_set))
+
+    num_candidates = timer.run("generate_triples", add_candidates)
+    timer.count("generate_triples", candidates=num_candidates)
+
+    scores = np.zeros(len(store.triples["original"]), dtype=np.float64)
+
+    def del_instances_and_scores():
+        instances = del_instances.generate_instances(rules, store, args.workers, args.max_groundings)
+        instances = del_instances.accumulate_confidence(instances, store, scores)
+        return sum(len(groundings) for _, _, _, groundings in instances)
+
+    num_instances = timer.run("generate_instances", del_instances_and_scores)
+    timer.count("generate_instances", instances=num_instances)
+
+    scores_path = os.path.join(os.path.dirname(paths["train"]), "scores.npy")
+    np.save(scores_path, store.to_file_order("original", scores))
+    conf_count = del_triples.load_confidence_from_scores(scores_path, paths["train"])
+    limit = int(np.ceil(len(store.triples["original"]) * args.budget / 100))
+    remaining = timer.run("exclude_top_triples", del_triples.exclude_top_triples, paths["train"], conf_count, limit)
+    timer.count("exclude_top_triples", remaining=len(remaining))
+    return timer.stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the add and del pipelines on a synthetic knowledge graph.")
+    parser.add_argument("--entities", type=int, default=20000, help="Number of entities.")
+    parser.add_argument("--relations", type=int, default=50, help="Number of relations.")
+    parser.add_argument("--triples", type=int, default=100000, help="Number of training triples to draw.")
+    parser.add_argument("--skew", type=float, default=0.8, help="Power-law exponent of entity degrees, 0 for uniform.")
+    parser.add_argument("--rules", type=int, default=500, help="Number of high- and low-confidence rules each.")
+    parser.add_argument("--max-body", type=int, default=2, help="Maximum number of atoms in a rule body.")
+    parser.add_argument("--budget", type=float, default=10, help="Percentage of training triples to delete.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to ground rules with.")
+    parser.add_argument("--max-groundings", type=int, default=None,
+                        help="Stop grounding a rule body after this many groundings.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs; the fastest time of each stage is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="JSON-lines file the results are appended to, one line per run.")
+
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    rule_rng = random.Random(args.seed)
+    entities = [f"e{i}" for i in range(args.entities)]
+    relations = [f"/r{i}" for i in range(args.relations)]
+
+    # 90% of the triples for training and 5% each for validation and testing
+    triples = rng.permutation(make_graph(args.entities, args.relations, args.triples, args.skew, rng))
+    num_train = len(triples) * 9 // 10
+    num_valid = (len(triples) - num_train) // 2
+    splits = {
+        "train": triples[:num_train],
+        "valid": triples[num_train:num_train + num_valid],
+        "test": triples[num_train + num_valid:],
+    }
+
+    rules = make_rules(args.rules, relations, args.max_body, rule_rng)
+    low_conf_rules = make_rules(args.rules, relations, args.max_body, rule_rng)
+    indices = [str(rule_rng.randrange(len(rule["Rule Body"]))) for rule in low_conf_rules]
+    names = relations + ["inv_" + relation for relation in relations]
+    top_relations_dict = {name: [rule_rng.choice(names)] for name in names}
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_dataset(directory, entities, relations, splits)
+        runs = [run_once(args, paths, rules, low_conf_rules, indices, top_relations_dict) for _ in range(args.repeat)]
+
+    stages = {name: min((run[name] for run in runs), key=lambda stage: stage["seconds"]) for name in runs[0]}
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": vars(args),
+        "train_triples": int(num_train),
+        "stages": stages,
+    }
+
+    for name, stage in stages.items():
+        counts = ", ".join(f"{key}={value}" for key, value in stage.items() if key not in ("seconds", "peak_rss_mb"))
+        print(f"{name:<24} {stage['seconds']:>9.3f}s  {counts}")
+
+    if args.output:
+        # Keep one result per line, so runs can be appended and compared over time
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+    else:
+        print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(CODE_DIR, "add_attack"))
+from generate_neg_rules import generate_new_rules, filter_existing_rules
+
+
+def make_rules(num_rules, relations, rng):
+    """
+    Generate random AnyBURL-style path rules.
+
+    Args:
+        num_rules (int): Number of rules to generate.
+        relations (list): Relation names to draw from.
+        rng (random.Random): Random number generator.
+
+    Returns:
+        list: Rules with "Rule Head", "Rule Body" and "conf" fields.
+    """
+    return [
+        {
+            "Rule Head": [rng.choice(relations)],
+            "Rule Body": [rng.choice(relations) for _ in range(rng.choice((1, 2, 2, 3)))],
+            "conf": round(rng.random(), 4),
+        }
+        for _ in range(num_rules)
+    ]
+
+
+def nested_generate_new_rules(json_data, indices, top_relations_dict):
+    """
+    Generate new rules with the original deep copies.
+    """
+    new_rules = []
+    for rule, index in zip(json_data, indices):
+        index = int(index)
+        selected_relation = rule["Rule Body"][index]
+        for replacement in top_relations_dict.get(selected_relation, []):
+            new_rule = copy.deepcopy(rule)
+            new_rule["Rule Body"][index] = replacement
+            new_rules.append(new_rule)
+    return new_rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list-scan and hashed filtering of generated rules.")
+    parser.add_argument("--rules", type=int, default=300000, help="Number of low- and high-confidence rules each.")
+    parser.add_argument("--relations", type=int, default=474, help="Number of relations.")
+    parser.add_argument("--baseline-rules", type=int, default=200,
+                        help="Number of new rules the list-scan filter is timed on; its total is extrapolated.")
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    relations = [f"/relation/{i}" for i in range(args.relations)]
+    low_conf_rules = make_rules(args.rules, relations, rng)
+    high_conf_rules = make_rules(args.rules, relations, rng)
+    indices = [rng.randrange(len(rule["Rule Body"])) for rule in low_conf_rules]
+    top_relations_dict = {relation: [rng.choice(relations)] for relation in relations}
+
+    start = time.perf_counter()
+    old_new_rules = nested_generate_new_rules(low_conf_rules, indices, top_relations_dict)
+    deepcopy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_rules = generate_new_rules(low_conf_rules, indices, top_relations_dict)
+    generate_time = time.perf_counter() - start
+    assert new_rules == old_new_rules
+
+    sample = new_rules[:args.baseline_rules]
+    start = time.perf_counter()
+    scanned = [rule for rule in sample if rule not in high_conf_rules]
+    scan_time = (time.perf_counter() - start) * len(new_rules) / max(len(sample), 1)
+
+    start = time.perf_counter()
+    filtered = filter_existing_rules(new_rules, high_conf_rules)
+    hashed_time = time.perf_counter() - start
+    hashed_sample = filter_existing_rules(sample, high_conf_rules)
+    assert hashed_sample == scanned
+
+    print(f"{len(low_conf_rules)} low / {len(high_conf_rules)} high confidence rules, {len(new_rules)} new rules")
+    print(f"generate_new_rules: deepcopy {deepcopy_time:.3f}s, shallow copy {generate_time:.3f}s")
+    print(f"filter_existing_rules: list scan ~{scan_time:.1f}s (extrapolated from {len(sample)} rules), "
+          f"hashed {hashed_time:.3f}s, {len(filtered)} rules kept")
+
+
+if __name__ == "__main__":
+    main()
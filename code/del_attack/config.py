@@ -3,9 +3,25 @@
 # Input file paths
 TRAIN_ALL_FILE_PATH = '../../dataset/{}_all/{}_all.txt'
 RULES_JSON_FILE_PATH = '../../data_processed/{}_del_10/{}_high_conf_rules.json'
+ENTITIES_DICT_PATH = '../../dataset/{}/entities.dict'
+RELATIONS_DICT_PATH = '../../dataset/{}/relations.dict'
 
 # Output file paths
 OUTPUT_INSTANCES_FILE_PATH = '../../data_processed/{}_del_10/{}_generated_del_instances.txt'
+OUTPUT_INSTANCES_JSONL_FILE_PATH = '../../data_processed/{}_del_10/{}_generated_del_instances.jsonl'
+OUTPUT_SCORES_FILE_PATH = '../../data_processed/{}_del_10/{}_del_triple_scores.npy'
+
+# Snapshot of the parsed triple store, rebuilt when the input files change
+STORE_CACHE_PATH = '../../data_processed/{}_del_10/{}_store_cache'
+
+# Per-rule groundings kept by --incremental, keyed by rule hash and relation digests
+GROUNDING_CACHE_PATH = '../../data_processed/{}_del_10/{}_groundings'
+
+# Timings, counters and peak memory of each script run
+RUN_REPORT_PATH = '../../data_processed/{}_del_10/{}_{}_report.json'
+
+# Stages run by `python -m attack run`, used to skip the unchanged ones
+PIPELINE_MANIFEST_PATH = '../../data_processed/{}_del_10/{}_pipeline_manifest.json'
 
 # generate delete triples
 # Input file paths
@@ -14,6 +30,10 @@ TRAIN_FILE_PATH = '../../dataset/{}/train.txt'
 # Output file paths
 OUTPUT_TRAIN_FILE_PATH = '../../data_processed/{}_del_10/train.txt'
 
+# Output of --budgets, per budget in percent of the training triples
+BUDGET_TRAIN_FILE_PATH = '../../data_processed/{}_del_{}/train.txt'
+
 # Other parameters
 SORT_LIMIT = 8684  # Number of top triples to sort and exclude (10% deletions)   wn18rr:8684 / fb15k237:27212
+SCORE_DECIMALS = 9  # Scores are ranked rounded to this many decimals, so summation order cannot break ties
 
@@ -1,157 +1,345 @@
 import json
+import os
+import sys
 import argparse
+import time
+from functools import partial
+import numpy as np
 from config import (
     TRAIN_ALL_FILE_PATH,
     RULES_JSON_FILE_PATH,
-    OUTPUT_INSTANCES_FILE_PATH
+    ENTITIES_DICT_PATH,
+    RELATIONS_DICT_PATH,
+    TRAIN_FILE_PATH,
+    OUTPUT_INSTANCES_FILE_PATH,
+    OUTPUT_INSTANCES_JSONL_FILE_PATH,
+    OUTPUT_SCORES_FILE_PATH,
+    STORE_CACHE_PATH,
+    GROUNDING_CACHE_PATH,
+    RUN_REPORT_PATH
 )
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from attack.cache import load_cached_store
+from attack.columnar import FORMATS, INSTANCE_COLUMNS, ColumnarWriter, columnar_path
+from attack.incremental import GroundingCache, grounding_params, rule_key
+from attack.influence import score_rules
+from attack.instrument import Progress, RuleLog, call_timed, count, counter, merge, stage, staged, write_report
+from attack.parallel import map_rules
+from attack.plan import FanoutCap, JoinPlan, SubpathCache
 
-def generate_predicate_dict(file_path):
+
+def load_triple_store(dataset, use_cache=True):
     """
-    Generate a dictionary of predicates mapping to their subject-object pairs.
+    Load the training triples into an integer-encoded store.
 
     Args:
-        file_path (str): Path to the triples file.
+        dataset (str): Name of the dataset.
+        use_cache (bool): Whether to load from and refresh the on-disk store snapshot.
 
     Returns:
-        dict: A dictionary where keys are predicates and values are lists of [subject, object] pairs.
+        TripleStore: Store with a "train" split holding the triples with their inverses, and
+            an "original" split holding the training file the deletions are made from.
     """
-    predicate_dict = {}
-
-    with open(file_path, 'r') as file:
-        triples = file.readlines()
+    split_paths = {
+        "train": TRAIN_ALL_FILE_PATH.format(dataset, dataset),
+        "original": TRAIN_FILE_PATH.format(dataset),
+    }
+    cache_dir = STORE_CACHE_PATH.format(dataset, dataset) if use_cache else None
+    return load_cached_store(cache_dir, split_paths, ENTITIES_DICT_PATH.format(dataset),
+                             RELATIONS_DICT_PATH.format(dataset))
 
-    for triple in triples:
-        subject, predicate, obj = triple.strip().split('\t')
-
-        if predicate in predicate_dict:
-            predicate_dict[predicate].append([subject, obj])
-        else:
-            predicate_dict[predicate] = [[subject, obj]]
 
-    return predicate_dict
-
-
-def generate_head_and_tail_dicts(predicate_dict):
+def ground_rule(example, store, max_groundings=None, subpath_cache=None, fanout_cap=None):
     """
-    Generate head and tail dictionaries from the predicate dictionary.
+    Generate the instances of a single rule.
 
     Args:
-        predicate_dict (dict): A dictionary where keys are predicates, and values are [subject, object] pairs.
+        example (dict): Rule loaded from the JSON file.
+        store (TripleStore): Store with the training split the rule is grounded in.
+        max_groundings (int, optional): Stop grounding the rule body after this many groundings.
+        subpath_cache (SubpathCache, optional): Cache of sub-path groundings shared across rules.
+        fanout_cap (FanoutCap, optional): Limit on the groundings through one join entity.
 
     Returns:
-        tuple: Two dictionaries - head_dict and tail_dict.
+        tuple or None: (confidence, rule head, rule body, groundings), where groundings is an
+            (n, k + 1) array of the encoded X0..Xk entities along the body path of each
+            instance, or None if the rule has none.
     """
-    head_dict = {}
-    tail_dict = {}
-
-    for predicate, entities in predicate_dict.items():
-        head_entities = []
-        tail_entities = []
-        for entity_pair in entities:
-            if len(entity_pair) == 2:
-                head_entities.append(entity_pair[0])
-                tail_entities.append(entity_pair[1])
-
-        head_dict[predicate] = head_entities
-        tail_dict[predicate] = tail_entities
-
-    return head_dict, tail_dict
-
-
-def generate_instances(rules, predicate_dict, head_dict, tail_dict):
+    rule_body = example.get("Rule Body", [])  # List of predicates in the rule body
+    rule_head = example.get("Rule Head", [])[0]  # Rule head predicate
+
+    # Only process rules whose body is a path of two or more predicates
+    if len(rule_body) < 2:
+        return None
+
+    # Match the tail of each predicate to the head of the next one, keeping
+    # the instances whose head triple exists in the training triples, one streamed block at a time
+    plan = JoinPlan(store, rule_body, cache=subpath_cache, fanout_cap=fanout_cap)
+    instances = []
+    for paths in staged("ground", plan.execute(max_groundings=max_groundings)):
+        with stage("filter"):
+            keep = store.contains(paths[:, 0], rule_head, paths[:, -1], splits=("train",))
+            instances.append(paths[keep])
+            count("groundings", len(paths))
+    if not instances or not any(len(paths) for paths in instances):
+        return None
+    instances = np.concatenate(instances)
+    count("instances", len(instances))
+    return str(example.get("conf", [])), rule_head, rule_body, instances
+
+
+def generate_instances(rules, store, workers=1, max_groundings=None, subpath_cache=None, rule_log=None,
+                       fanout_cap=None, grounding_cache=None):
     """
     Generate instances for the given rules.
 
     Args:
         rules (list): A list of rules loaded from the JSON file.
-        predicate_dict (dict): Predicate dictionary mapping predicates to subject-object pairs.
-        head_dict (dict): Head dictionary mapping predicates to their head entities.
-        tail_dict (dict): Tail dictionary mapping predicates to their tail entities.
+        store (TripleStore): Store with the training split the rules are grounded in.
+        workers (int): Number of worker processes the rules are spread across.
+        max_groundings (int, optional): Cap on the groundings of each rule body.
+        subpath_cache (SubpathCache, optional): Cache of sub-path groundings; every worker
+            process keeps its own copy.
+        rule_log (RuleLog, optional): Log the grounding time and instances of every rule is written to.
+        fanout_cap (FanoutCap, optional): Limit on the groundings through one join entity.
+        grounding_cache (GroundingCache, optional): Instances of previous runs; only rules
+            missing from it, or reading changed relations, are grounded again.
+
+    Yields:
+        tuple: One (confidence, rule head, rule body, groundings) entry per rule with instances, in rule order.
+    """
+    function = partial(call_timed, partial(ground_rule, max_groundings=max_groundings, subpath_cache=subpath_cache,
+                                           fanout_cap=fanout_cap))
+    params = grounding_params(max_groundings, fanout_cap)
+    keys = [rule_key(example, params) for example in rules]
+    reused = [grounding_cache is not None and key in grounding_cache for key in keys]
+    results = map_rules(function, [example for example, hit in zip(rules, reused) if not hit], store, workers)
+    progress = Progress(len(rules), "Processing rules")
+
+    for index, example in enumerate(rules):
+        if reused[index]:
+            # The confidence is taken from the current rule, so re-scored rules are not grounded again
+            groundings = grounding_cache.load(keys[index])
+            instance = None if not len(groundings) else (str(example.get("conf", [])), example.get("Rule Head", [])[0],
+                                                          example.get("Rule Body", []), groundings)
+        else:
+            instance, seconds, stages, counters = next(results)
+            merge(stages, counters)
+            if grounding_cache is not None:
+                body_length = len(example.get("Rule Body", []))
+                grounding_cache.put(keys[index], example,
+                                    np.empty((0, body_length + 1)) if instance is None else instance[3])
+            if rule_log is not None:
+                rule_log.write(index, example, seconds, instances=0 if instance is None else len(instance[3]),
+                               fanout_dropped=counters.get("fan-out dropped groundings", 0))
+        progress.update()
+        if instance is not None:
+            yield instance
+    progress.close()
+
+
+def accumulate_confidence(instances, store, scores):
+    """
+    Add the confidence of every instance to the scores of its body triples.
 
-    Returns:
-        list: A list of generated instances with confidence, head triples, and body triples.
+    Body triples are normalized to their forward relation and located in the
+    "original" split, so scores are indexed by that split's sorted rows.
+    Instances are passed through, so the accumulation happens while grounding.
+
+    Args:
+        instances (iterable): Generated instances.
+        store (TripleStore): Store whose vocabularies encode the instances.
+        scores (np.ndarray): Float array with one entry per row of the "original" split, updated in place.
+
+    Yields:
+        tuple: The instances, unchanged.
     """
-    generated_instances = []
-    rule_counter = 0
-
-    for example in rules:
-        rule_counter += 1
-        print(f"Processing rule: {rule_counter} / {len(rules)}")
-
-        rule_body = example.get("Rule Body", [])  # List of predicates in the rule body
-        rule_head = example.get("Rule Head", [])[0]  # Rule head predicate
-
-        # Only process rules with two predicates in the body
-        if len(rule_body) == 2:
-            if rule_body[0] in tail_dict:
-                for j in range(len(tail_dict[rule_body[0]])):
-                    tail1 = tail_dict[rule_body[0]][j]
-
-                    if rule_body[1] in head_dict:
-                        for k in range(len(head_dict[rule_body[1]])):
-                            head_entity = head_dict[rule_body[1]][k]
-
-                            if tail1 == head_entity:  # Match tail of first predicate to head of second predicate
-                                head1 = head_dict[rule_body[0]][j]
-                                tail_entity = tail_dict[rule_body[1]][k]
-
-                                # Check if the head triple exists in the predicate dictionary
-                                if rule_head in predicate_dict:
-                                    if [head1, tail_entity] in predicate_dict[rule_head]:
-                                        body_triple1 = f"{head1}\t{rule_body[0]}\t{tail1}"
-                                        body_triple2 = f"{head_entity}\t{rule_body[1]}\t{tail_entity}"
-                                        head_triple = f"{head1}\t{rule_head}\t{tail_entity}"
-                                        generated_instances.append([
-                                            str(example.get("conf", [])),
-                                            head_triple,
-                                            [body_triple1, body_triple2]
-                                        ])
-
-    return generated_instances
-
-
-def save_instances_to_file(instances, output_path):
+    for conf, rule_head, rule_body, groundings in instances:
+        with stage("score"):
+            # Atom i of the body links X_i to X_i+1
+            body_triples = np.empty((len(rule_body), len(groundings), 3), dtype=np.int32)
+            for i, relation in enumerate(rule_body):
+                # "inv_r" atoms are the forward "r" triple with head and tail swapped
+                forward, inverse = store.resolve(relation)
+                body_triples[i, :, 0] = groundings[:, i + 1] if inverse else groundings[:, i]
+                body_triples[i, :, 1] = forward
+                body_triples[i, :, 2] = groundings[:, i] if inverse else groundings[:, i + 1]
+            body_triples = body_triples.reshape(-1, 3)
+
+            rows = store.find("original", body_triples)
+            rows = rows[rows >= 0]
+            scores += np.bincount(rows, minlength=len(scores)) * float(conf)
+        yield conf, rule_head, rule_body, groundings
+
+
+def save_instances_to_file(instances, output_path, store, output_format="text", rules=None):
     """
     Save generated instances to a file.
 
     Args:
-        instances (list): A list of generated instances.
+        instances (iterable): Generated instances.
         output_path (str): Path to the output file.
+        store (TripleStore): Store whose entity vocabulary encodes the instances.
+        output_format (str): "text" for the original `conf<TAB>[body triples]` lines, "jsonl" for one
+            JSON object per instance, "arrow" or "parquet" for a columnar file with one row per
+            body atom (see attack.columnar.INSTANCE_COLUMNS), or "none" to only consume the instances.
+        rules (list, optional): The grounded rules, whose positions are the rule IDs of columnar
+            files; the rule ID is -1 if omitted.
+
+    Returns:
+        int: Number of instances.
     """
+    count = 0
+    if output_format == "none":
+        for _, _, _, groundings in instances:
+            count += len(groundings)
+        return count
+
+    if output_format in FORMATS:
+        rule_ids = {}
+        for index, rule in enumerate(rules or []):
+            rule_ids.setdefault((rule["Rule Head"][0], tuple(rule["Rule Body"])), index)
+        with ColumnarWriter(output_path, INSTANCE_COLUMNS, store, output_format) as writer:
+            for conf, rule_head, rule_body, groundings in instances:
+                with stage("write"):
+                    # Atom i of instance j is row j * k + i
+                    num_rows = len(groundings) * len(rule_body)
+                    writer.write(
+                        instance=np.repeat(np.arange(count, count + len(groundings)), len(rule_body)),
+                        rule=np.full(num_rows, rule_ids.get((rule_head, tuple(rule_body)), -1)),
+                        conf=np.full(num_rows, float(conf)),
+                        atom=np.tile(np.arange(len(rule_body)), len(groundings)),
+                        head_head=np.repeat(groundings[:, 0], len(rule_body)),
+                        head_relation=np.full(num_rows, store.relations.get(rule_head)),
+                        head_tail=np.repeat(groundings[:, -1], len(rule_body)),
+                        body_head=groundings[:, :-1].reshape(-1),
+                        body_relation=np.tile([store.relations.get(relation) for relation in rule_body], len(groundings)),
+                        body_tail=groundings[:, 1:].reshape(-1),
+                    )
+                count += len(groundings)
+        return count
+
     #body
     with open(output_path, 'w') as f:
-        for instance in instances:
-            f.write(instance[0] + '\t' + str(instance[2]) + '\n')
+        for conf, rule_head, rule_body, groundings in instances:
+            with stage("write"):
+                columns = [store.entities.decode(groundings[:, i]) for i in range(groundings.shape[1])]
+                for path in zip(*columns):
+                    body = [(path[i], relation, path[i + 1]) for i, relation in enumerate(rule_body)]
+                    if output_format == "jsonl":
+                        f.write(json.dumps({
+                            "conf": float(conf),
+                            "head": [path[0], rule_head, path[-1]],
+                            "body": [list(triple) for triple in body],
+                        }) + '\n')
+                    else:
+                        body_triples = ["\t".join(triple) for triple in body]
+                        f.write(conf + '\t' + str(body_triples) + '\n')
+            count += len(groundings)
     #head
     # with open(output_path, 'w') as f:
-    #     for instance in instances:
-    #         f.write(instance[0] + '\t' + str(instance[1]) + '\n')
+    #     for conf, rule_head, rule_body, groundings in instances:
+    #         for x, _, z in store.entities.decode(groundings):
+    #             f.write(conf + '\t' + f"{x}\t{rule_head}\t{z}" + '\n')
+    return count
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    parser.add_argument("--no-cache", action="store_true", help="Parse the dataset files instead of using the store snapshot.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to ground rules with.")
+    parser.add_argument("--fused", action="store_true",
+                        help="Sum confidences per training triple while grounding and save them as a score vector.")
+    parser.add_argument("--instances-format", type=str, default=None,
+                        choices=['text', 'jsonl', 'arrow', 'parquet', 'none'],
+                        help="Format of the instances file; defaults to text, or none with --fused. "
+                             "arrow and parquet require pyarrow.")
+    parser.add_argument("--max-groundings", type=int, default=None,
+                        help="Keep only the first groundings of each rule body, in sorted order; disables the sub-path cache.")
+    parser.add_argument("--subpath-cache-size", type=int, default=256,
+                        help="Memory in MB for groundings shared by rules with common body relations, 0 to disable.")
+    parser.add_argument("--rule-log", type=str, default=None,
+                        help="Path of a JSON-lines log with the grounding time and instances of every rule.")
+    parser.add_argument("--max-fanout", type=int, default=None,
+                        help="Cap the groundings through a single join entity, e.g. a hub in a two-hop body.")
+    parser.add_argument("--fanout-strategy", type=str, default="sample", choices=['sample', 'drop'],
+                        help="Sample the groundings through capped entities, or drop them.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the instances of rules whose body and head relations are unchanged since the last run.")
+    parser.add_argument("--engine", type=str, default="join", choices=['join', 'sparse'],
+                        help="Enumerate the instances by joins, or compute the scores of --fused directly with "
+                             "sparse matrix products, without instances; sparse requires scipy.")
 
     args = parser.parse_args()
-    # Step 1: Generate the predicate dictionary
-    predicate_dict = generate_predicate_dict(TRAIN_ALL_FILE_PATH.format(args.dataset, args.dataset))
-
-    # Step 2: Generate head and tail dictionaries
-    head_dict, tail_dict = generate_head_and_tail_dicts(predicate_dict)
-
-    # Step 3: Load rules from the JSON file
-    with open(RULES_JSON_FILE_PATH.format(args.dataset, args.dataset), "r") as json_file:
+    if args.engine == "sparse":
+        if args.instances_format not in (None, "none") or args.max_groundings or args.max_fanout or args.incremental:
+            parser.error("--engine sparse writes no instances and counts every grounding, so it cannot be combined "
+                         "with --instances-format, --max-groundings, --max-fanout or --incremental")
+        args.fused = True
+    start_time = time.perf_counter()
+    # Step 1: Load the training triples
+    store = load_triple_store(args.dataset, use_cache=not args.no_cache)
+
+    # Step 2: Load rules from the JSON file
+    with stage("parse"), open(RULES_JSON_FILE_PATH.format(args.dataset, args.dataset), "r") as json_file:
         rules = json.load(json_file)
-
-    # Step 4: Generate instances
-    generated_instances = generate_instances(rules, predicate_dict, head_dict, tail_dict)
-
-    print(f"The number of generated instances: {len(generated_instances)}")
-
-    # Step 5: Save the generated instances to the output file
-    save_instances_to_file(generated_instances, OUTPUT_INSTANCES_FILE_PATH.format(args.dataset, args.dataset))
+    count("rules", len(rules))
+
+    # Step 3: Score the training triples without instances
+    if args.engine == "sparse":
+        scores = np.zeros(len(store.triples["original"]), dtype=np.float64)
+        score_rules(rules, store, scores, args.workers)
+        print(f"The number of rule instances: {counter('instances')}")
+        with stage("write"):
+            np.save(OUTPUT_SCORES_FILE_PATH.format(args.dataset, args.dataset), store.to_file_order("original", scores))
+        report_path = RUN_REPORT_PATH.format(args.dataset, args.dataset, "generate_del_instances")
+        write_report(report_path, "generate_del_instances", args, start_time)
+        print(f"Run report saved to {report_path}")
+        return
+
+    # Step 3: Generate instances
+    subpath_cache = SubpathCache(args.subpath_cache_size * 2 ** 20) if args.subpath_cache_size > 0 else None
+    fanout_cap = FanoutCap(args.max_fanout, args.fanout_strategy) if args.max_fanout else None
+    rule_log = RuleLog(args.rule_log)
+    grounding_cache = (GroundingCache(GROUNDING_CACHE_PATH.format(args.dataset, args.dataset), store, ("train",))
+                       if args.incremental else None)
+    generated_instances = generate_instances(rules, store, args.workers, args.max_groundings, subpath_cache, rule_log,
+                                             fanout_cap, grounding_cache)
+    if args.fused:
+        scores = np.zeros(len(store.triples["original"]), dtype=np.float64)
+        generated_instances = accumulate_confidence(generated_instances, store, scores)
+
+    # Step 4: Save the generated instances to the output file
+    output_format = args.instances_format or ("none" if args.fused else "text")
+    output_path = (OUTPUT_INSTANCES_JSONL_FILE_PATH if output_format == "jsonl" else OUTPUT_INSTANCES_FILE_PATH)
+    output_path = output_path.format(args.dataset, args.dataset)
+    if output_format in FORMATS:
+        output_path = columnar_path(output_path, output_format)
+    num_instances = save_instances_to_file(generated_instances, output_path, store, output_format, rules)
+    rule_log.close()
+
+    if grounding_cache is not None:
+        grounding_cache.save()
+        print(f"Reused the instances of {counter('reused rules')} of {len(rules)} rules")
+    print(f"The number of generated instances: {num_instances}")
+    if subpath_cache is not None and args.max_groundings is not None:
+        print("Sub-path cache: disabled by --max-groundings")
+    elif subpath_cache is not None and args.workers <= 1:
+        print(subpath_cache.summary())
+    if fanout_cap is not None:
+        print(f"Fan-out cap: {counter('fan-out dropped groundings')} groundings dropped "
+              f"through {counter('fan-out capped entities')} capped join entities")
+
+    # Step 5: Save the confidence of every training triple, in training file order
+    if args.fused:
+        with stage("write"):
+            np.save(OUTPUT_SCORES_FILE_PATH.format(args.dataset, args.dataset), store.to_file_order("original", scores))
+
+    report_path = RUN_REPORT_PATH.format(args.dataset, args.dataset, "generate_del_instances")
+    write_report(report_path, "generate_del_instances", args, start_time)
+    print(f"Run report saved to {report_path}")
 
 
 if __name__ == "__main__":
@@ -1,12 +1,30 @@
 import json
+import os
+import sys
 import argparse
+import time
+import numpy as np
 from config import (
     OUTPUT_INSTANCES_FILE_PATH,
+    OUTPUT_INSTANCES_JSONL_FILE_PATH,
+    ENTITIES_DICT_PATH,
+    RELATIONS_DICT_PATH,
+    OUTPUT_SCORES_FILE_PATH,
     TRAIN_FILE_PATH,
     OUTPUT_TRAIN_FILE_PATH,
-    SORT_LIMIT
+    SORT_LIMIT,
+    SCORE_DECIMALS,
+    RUN_REPORT_PATH,
+    BUDGET_TRAIN_FILE_PATH
 )
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from attack.budget import budget_label, budget_size, count_lines
+from attack.columnar import columnar_path, read_table, write_triple_lines
+from attack.instrument import count, stage, write_report
+from attack.triple_store import TripleStore
+from attack.topk import top_k_indices
+
 
 def load_rules_with_confidence(file_path):
     """
@@ -53,6 +71,105 @@ def load_rules_with_confidence(file_path):
     return conf_count
 
 
+def load_jsonl_rules_with_confidence(file_path):
+    """
+    Load instances from a JSONL file and calculate cumulative confidence for each body triple.
+
+    Args:
+        file_path (str): Path to the JSONL instances file.
+
+    Returns:
+        dict: A dictionary where keys are triples and values are cumulative confidence scores.
+    """
+    conf_count = {}
+
+    with open(file_path, 'r') as input_file:
+        for line in input_file:
+            if not line.strip():
+                continue
+            instance = json.loads(line)
+            for subject, relation, obj in instance["body"]:
+                if relation.startswith("inv_"):
+                    # Remove "inv_" and swap subject and object
+                    subject, relation, obj = obj, relation[4:], subject
+                triple = f"{subject}\t{relation}\t{obj}"
+                conf_count[triple] = conf_count.get(triple, 0.0) + instance["conf"]
+
+    return conf_count
+
+
+def load_columnar_rules_with_confidence(file_path):
+    """
+    Load instances from an Arrow or Parquet file and calculate cumulative confidence for each body triple.
+
+    Args:
+        file_path (str): Path to the columnar instances file.
+
+    Returns:
+        dict: A dictionary where keys are triples and values are cumulative confidence scores.
+    """
+    conf_count = {}
+
+    table = read_table(file_path)
+    columns = [table.column(name) for name in ("body_head", "body_relation", "body_tail")]
+    confs = table.column("conf")
+    for chunks in zip(*(column.chunks for column in columns), confs.chunks):
+        *body, conf = chunks
+        if not len(conf):
+            continue
+        # Sum per distinct body triple before decoding, keeping the order triples were first seen in
+        ids = np.stack([chunk.indices.to_numpy(zero_copy_only=False) for chunk in body], axis=1)
+        unique, first, inverse = np.unique(ids, axis=0, return_index=True, return_inverse=True)
+        sums = np.bincount(inverse.reshape(-1), weights=conf.to_numpy(zero_copy_only=False))
+        order = np.argsort(first)
+        names = [chunk.dictionary.take(unique[order, i]).to_pylist() for i, chunk in enumerate(body)]
+        for subject, relation, obj, conf_sum in zip(*names, sums[order].tolist()):
+            if relation.startswith("inv_"):
+                # Remove "inv_" and swap subject and object
+                subject, relation, obj = obj, relation[4:], subject
+            triple = f"{subject}\t{relation}\t{obj}"
+            conf_count[triple] = conf_count.get(triple, 0.0) + conf_sum
+
+    return conf_count
+
+
+def load_confidence_from_scores(scores_path, train_file_path):
+    """
+    Load the per-triple confidence saved by generate_del_instances.py --fused.
+
+    Args:
+        scores_path (str): Path to the .npy score vector, aligned with the training file.
+        train_file_path (str): Path to the training file.
+
+    Returns:
+        dict: A dictionary of the training triples with a positive score and their scores, in file order.
+    """
+    return confidence_from_scores(np.load(scores_path, mmap_mode='r'), train_file_path)
+
+
+def confidence_from_scores(scores, train_file_path):
+    """
+    Map a per-triple score vector to the training triples it is aligned with.
+
+    Args:
+        scores (np.ndarray): One score per line of the training file.
+        train_file_path (str): Path to the training file.
+
+    Returns:
+        dict: A dictionary of the training triples with a positive score and their scores, in file order.
+    """
+    with open(train_file_path, 'r') as file:
+        lines = [line.strip() for line in file]
+    if len(lines) != len(scores):
+        raise ValueError(f"Got {len(scores)} scores for {len(lines)} training triples in {train_file_path}, "
+                         f"rerun generate_del_instances.py --fused")
+
+    conf_count = {}
+    for index in np.flatnonzero(scores > 0):
+        conf_count.setdefault(lines[index], float(scores[index]))
+    return conf_count
+
+
 def load_confidence_from_json(json_path):
     """
     Load confidence data from a JSON file.
@@ -71,21 +188,51 @@ def exclude_top_triples(train_file_path, conf_count, limit):
     """
     Exclude the top triples based on confidence scores from the training file.
 
+    The top triples are picked with a partial selection over an array of the
+    confidences; ties are broken in favour of the triple first in the training file.
+
     Args:
         train_file_path (str): Path to the training file.
         conf_count (dict): A dictionary of triples and their confidence scores.
         limit (int): Number of top triples to exclude.
 
     Returns:
-        set: A set of remaining lines after exclusion.
+        list: The remaining lines after exclusion, unique and in training file order.
+    """
+    return exclude_top_triples_per_budget(train_file_path, conf_count, [limit])[0]
+
+
+def exclude_top_triples_per_budget(train_file_path, conf_count, limits):
     """
-    sorted_lines = sorted(conf_count.items(), key=lambda x: x[1], reverse=True)
-    top_triples = {triple for triple, _ in sorted_lines[:limit]}
+    Exclude the top triples from the training file for several budgets at once.
 
+    The ranking is computed once for the largest budget; every smaller budget
+    excludes a prefix of it, so the excluded sets are nested. Only triples of the
+    training file are ranked, by their score rounded to SCORE_DECIMALS decimals and
+    then by their position in the file, so the instance files and the score vector
+    of --fused, which sum the same confidences in different orders, exclude the
+    same triples.
+
+    Args:
+        train_file_path (str): Path to the training file.
+        conf_count (dict): A dictionary of triples and their confidence scores.
+        limits (list): Number of top triples to exclude for each budget.
+
+    Returns:
+        list: The remaining lines for each budget, unique and in training file order.
+    """
     with open(train_file_path, 'r') as file:
-        remaining_lines = {line.strip() for line in file if line.strip() not in top_triples}
+        lines = list(dict.fromkeys(line.strip() for line in file))
+    scored = np.array([index for index, line in enumerate(lines) if line in conf_count], dtype=np.int64)
+    scores = np.round(np.array([conf_count[lines[index]] for index in scored], dtype=np.float64), SCORE_DECIMALS)
+    ranked = scored[top_k_indices(scores, max(limits))]
+
+    # Rank of every excluded triple, so each budget only has to compare ranks
+    line_ranks = np.full(len(lines), max(limits), dtype=np.int64)
+    line_ranks[ranked] = np.arange(len(ranked))
+    line_ranks = line_ranks.tolist()
 
-    return remaining_lines
+    return [[line for line, line_rank in zip(lines, line_ranks) if line_rank >= limit] for limit in limits]
 
 
 def save_remaining_lines(remaining_lines, output_path):
@@ -93,7 +240,7 @@ def save_remaining_lines(remaining_lines, output_path):
     Save the remaining lines to a file after excluding top triples.
 
     Args:
-        remaining_lines (set): A set of remaining lines.
+        remaining_lines (list): The remaining lines.
         output_path (str): Path to the output file.
     """
     with open(output_path, 'w') as output_file:
@@ -104,18 +251,58 @@ def save_remaining_lines(remaining_lines, output_path):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset", type=str, required=True, choices=['WN18RR', 'FB15k237'])
+    parser.add_argument("--fused", action="store_true",
+                        help="Read the score vector of generate_del_instances.py --fused instead of the instances file.")
+    parser.add_argument("--instances-format", type=str, default='text', choices=['text', 'jsonl', 'arrow', 'parquet'],
+                        help="Format of the instances file to read without --fused.")
+    parser.add_argument("--columnar-format", type=str, default=None, choices=['arrow', 'parquet'],
+                        help="Also write the reduced training sets in this columnar format; requires pyarrow.")
+    parser.add_argument("--budgets", type=float, nargs="+", default=None,
+                        help="Budgets in percent of the training triples, e.g. 5 10 20, each written to "
+                             "data_processed/<dataset>_del_<budget>; defaults to SORT_LIMIT triples.")
 
     args = parser.parse_args()
+    start_time = time.perf_counter()
     # Step 1: Load rules and compute cumulative confidence
-    conf_count = load_rules_with_confidence(OUTPUT_INSTANCES_FILE_PATH.format(args.dataset, args.dataset))
+    with stage("parse"):
+        if args.fused:
+            conf_count = load_confidence_from_scores(OUTPUT_SCORES_FILE_PATH.format(args.dataset, args.dataset),
+                                                     TRAIN_FILE_PATH.format(args.dataset))
+        elif args.instances_format in ('arrow', 'parquet'):
+            conf_count = load_columnar_rules_with_confidence(
+                columnar_path(OUTPUT_INSTANCES_FILE_PATH.format(args.dataset, args.dataset), args.instances_format))
+        elif args.instances_format == 'jsonl':
+            conf_count = load_jsonl_rules_with_confidence(OUTPUT_INSTANCES_JSONL_FILE_PATH.format(args.dataset, args.dataset))
+        else:
+            conf_count = load_rules_with_confidence(OUTPUT_INSTANCES_FILE_PATH.format(args.dataset, args.dataset))
+    count("scored triples", len(conf_count))
 
     # Step 3: Exclude top triples from the training file
-    remaining_lines = exclude_top_triples(TRAIN_FILE_PATH.format(args.dataset), conf_count, SORT_LIMIT)
+    train_file_path = TRAIN_FILE_PATH.format(args.dataset)
+    if args.budgets:
+        percents = sorted(set(args.budgets))
+        num_train = count_lines(train_file_path)
+        limits = [budget_size(percent, num_train) for percent in percents]
+        output_paths = [BUDGET_TRAIN_FILE_PATH.format(args.dataset, budget_label(percent)) for percent in percents]
+    else:
+        limits = [SORT_LIMIT]
+        output_paths = [OUTPUT_TRAIN_FILE_PATH.format(args.dataset)]
+    with stage("select"):
+        remaining_per_budget = exclude_top_triples_per_budget(train_file_path, conf_count, limits)
 
     # Step 4: Save remaining lines to the output file
-    save_remaining_lines(remaining_lines, OUTPUT_TRAIN_FILE_PATH.format(args.dataset))
-
-    print(f"Number of remaining triples: {len(remaining_lines)}")
+    store = (TripleStore.from_dict_files(ENTITIES_DICT_PATH.format(args.dataset), RELATIONS_DICT_PATH.format(args.dataset))
+             if args.columnar_format else None)
+    for remaining_lines, output_path in zip(remaining_per_budget, output_paths):
+        with stage("write"):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            save_remaining_lines(remaining_lines, output_path)
+            if store is not None:
+                write_triple_lines(columnar_path(output_path, args.columnar_format), store, remaining_lines,
+                                   args.columnar_format)
+        count("remaining triples", len(remaining_lines))
+        print(f"Number of remaining triples: {len(remaining_lines)} in {output_path}")
+    write_report(RUN_REPORT_PATH.format(args.dataset, args.dataset, "generate_del_triples"), "generate_del_triples", args, start_time)
 
 
 if __name__ == "__main__":
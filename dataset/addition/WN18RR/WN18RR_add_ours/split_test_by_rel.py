@@ -1,26 +1,12 @@
-relation_files = {
-    '_member_meronym': '_member_meronym.txt',
-    '_hypernym': '_hypernym.txt',
-    '_similar_to': '_similar_to.txt',
-    '_synset_domain_topic_of': '_synset_domain_topic_of.txt'
-}
-
-# 打开原始txt文件
-with open('test.txt', 'r') as file:
-    lines = file.readlines()
-
-# 遍历每一行，根据关系存储到对应的txt文件中
-for line in lines:
-    parts = line.split('\t')
-    if len(parts) == 3:
-        relation = parts[1]
-        if relation in relation_files:
-            with open(relation_files[relation], 'a') as relation_file:
-                relation_file.write(line)
-
-# 关闭文件
-for file_name in relation_files.values():
-    with open(file_name, 'a'):
-        pass  # 创建文件（如果不存在）
-
-print("行已根据关系存储到不同的txt文件中。")
+import os
+import sys
+
+# Split the test triples of this dataset into one file per relation, in test_by_relation next to test.txt.
+# Other splits and datasets: `python -m attack partition <files>` from the code directory.
+DATASET_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DATASET_DIR, "..", "..", "..", "..", "code"))
+from attack.partition import partition_by_relation
+
+OUTPUT_DIR = os.path.join(DATASET_DIR, 'test_by_relation')
+lines = partition_by_relation(os.path.join(DATASET_DIR, 'test.txt'), OUTPUT_DIR)
+print(f"Split {sum(lines.values())} triples of test.txt into {len(lines)} relation files in {OUTPUT_DIR}.")